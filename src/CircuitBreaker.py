@@ -0,0 +1,94 @@
+"""CircuitBreaker
+
+Stops calling a failing service for a while, then probes it
+
+closed: the calls are allowed. After failure_threshold consecutive failures
+    the breaker opens.
+open: the calls are not allowed, so nothing waits for the failing service.
+    After reset_timeout seconds the breaker becomes half-open.
+half_open: a single probe call is allowed. If it succeeds, the breaker closes,
+    if it fails, the breaker opens again for another reset_timeout.
+"""
+
+# Standard Library imports
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker():
+    """Thread-safe circuit breaker with half-open probing
+
+    Attributes:
+        name (str): the name of the guarded service, used in the logs
+        failure_threshold (int): the number of consecutive failures that open the breaker
+        reset_timeout (float): the time after which an open breaker allows a probe in seconds
+        state (str): "closed", "open" or "half_open"
+        failures (int): the number of consecutive failures
+        trips (int): how many times the breaker opened
+
+    Usage:
+        __init__:
+            breaker = CircuitBreaker("Orion", failure_threshold=3, reset_timeout=10)
+
+        allow():
+            return True if a call is allowed now
+
+        record_success(), record_failure():
+            report the result of an allowed call
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 10):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.name} circuit breaker closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+                self.trips += 1
+                logger.warning(f"{self.name} circuit breaker opened after {self.failures} failures")
+
+    def stats(self):
+        with self.lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips}
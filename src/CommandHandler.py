@@ -23,18 +23,29 @@ the Workstation's handle_good_cycle command will be called.
 """
 
 # Standard library imports
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import glob
 import json
 import os
+import time
 
 # PyPI imports
 
 # Custom imports
 from Logger import getLogger
-from JobHandler import JobHandler
+from JobHandler import fetch_jobHandlers
 from Storage import Storage
 from Workstation import Workstation
 from post_to_IoT_agent import post_to_IoT_agent
+from RequestTemplate import RequestTemplate
+import ErrorAggregator
+import EventTrace
+import Metrics
+import Orion
+import OrionObject
+import Outbox
+import RequestBatcher
 
 
 class CommandHandler():
@@ -43,13 +54,45 @@ class CommandHandler():
     if RPI_COMMANDS_CONFIG == None:
         logger.critical("Fatal: the RPI_COMMANDS_CONFIG environment variable is not set")
 
+    # the command types that set an absolute state and the attribute they set
+    # when such commands are queued, only the last one matters
+    STATE_ATTRIBUTES = {
+        "turn_on": "available",
+        "turn_off": "available",
+        "reset": "counter",
+        "set_empty": "counter",
+        "set_full": "counter",
+    }
+
+    # the methods of the Python objects called by the command types
+    STORAGE_METHODS = {
+        "step": "step",
+        "reset": "reset",
+        "set_empty": "set_empty",
+        "set_full": "set_full",
+    }
+    WORKSTATION_METHODS = {
+        "turn_on": "turn_on",
+        "turn_off": "turn_off",
+        "handle_good_cycle": "handle_good_cycle",
+        "handle_reject_cycle": "handle_reject_cycle",
+        "new_job": "reset_jobHandler",
+    }
+
+    # the internal commands of the Workstations' job changes are named <workstation id><suffix>
+    # they are submitted on the Orion notifications, not by the microcontroller
+    JOB_CHANGED_SUFFIX = "_job_changed"
+
     def __init__(self):
         self.commands = self.read_all_commands()
         self.logger.info("Successfully read commands")
-        self.logger.debug(f"commands: {self.commands}")
+        self.logger.debug("commands: %s", self.commands)
         self.objects = self.init_objects()
         self.logger.info("Successfully read objects")
-        self.logger.debug(f"objects:\n{self.objects}")
+        self.logger.debug("objects:\n%s", self.objects)
+        self.handlers, self.ordering_keys, self.coalesce_keys = self.compile_commands()
+        self.metric_labels = {command_id: self.make_metric_labels(command_id) for command_id in self.handlers}
+        self.logger.info("Successfully compiled commands")
 
     def read_json(self, file: str):
         with open(file, "r") as f:
@@ -61,26 +104,47 @@ class CommandHandler():
         return self.read_json(file)
 
     def init_objects(self):
+        """Read the objects' json files and create the Python objects
+
+        The existence of the objects in Orion and the JobHandlers' counters
+        are queried in bulk and concurrently, see Orion.confirm_known_entities
+        and JobHandler.fetch_jobHandlers.
+        """
         objects = {}
         files = glob.glob(os.path.join(self.RPI_COMMANDS_CONFIG, "json", "*.json"))
         for file in files:
-            self.logger.debug(f"file: {file}")
+            self.logger.debug("file: %s", file)
             object = self.read_json(file)
-            self.logger.debug(f"""file read: {file}
-    {object}""")
-            id = object["id"]
-            objects[id] = {}
-            objects[id]["orion"] = object
-            if "i40AssetType" not in object.keys():
-                continue
-            if object["i40AssetType"]["value"] == "Storage":
-                objects[id]["py"] = Storage(id, object["capacity"]["value"], object["step"]["value"], object["i40AssetSubType"]["value"])
-            if object["i40AssetType"]["value"] == "Workstation":
-                objects[id]["py"] = Workstation(id)
-            if object["i40AssetType"]["value"] == "Job":
-                objects[id]["py"] = JobHandler(object["refWorkstation"]["value"])
+            self.logger.debug("file read: %s\n    %s", file, object)
+            objects[object["id"]] = {"orion": object}
+        workstation_ids = [id for id, obj in objects.items() if self.asset_type(obj["orion"]) == "Workstation"]
+        # the JobHandlers of the Job objects are fetched in the same bulk queries
+        workstation_ids += [obj["orion"]["refWorkstation"]["value"] for obj in objects.values()
+                            if self.asset_type(obj["orion"]) == "Job"]
+        workstation_ids = list(dict.fromkeys(workstation_ids))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # existence is confirmed only once, the updates do not check it again
+            confirmed = executor.submit(Orion.confirm_known_entities, objects.keys())
+            fetched = executor.submit(fetch_jobHandlers, workstation_ids)
+            jobHandlers = fetched.result()
+            confirmed.result()
+        for id, obj in objects.items():
+            object = obj["orion"]
+            asset_type = self.asset_type(object)
+            if asset_type == "Storage":
+                obj["py"] = Storage(id, object["capacity"]["value"], object["step"]["value"], object["i40AssetSubType"]["value"])
+            if asset_type == "Workstation":
+                obj["py"] = Workstation(id, jobHandlers[id])
+            if asset_type == "Job":
+                # the Workstation's JobHandler if the Workstation is configured too
+                obj["py"] = jobHandlers[object["refWorkstation"]["value"]]
         return objects
 
+    def asset_type(self, object: dict):
+        if "i40AssetType" not in object.keys():
+            return None
+        return object["i40AssetType"]["value"]
+
     def is_num(self, x):
         try:
             float(x)
@@ -88,61 +152,198 @@ class CommandHandler():
         except:
             return False
 
-    def handle_command(self, command_id: str, arg=None):
-        self.arg = arg
-        if command_id not in self.commands:
+    def compile_commands(self):
+        """Validate every command against the objects and turn it into a ready-to-call handler
+
+        Returns the handlers, ordering keys and coalesce keys of the commands in dicts.
+        Each handler takes the command's argument.
+
+        Raises:
+            ValueError: if any command is invalid, all problems are listed
+        """
+        handlers = {}
+        ordering_keys = {}
+        coalesce_keys = {}
+        errors = []
+        for command_id, command in self.commands.items():
+            try:
+                if self.is_command_special(command):
+                    handlers[command_id] = self.compile_special_command(command_id, command)
+                    ordering_keys[command_id] = self.special_ordering_key(command)
+                else:
+                    handlers[command_id] = self.compile_non_special_command(command)
+                    ordering_keys[command_id] = command["object_id"]
+                    if command["type"] in self.STATE_ATTRIBUTES:
+                        coalesce_keys[command_id] = (command["object_id"], self.STATE_ATTRIBUTES[command["type"]])
+            except (KeyError, ValueError, NotImplementedError) as error:
+                errors.append(f"{command_id}: {error}")
+        for object_id in self.workstation_ids():
+            command_id = self.job_changed_command_id(object_id)
+            handlers[command_id] = self.objects[object_id]["py"].handle_job_change
+            ordering_keys[command_id] = object_id
+        if errors:
+            for error in errors:
+                self.logger.critical(f"Invalid command: {error}")
+            raise ValueError(f"Invalid commands in commands.json: {'; '.join(errors)}")
+        return handlers, ordering_keys, coalesce_keys
+
+    def compile_special_command(self, command_id: str, command: dict):
+        if "request" not in command:
+            raise ValueError(f'Missing key: "request" in command: {command}')
+        if "url" not in command["request"]:
+            raise ValueError(f'Missing key: "url" in request: {command["request"]}')
+        # the request is encoded once, only the argument is encoded for each event
+        return functools.partial(self.handle_special_command, RequestTemplate(command["request"]), command_id=command_id)
+
+    def compile_non_special_command(self, command: dict):
+        for key in ("object_id", "type"):
+            if key not in command:
+                raise ValueError(f'Missing key: "{key}" in command: {command}')
+        object_id = command["object_id"]
+        if object_id not in self.objects:
+            raise ValueError(f"Object not specified in a json file: {object_id}")
+        object = self.objects[object_id].get("py")
+        if isinstance(object, Storage):
+            methods = self.STORAGE_METHODS
+        elif isinstance(object, Workstation):
+            methods = self.WORKSTATION_METHODS
+        else:
+            raise ValueError(f"Object is neither a Storage nor a Workstation: {object_id}")
+        if command["type"] not in methods:
+            raise NotImplementedError(f"command type {command['type']} not implemented for {object_id}")
+        method = getattr(object, methods[command["type"]])
+        # the argument is only used by the special commands
+        return lambda arg=None: method()
+
+    def special_ordering_key(self, command: dict):
+        return self.special_object_id(command["request"]["url"])
+
+    def special_object_id(self, url: str):
+        # the URL of a special request usually refers to an Orion object:
+        # .../v2/entities/<object_id>/attrs/...
+        if "/v2/entities/" in url:
+            return url.split("/v2/entities/", 1)[1].split("/", 1)[0].split("?", 1)[0]
+        return url
+
+    def workstation_ids(self):
+        return [id for id, obj in self.objects.items() if isinstance(obj.get("py"), Workstation)]
+
+    def job_changed_command_id(self, workstation_id: str):
+        return f"{workstation_id}{self.JOB_CHANGED_SUFFIX}"
+
+    def notification_events(self, object: dict):
+        """Return the events (command id and argument pairs) of an Orion notification
+
+        Args:
+            object (dict): a notified object in keyValues format
+        """
+        command_id = self.job_changed_command_id(object["id"])
+        if "refJob" in object and command_id in self.handlers:
+            return [(command_id, object["refJob"])]
+        return []
+
+    def coalesce_key(self, command_id: str):
+        """Return the (object_id, attribute) pair set by an absolute state command
+
+        Returns None for any other command, these must never be coalesced.
+        """
+        return self.coalesce_keys.get(command_id)
+
+    def ordering_key(self, command_id: str):
+        """Return the key of the events that must be handled in order
+
+        The events of the same Orion object (or the same special request URL)
+        must be handled in order, the events with different keys are independent.
+        """
+        return self.ordering_keys.get(command_id)
+
+    def command_type(self, command_id: str):
+        command = self.commands.get(command_id)
+        if command is None:
+            return "job_changed"
+        if self.is_command_special(command):
+            return "special"
+        return command["type"]
+
+    def make_metric_labels(self, command_id: str):
+        # the labels are built once, the events only look them up
+        return (("stage", "dispatch"), ("type", self.command_type(command_id)),
+                ("object", self.ordering_keys[command_id]))
+
+    def handle_command(self, command_id: str, arg=None, event=None):
+        """Handle a command
+
+        The per-call state is passed in arguments, not stored in the CommandHandler,
+        so the commands of different objects can be handled concurrently.
+        The event (EventTrace.Event) is the current event while the command is handled,
+        so the attributes written in Orion carry its time, and its trace is recorded.
+        """
+        handler = self.handlers.get(command_id)
+        if handler is None:
             raise ValueError(f"command not specified in commands.json: {command_id}")
-        self.command = self.commands[command_id]
-        if self.is_command_special():
-            self.handle_special_command()
-        else:  # non special command
-            self.handle_non_special_command()
-        self.arg = None
-
-    def is_command_special(self):
-        return "special" in self.command.keys()
-
-    def handle_special_command(self):
-        req = self.command["request"]
-        if self.arg is not None:
-            req["data"] = self.arg if self.is_num(self.arg) else str(self.arg)
-        post_to_IoT_agent(req)
-
-    def handle_non_special_command(self):
-        if "object_id" not in self.command:
-            raise ValueError(f'Missing key: "object_id" in command: {self.command}')
-        self.object_id = self.command["object_id"]
-        if self.object_id not in self.objects:
-            raise ValueError(f"Object not specified in a json file: {self.object_id}")
-        self.object = self.objects[self.object_id]["py"]
-        if isinstance(self.object, Storage):
-            self.handle_storage()
-        if isinstance(self.object, Workstation):
-            self.handle_workstation()
-
-    def handle_storage(self):
-        if self.command["type"] not in ("step", "reset", "set_empty", "set_full"):
-            raise NotImplementedError(f"command type {self.command['type']} not implemented for {self.object.id}")
-        if self.command["type"] == "step":
-            self.object.step()
-        if self.command["type"] == "reset":
-            self.object.reset()
-        if self.command["type"] == "set_empty":
-            self.object.set_empty()
-        if self.command["type"] == "set_full":
-            self.object.set_full()
-
-    def handle_workstation(self):
-        if self.command["type"] not in ("turn_on", "turn_off", "handle_good_cycle", "handle_reject_cycle", "new_job"):
-            raise NotImplementedError(f"command type {self.command['type']} not implemented for {self.object.id}")
-        if self.command["type"] == "turn_on":
-            self.object.turn_on()
-        if self.command["type"] == "turn_off":
-            self.object.turn_off()
-        if self.command["type"] == "handle_good_cycle":
-            self.object.handle_good_cycle()
-        if self.command["type"] == "handle_reject_cycle":
-            self.object.handle_reject_cycle()
-        if self.command["type"] == "new_job":
-            self.object.reset_jobHandler()
+        if event is None:
+            self.run_handler(command_id, handler, arg)
+            return
+        token = EventTrace.current.set(event)
+        started = time.monotonic()
+        ok = False
+        try:
+            self.run_handler(command_id, handler, arg)
+            ok = True
+        finally:
+            EventTrace.current.reset(token)
+            EventTrace.record(event, command_id, started, time.monotonic(), ok)
+
+    def run_handler(self, command_id: str, handler, arg):
+        """Call the handler
+
+        If the metrics are on, the duration of the handling is recorded
+        per command type and object, the count of the histogram is the number of events,
+        and the failures are counted.
+        """
+        metrics = Metrics.metrics
+        if metrics is None:
+            handler(arg)
+            return
+        labels = self.metric_labels[command_id]
+        start = time.perf_counter()
+        try:
+            handler(arg)
+        except Exception:
+            metrics.increment("errors_total", labels)
+            raise
+        finally:
+            metrics.observe(labels, time.perf_counter() - start)
+
+    def is_command_special(self, command: dict):
+        return "special" in command.keys()
+
+    def handle_special_command(self, template: RequestTemplate, arg=None, command_id: str = None):
+        """Send a special request
+
+        The request is sent immediately, or queued in the Outbox or the RequestBatcher.
+        The result of a batched request is handled by handle_special_result.
+        """
+        if arg is not None:
+            arg = arg if self.is_num(arg) else str(arg)
+        req = template.render(arg)
+        # the special request may change an object, so its next write must not be suppressed
+        OrionObject.forget_acknowledged(self.special_object_id(template.url))
+        if Outbox.outbox is not None:
+            Outbox.outbox.put_request(req)
+        elif RequestBatcher.requestBatcher is not None:
+            # sent concurrently with the other special requests of the time window
+            future = RequestBatcher.requestBatcher.add(template.url, req)
+            future.add_done_callback(functools.partial(self.handle_special_result, command_id))
+        else:
+            post_to_IoT_agent(req)
 
+    def handle_special_result(self, command_id: str, future):
+        """Report a failed batched special request, like the failure of a directly sent one"""
+        error = future.exception()
+        if error is None:
+            return
+        ErrorAggregator.errors.report(self.logger, error, f"Special command {command_id} failed: ")
+        metrics = Metrics.metrics
+        if metrics is not None and command_id in self.metric_labels:
+            metrics.increment("errors_total", self.metric_labels[command_id])
@@ -0,0 +1,183 @@
+"""CycleFlusher
+
+Flushes the JobHandlers' part counters to Orion in the background
+
+A fast machine can finish several cycles per second. Without the CycleFlusher,
+every cycle writes the Job's part counter to Orion. With it, the JobHandler
+only counts the cycles locally, and the absolute part counter is written
+when CYCLE_FLUSH_MAX_CYCLES cycles are unflushed, or CYCLE_FLUSH_INTERVAL_MS
+milliseconds after the first unflushed cycle, whichever comes first.
+The counters are also flushed when the Workstation is turned off,
+before a new Job is started and when the service stops.
+
+The part counters hold absolute values, so no cycle is lost by skipping
+the intermediate values. If a flush fails, the JobHandler is flushed again
+after CYCLE_FLUSH_INTERVAL_MS. The value in Orion lags behind by at most
+CYCLE_FLUSH_INTERVAL_MS plus the time of the write itself.
+
+Environment variables:
+    CYCLE_FLUSH_INTERVAL_MS: the longest time a cycle stays unflushed in milliseconds.
+        Default: 0, every cycle is written immediately
+    CYCLE_FLUSH_MAX_CYCLES: the number of unflushed cycles that trigger a flush. Default: 10
+"""
+
+# Standard Library imports
+import atexit
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from ErrorAggregator import errors
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+CYCLE_FLUSH_INTERVAL_MS = os.environ.get("CYCLE_FLUSH_INTERVAL_MS")
+if CYCLE_FLUSH_INTERVAL_MS is None:
+    CYCLE_FLUSH_INTERVAL_MS = 0
+else:
+    CYCLE_FLUSH_INTERVAL_MS = float(CYCLE_FLUSH_INTERVAL_MS)
+
+CYCLE_FLUSH_MAX_CYCLES = os.environ.get("CYCLE_FLUSH_MAX_CYCLES")
+if CYCLE_FLUSH_MAX_CYCLES is None:
+    CYCLE_FLUSH_MAX_CYCLES = 10
+else:
+    CYCLE_FLUSH_MAX_CYCLES = int(CYCLE_FLUSH_MAX_CYCLES)
+
+
+class CycleFlusher():
+    """Background thread flushing the JobHandlers at their deadlines
+
+    Attributes:
+        interval_ms (float): the longest time a cycle stays unflushed in milliseconds
+        max_cycles (int): the number of unflushed cycles that trigger a flush
+        deadlines (dict): {id(jobHandler): (deadline, jobHandler)}
+        cycles (int): the number of cycles counted so far
+        flushes (int): the number of flushes so far
+        max_staleness (float): the longest time between a cycle and its flush in seconds
+
+    Usage:
+        __init__:
+            flusher = CycleFlusher(interval_ms=200, max_cycles=10)
+
+        add_cycle(jobHandler, unflushed_cycles, first_unflushed_time):
+            called by the JobHandler for every counted cycle,
+            returns True if the JobHandler must be flushed right now
+
+        reschedule(jobHandler):
+            called by the JobHandler after a failed flush, it is flushed again after interval_ms
+
+        record_flush(first_unflushed_time):
+            called by the JobHandler after a flush
+
+        stop():
+            flush all JobHandlers and stop the thread
+
+        stats():
+            return the flush statistics in a dict
+    """
+
+    def __init__(self, interval_ms: float = CYCLE_FLUSH_INTERVAL_MS, max_cycles: int = CYCLE_FLUSH_MAX_CYCLES):
+        if max_cycles < 1:
+            raise ValueError(f"Invalid number of cycles: {max_cycles}, it must be at least 1")
+        self.interval_ms = interval_ms
+        self.max_cycles = max_cycles
+        self.deadlines = {}
+        self.cycles = 0
+        self.flushes = 0
+        self.max_staleness = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    def add_cycle(self, jobHandler, unflushed_cycles: int, first_unflushed_time: float):
+        with self.condition:
+            self.cycles += 1
+            if unflushed_cycles >= self.max_cycles or self.stopped:
+                self.deadlines.pop(id(jobHandler), None)
+                return True
+            if id(jobHandler) not in self.deadlines:
+                self.deadlines[id(jobHandler)] = (first_unflushed_time + self.interval_ms / 1000, jobHandler)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="CycleFlusher", daemon=True)
+                    self.thread.start()
+                self.condition.notify()
+            return False
+
+    def discard(self, jobHandler):
+        with self.condition:
+            self.deadlines.pop(id(jobHandler), None)
+
+    def reschedule(self, jobHandler):
+        """Flush the JobHandler again after interval_ms, called after a failed flush"""
+        with self.condition:
+            if self.stopped:
+                logger.error(f"The cycle counters of {jobHandler.workstation_id} could not be flushed before stopping")
+                return
+            if id(jobHandler) not in self.deadlines:
+                self.deadlines[id(jobHandler)] = (time.monotonic() + self.interval_ms / 1000, jobHandler)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="CycleFlusher", daemon=True)
+                    self.thread.start()
+                self.condition.notify()
+
+    def record_flush(self, first_unflushed_time: float):
+        staleness = time.monotonic() - first_unflushed_time
+        with self.condition:
+            self.flushes += 1
+            self.max_staleness = max(self.max_staleness, staleness)
+
+    def take_due(self):
+        """Remove and return the JobHandlers whose deadline is over"""
+        now = time.monotonic()
+        due = [jobHandler for deadline, jobHandler in self.deadlines.values() if deadline <= now or self.stopped]
+        for jobHandler in due:
+            del self.deadlines[id(jobHandler)]
+        return due
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.deadlines and not self.stopped:
+                    self.condition.wait()
+                if self.stopped and not self.deadlines:
+                    return
+                due = self.take_due()
+                if not due:
+                    earliest = min(deadline for deadline, _ in self.deadlines.values())
+                    self.condition.wait(earliest - time.monotonic())
+                    continue
+            for jobHandler in due:
+                try:
+                    jobHandler.flush_cycles()
+                except Exception as error:
+                    errors.report(logger, error, f"Flushing the cycle counters of {jobHandler.workstation_id} failed: ")
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        logger.info(f"Cycle flush statistics: {self.stats()}")
+
+    def stats(self):
+        with self.condition:
+            return {
+                "cycles": self.cycles,
+                "flushes": self.flushes,
+                "write_reduction": self.cycles / self.flushes if self.flushes else 0,
+                "max_staleness_ms": self.max_staleness * 1000,
+            }
+
+
+flusher = None
+if CYCLE_FLUSH_INTERVAL_MS > 0:
+    flusher = CycleFlusher()
+    atexit.register(flusher.stop)
+    logger.info(f"Flushing the cycle counters: interval: {CYCLE_FLUSH_INTERVAL_MS} ms, "
+                f"max cycles: {CYCLE_FLUSH_MAX_CYCLES}")
@@ -0,0 +1,147 @@
+"""Dispatcher
+
+Decouples the serial ingest from the HTTP requests
+
+The serial reader submits the events (command id, argument and EventTrace.Event)
+to the Dispatcher, which puts them into a bounded EventQueue and returns.
+The dispatch worker threads take the events out of the queue and pass them
+to the CommandHandler, so a slow HTTP request never holds up the serial reader.
+
+Each worker has its own queue. The events are sharded by their ordering key
+(the Orion object id, see CommandHandler.ordering_key), so the events of
+one Workstation or Storage are always handled by the same worker, strictly in order,
+while the events of different objects are handled in parallel.
+
+Environment variables:
+    DISPATCH_WORKERS: the number of dispatch worker threads. Default: 1
+    EVENT_QUEUE_SIZE: the maximum number of queued events per worker. Default: 1000
+    BACKPRESSURE_POLICY: what happens if the queue is full. Default: block
+        block: the serial reader waits until a worker takes an event
+        drop_oldest: the oldest queued event is dropped
+        coalesce: a queued absolute state event (for example turn_on and turn_off
+            of the same Workstation) is replaced by the new one in its place,
+            otherwise the oldest queued event is dropped
+"""
+
+# Standard Library imports
+import os
+import threading
+
+# PyPI imports
+
+# Custom imports
+from ErrorAggregator import errors
+from EventQueue import EventQueue
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+DISPATCH_WORKERS = os.environ.get("DISPATCH_WORKERS")
+if DISPATCH_WORKERS is None:
+    DISPATCH_WORKERS = 1
+else:
+    DISPATCH_WORKERS = int(DISPATCH_WORKERS)
+
+EVENT_QUEUE_SIZE = os.environ.get("EVENT_QUEUE_SIZE")
+if EVENT_QUEUE_SIZE is None:
+    EVENT_QUEUE_SIZE = 1000
+else:
+    EVENT_QUEUE_SIZE = int(EVENT_QUEUE_SIZE)
+
+BACKPRESSURE_POLICY = os.environ.get("BACKPRESSURE_POLICY")
+if BACKPRESSURE_POLICY is None:
+    BACKPRESSURE_POLICY = "block"
+
+
+class Dispatcher():
+    """Bounded queues of events drained by dispatch worker threads, one queue per worker
+
+    Attributes:
+        commandHandler (CommandHandler): handles the events
+        eventQueues (list): the EventQueue of each worker
+        dispatched (int): the number of events handled successfully
+        failed (int): the number of events whose handling raised an exception
+
+    Usage:
+        __init__:
+            dispatcher = Dispatcher(commandHandler, workers=4)
+
+        submit(command_id, arg, event=None):
+            queue an event, the event is the EventTrace.Event of its serial read
+
+        stop(timeout=None):
+            handle the queued events, then stop the workers
+
+        stats():
+            return the queue depth, dropped and dispatched event counters in a dict
+    """
+
+    def __init__(self, commandHandler, workers: int = DISPATCH_WORKERS, queue_size: int = EVENT_QUEUE_SIZE,
+                 policy: str = BACKPRESSURE_POLICY):
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers: {workers}, it must be at least 1")
+        self.commandHandler = commandHandler
+        self.eventQueues = [EventQueue(queue_size, policy, coalesce_key=self.coalesce_key) for _ in range(workers)]
+        self.dispatched = 0
+        self.failed = 0
+        self.counter_lock = threading.Lock()
+        self.threads = []
+        for i, eventQueue in enumerate(self.eventQueues):
+            thread = threading.Thread(target=self.work, args=(eventQueue,), name=f"Dispatcher-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Dispatcher started: workers: {workers}, queue size: {queue_size}, policy: {policy}")
+
+    def coalesce_key(self, event):
+        command_id = event[0]
+        return self.commandHandler.coalesce_key(command_id)
+
+    def shard(self, command_id: str):
+        """Return the queue of the worker that handles the events of the command's object"""
+        if len(self.eventQueues) == 1:
+            return self.eventQueues[0]
+        key = self.commandHandler.ordering_key(command_id)
+        return self.eventQueues[hash(key) % len(self.eventQueues)]
+
+    def submit(self, command_id: str, arg=None, event=None):
+        self.shard(command_id).put((command_id, arg, event))
+
+    def work(self, eventQueue: EventQueue):
+        while True:
+            item = eventQueue.get()
+            if item is None:
+                if eventQueue.closed:
+                    return
+                continue
+            command_id, arg, event = item
+            try:
+                self.commandHandler.handle_command(command_id, arg, event)
+                with self.counter_lock:
+                    self.dispatched += 1
+            except Exception as error:
+                with self.counter_lock:
+                    self.failed += 1
+                # while Orion is down, every event fails with the same error
+                errors.report(logger, error)
+
+    def stop(self, timeout: float = None):
+        for eventQueue in self.eventQueues:
+            eventQueue.close()
+        for thread in self.threads:
+            thread.join(timeout)
+        logger.info(f"Dispatcher stopped: {self.stats()}")
+
+    def stats(self):
+        queue_stats = [eventQueue.stats() for eventQueue in self.eventQueues]
+        stats = {
+            "depth": sum(q["depth"] for q in queue_stats),
+            "max_depth": max(q["max_depth"] for q in queue_stats),
+            "dropped": sum(q["dropped"] for q in queue_stats),
+            "coalesced": sum(q["coalesced"] for q in queue_stats),
+            "workers": len(self.eventQueues),
+        }
+        with self.counter_lock:
+            stats["dispatched"] = self.dispatched
+            stats["failed"] = self.failed
+        return stats
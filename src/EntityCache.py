@@ -0,0 +1,169 @@
+"""EntityCache
+
+An in-process cache of the objects downloaded from Orion
+
+Some objects rarely change, for example the Operation's partsPerCycle
+or the Workstation's refJob, still they used to be downloaded again
+whenever a JobHandler was created. Orion.get looks the objects up in the cache first.
+
+Each cached object expires after a time to live (TTL). If the cache is full,
+the least recently used object is evicted. The objects written by the service
+are invalidated after every write, and the objects changed by others are
+invalidated by the Orion subscription notifications, see NotificationListener.
+
+Only the downloads of the ENTITY_CACHE_ATTRS attributes are cached:
+the attributes notified by the subscription (refJob) and the ones that
+practically never change (partsPerCycle). The whole objects and the
+attributes changed by others without a notification, for example
+the Job's part counters, are always downloaded from Orion.
+
+Environment variables:
+    ENTITY_CACHE_TTL: the time to live of the cached objects in seconds.
+        Default: 0, the cache is disabled
+    ENTITY_CACHE_SIZE: the maximum number of cached objects. Default: 1000
+    ENTITY_CACHE_ATTRS: the comma separated attributes whose downloads are cached.
+        Default: refJob,partsPerCycle
+"""
+
+# Standard Library imports
+import atexit
+from collections import OrderedDict
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+ENTITY_CACHE_TTL = os.environ.get("ENTITY_CACHE_TTL")
+if ENTITY_CACHE_TTL is None:
+    ENTITY_CACHE_TTL = 0
+else:
+    ENTITY_CACHE_TTL = float(ENTITY_CACHE_TTL)
+
+ENTITY_CACHE_SIZE = os.environ.get("ENTITY_CACHE_SIZE")
+if ENTITY_CACHE_SIZE is None:
+    ENTITY_CACHE_SIZE = 1000
+else:
+    ENTITY_CACHE_SIZE = int(ENTITY_CACHE_SIZE)
+
+ENTITY_CACHE_ATTRS = os.environ.get("ENTITY_CACHE_ATTRS")
+if ENTITY_CACHE_ATTRS is None:
+    ENTITY_CACHE_ATTRS = "refJob,partsPerCycle"
+ENTITY_CACHE_ATTRS = frozenset(attr.strip() for attr in ENTITY_CACHE_ATTRS.split(",") if attr.strip())
+
+
+class EntityCache():
+    """Thread-safe TTL and LRU cache of Orion objects
+
+    The same object can be cached in several variants, for example
+    with different attribute projections. An object id is one entry:
+    it is evicted and invalidated together with all of its variants.
+
+    Attributes:
+        ttl (float): the time to live of the cached objects in seconds
+        max_size (int): the maximum number of cached objects
+        attrs (frozenset): the attributes whose downloads may be cached
+        entries (OrderedDict): {object_id: {variant: (expires, value)}}
+            in least recently used order
+        hits (int): the number of lookups served from the cache
+        misses (int): the number of lookups not found or expired
+        evictions (int): the number of objects evicted because the cache was full
+
+    Usage:
+        __init__:
+            cache = EntityCache(ttl=60, max_size=1000)
+
+        is_cacheable(attrs):
+            return True if a download of these attributes may be cached
+
+        get(object_id, variant=None):
+            return the cached value or None, the value must not be modified
+
+        put(object_id, value, variant=None):
+            cache a value
+
+        invalidate(object_id):
+            forget all variants of an object
+
+        stats():
+            return the hit, miss and eviction counters in a dict
+    """
+
+    def __init__(self, ttl: float = ENTITY_CACHE_TTL, max_size: int = ENTITY_CACHE_SIZE,
+                 attrs: frozenset = ENTITY_CACHE_ATTRS):
+        if max_size < 1:
+            raise ValueError(f"Invalid cache size: {max_size}, it must be at least 1")
+        self.ttl = ttl
+        self.max_size = max_size
+        self.attrs = frozenset(attrs)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_cacheable(self, attrs: list):
+        # a whole object contains the attributes that may change unnoticed
+        return attrs is not None and self.attrs.issuperset(attrs)
+
+    def get(self, object_id: str, variant=None):
+        with self.lock:
+            variants = self.entries.get(object_id)
+            cached = None if variants is None else variants.get(variant)
+            if cached is None:
+                self.misses += 1
+                return None
+            expires, value = cached
+            if time.monotonic() >= expires:
+                del variants[variant]
+                if not variants:
+                    del self.entries[object_id]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(object_id)
+            self.hits += 1
+            return value
+
+    def put(self, object_id: str, value, variant=None):
+        with self.lock:
+            variants = self.entries.setdefault(object_id, {})
+            variants[variant] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(object_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, object_id: str):
+        with self.lock:
+            self.entries.pop(object_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0,
+                "evictions": self.evictions,
+            }
+
+
+def log_stats(cache: EntityCache):
+    logger.info(f"EntityCache: {cache.stats()}")
+
+
+cache = None
+if ENTITY_CACHE_TTL > 0:
+    cache = EntityCache()
+    atexit.register(log_stats, cache)
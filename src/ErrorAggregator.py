@@ -0,0 +1,197 @@
+"""ErrorAggregator
+
+Rate-limits and deduplicates the errors logged by the loops
+
+When Orion is down or the serial line is noisy, the same error occurs
+for every event. Logging each of them fills the log (in RAM on tmpfs)
+and wastes CPU. The ErrorAggregator logs the first occurrence of an error,
+then only counts its repetitions, and logs a summary like
+"... (120 occurrences in the last 60 s)" every ERROR_SUMMARY_INTERVAL seconds.
+
+Different errors of the same class (the same place and exception type,
+for example connection errors with varying messages) share a token bucket:
+at most ERROR_BURST of them are logged at once, then ERROR_RATE per second,
+the rest is counted and summarized.
+
+At most ERROR_MAX_KEYS different errors are tracked, the least recently seen
+one is forgotten first, so the memory use is bounded.
+
+Environment variables:
+    ERROR_SUMMARY_INTERVAL: the time between 2 summaries of a repeated error in seconds. Default: 60
+    ERROR_BURST: the number of errors of a class logged at once. Default: 5
+    ERROR_RATE: the number of errors of a class logged per second after the burst. Default: 0.2
+    ERROR_MAX_KEYS: the maximum number of different errors tracked. Default: 1000
+"""
+
+# Standard Library imports
+import atexit
+from collections import OrderedDict
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+
+# environment variables
+ERROR_SUMMARY_INTERVAL = os.environ.get("ERROR_SUMMARY_INTERVAL")
+if ERROR_SUMMARY_INTERVAL is None:
+    ERROR_SUMMARY_INTERVAL = 60
+else:
+    ERROR_SUMMARY_INTERVAL = float(ERROR_SUMMARY_INTERVAL)
+
+ERROR_BURST = os.environ.get("ERROR_BURST")
+if ERROR_BURST is None:
+    ERROR_BURST = 5
+else:
+    ERROR_BURST = float(ERROR_BURST)
+
+ERROR_RATE = os.environ.get("ERROR_RATE")
+if ERROR_RATE is None:
+    ERROR_RATE = 0.2
+else:
+    ERROR_RATE = float(ERROR_RATE)
+
+ERROR_MAX_KEYS = os.environ.get("ERROR_MAX_KEYS")
+if ERROR_MAX_KEYS is None:
+    ERROR_MAX_KEYS = 1000
+else:
+    ERROR_MAX_KEYS = int(ERROR_MAX_KEYS)
+
+
+class ErrorAggregator():
+    """Logs the errors through a token bucket per error class and summarizes the repetitions
+
+    Attributes:
+        summary_interval (float): the time between 2 summaries of a repeated error in seconds
+        burst (float): the size of the token buckets
+        rate (float): the refill rate of the token buckets per second
+        max_keys (int): the maximum number of different errors tracked
+        errors (OrderedDict): {(error_class, message): [logger, unlogged count, last logged time]}
+        buckets (OrderedDict): {error_class: [tokens, last refill time]}
+        reported (int): the number of errors reported
+        logged (int): the number of errors logged one by one
+        suppressed (int): the number of errors only counted
+        evicted (int): the number of tracked errors forgotten because of the memory bound
+
+    Usage:
+        __init__:
+            errors = ErrorAggregator()
+
+        report(logger, error, prefix=""):
+            log the error with the logger as "<prefix><error>" or count it
+
+        flush():
+            log the summaries of the counted errors now
+
+        stats():
+            return the counters in a dict
+    """
+
+    def __init__(self, summary_interval: float = ERROR_SUMMARY_INTERVAL, burst: float = ERROR_BURST,
+                 rate: float = ERROR_RATE, max_keys: int = ERROR_MAX_KEYS, clock=time.monotonic):
+        self.summary_interval = summary_interval
+        self.burst = burst
+        self.rate = rate
+        self.max_keys = max_keys
+        self.clock = clock
+        self.errors = OrderedDict()
+        self.buckets = OrderedDict()
+        self.reported = 0
+        self.logged = 0
+        self.suppressed = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def take_token(self, error_class: str, now: float):
+        bucket = self.buckets.get(error_class)
+        if bucket is None:
+            bucket = self.buckets[error_class] = [self.burst, now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(error_class)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def report(self, logger, error, prefix: str = ""):
+        message = f"{prefix}{error}"
+        error_class = f"{prefix}{type(error).__name__}"
+        key = (error_class, message)
+        now = self.clock()
+        evicted = None
+        with self.lock:
+            self.reported += 1
+            entry = self.errors.get(key)
+            if entry is None:
+                entry = self.errors[key] = [logger, 0, None]
+                if len(self.errors) > self.max_keys:
+                    (_, evicted_message), (evicted_logger, count, _) = self.errors.popitem(last=False)
+                    self.evicted += 1
+                    if count:
+                        # the counted repetitions of a forgotten error are summarized at once
+                        evicted = (evicted_logger, evicted_message, count)
+            else:
+                self.errors.move_to_end(key)
+            repeated = entry[2] is not None and now - entry[2] < self.summary_interval
+            if not repeated and self.take_token(error_class, now):
+                entry[2] = now
+                self.logged += 1
+                log_now = True
+            else:
+                entry[1] += 1
+                self.suppressed += 1
+                log_now = False
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="ErrorAggregator", daemon=True)
+                    self.thread.start()
+        if evicted is not None:
+            self.log_summary(*evicted)
+        if log_now:
+            logger.error(message)
+
+    def log_summary(self, logger, message: str, count: int):
+        logger.error("%s (%s occurrences in the last %.0f s)", message, count, self.summary_interval)
+
+    def take_summaries(self):
+        summaries = []
+        with self.lock:
+            for (_, message), entry in self.errors.items():
+                if entry[1]:
+                    summaries.append((entry[0], message, entry[1]))
+                    entry[1] = 0
+                    entry[2] = self.clock()
+        return summaries
+
+    def flush(self):
+        for logger, message, count in self.take_summaries():
+            self.log_summary(logger, message, count)
+
+    def run(self):
+        while not self.wakeup.wait(self.summary_interval):
+            self.flush()
+
+    def stop(self):
+        self.wakeup.set()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "reported": self.reported,
+                "logged": self.logged,
+                "suppressed": self.suppressed,
+                "evicted": self.evicted,
+                "tracked": len(self.errors),
+            }
+
+
+errors = ErrorAggregator()
+atexit.register(errors.stop)
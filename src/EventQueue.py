@@ -0,0 +1,128 @@
+"""EventQueue
+
+A bounded queue between the serial reader and the dispatch workers
+
+The serial reader only frames the incoming data and puts the events
+into the queue, the dispatch workers take them out and send the HTTP requests.
+If the workers cannot keep up and the queue is full,
+the backpressure policy decides what happens:
+    "block": the reader waits until a worker takes an event
+    "drop_oldest": the oldest queued event is dropped
+    "coalesce": a queued event with the same coalesce key is replaced
+        by the new one in its place (only the last value of an absolute state
+        matters, and the order of the other events is kept),
+        if there is no such event, the oldest queued event is dropped
+"""
+
+# Standard Library imports
+from collections import deque
+import threading
+
+# PyPI imports
+
+# Custom imports
+
+POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class EventQueue():
+    """Bounded, thread safe FIFO queue with a backpressure policy
+
+    Attributes:
+        maxsize (int): the maximum number of queued events
+        policy (str): "block", "drop_oldest" or "coalesce"
+        coalesce_key (callable): returns the coalesce key of an event,
+            or None if the event must not be coalesced
+        dropped (int): the number of dropped events
+        coalesced (int): the number of events replaced by a newer one
+        max_depth (int): the highest number of queued events so far
+
+    Usage:
+        __init__:
+            eventQueue = EventQueue(maxsize=1000, policy="block")
+
+        put(event):
+            add an event according to the policy
+
+        get(timeout=None):
+            remove and return the oldest event,
+            return None if the timeout expired or the queue is closed and empty
+
+        close():
+            wake up the waiting workers, no more events can be put
+    """
+
+    def __init__(self, maxsize: int, policy: str = "block", coalesce_key=None):
+        if maxsize < 1:
+            raise ValueError(f"Invalid queue size: {maxsize}, it must be at least 1")
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid backpressure policy: {policy}, supported policies: {POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.coalesce_key = coalesce_key
+        self.events = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.events)
+
+    def replace_same_key(self, event):
+        """Replace the queued event with the same coalesce key in place, return True if there was one"""
+        if self.coalesce_key is None:
+            return False
+        key = self.coalesce_key(event)
+        if key is None:
+            return False
+        for i, queued in enumerate(self.events):
+            if self.coalesce_key(queued) == key:
+                self.events[i] = event
+                self.coalesced += 1
+                return True
+        return False
+
+    def put(self, event):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The event queue is closed")
+            if len(self.events) >= self.maxsize:
+                if self.policy == "block":
+                    while len(self.events) >= self.maxsize and not self.closed:
+                        self.condition.wait()
+                elif self.policy == "coalesce" and self.replace_same_key(event):
+                    self.condition.notify_all()
+                    return
+                else:
+                    self.events.popleft()
+                    self.dropped += 1
+            self.events.append(event)
+            self.max_depth = max(self.max_depth, len(self.events))
+            self.condition.notify_all()
+
+    def get(self, timeout: float = None):
+        with self.condition:
+            if not self.events and not self.closed:
+                self.condition.wait(timeout)
+            if not self.events:
+                return None
+            event = self.events.popleft()
+            self.condition.notify_all()
+            return event
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "depth": len(self.events),
+                "max_depth": self.max_depth,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+            }
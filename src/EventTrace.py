@@ -0,0 +1,171 @@
+"""EventTrace
+
+The event time of the serial events, carried to Orion and to a trace file
+
+Orion (and Cygnus) record the time a request arrives, which can be seconds
+or minutes after the machine event under load or after an outbox drain.
+So the time of each serial read is captured at ingest: a monotonic time
+for measuring the stages and a wall-clock time as the event time.
+The Event is submitted to the Dispatcher with the command, and while
+CommandHandler.handle_command handles it, it is the current event.
+OrionObject.update_attribute attaches the current event's time
+to the written attribute as TimeInstant metadata:
+    "available": {"type": "Boolean", "value": true,
+                  "metadata": {"TimeInstant": {"type": "DateTime", "value": "2026-10-18T08:00:00.123Z"}}}
+The metadata is kept by the WriteBatcher and the Outbox, so a late write
+still carries the time of the event. The writes not caused by a serial event
+(for example the flushed cycles and the reconciliation) have no event time.
+
+If EVENT_TRACE_FILE is set, a line is written for each handled event:
+    <event time> <command id> <queue ms> <handle ms> <ok>
+where the event time is in seconds since the epoch, the queue time is
+the time from the serial read until the handling started,
+the handle time is the duration of handle_command, ok is 1 or 0.
+The file is rotated once it reaches EVENT_TRACE_MAX_BYTES.
+
+Environment variables:
+    EVENT_TIME_METADATA: attach the event time to the attributes written in Orion. Default: true
+    EVENT_TRACE_FILE: the path of the trace file. Default: not set, no trace is written
+    EVENT_TRACE_MAX_BYTES: the size of the trace file that triggers rotating it. Default: 10485760 (10 MiB)
+"""
+
+# Standard Library imports
+import atexit
+import contextvars
+from datetime import datetime, timezone
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+EVENT_TIME_METADATA = os.environ.get("EVENT_TIME_METADATA")
+if EVENT_TIME_METADATA is None:
+    EVENT_TIME_METADATA = True
+else:
+    EVENT_TIME_METADATA = EVENT_TIME_METADATA.lower() == "true"
+
+EVENT_TRACE_FILE = os.environ.get("EVENT_TRACE_FILE")
+
+EVENT_TRACE_MAX_BYTES = os.environ.get("EVENT_TRACE_MAX_BYTES")
+if EVENT_TRACE_MAX_BYTES is None:
+    EVENT_TRACE_MAX_BYTES = 10 * 1024 * 1024
+else:
+    EVENT_TRACE_MAX_BYTES = int(EVENT_TRACE_MAX_BYTES)
+
+# the buffered trace lines are written to the file at most this often, in seconds
+TRACE_FLUSH_INTERVAL = 1
+
+# the event being handled in the current thread
+current = contextvars.ContextVar("event", default=None)
+
+
+class Event():
+    """The time of a serial read, shared by the events decoded from it
+
+    Attributes:
+        received (float): time.monotonic() at the serial read
+        time (float): time.time() at the serial read, the event time
+    """
+    __slots__ = ("received", "time", "time_instant_value")
+
+    def __init__(self, received: float = None, event_time: float = None):
+        self.received = time.monotonic() if received is None else received
+        self.time = time.time() if event_time is None else event_time
+        self.time_instant_value = None
+
+    def time_instant(self):
+        """Return the event time in ISO 8601 format, like 2026-10-18T08:00:00.123Z"""
+        if self.time_instant_value is None:
+            # formatted once, even if the event writes several attributes
+            self.time_instant_value = datetime.fromtimestamp(self.time, timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        return self.time_instant_value
+
+
+class TraceFile():
+    """Buffered, size-bounded file of trace lines
+
+    Usage:
+        __init__:
+            traceFile = TraceFile(path)
+
+        write(line):
+            append a line, the buffer is written to the file every TRACE_FLUSH_INTERVAL seconds
+
+        close():
+            write the buffer and close the file
+    """
+
+    def __init__(self, path: str, max_bytes: int = EVENT_TRACE_MAX_BYTES, flush_interval: float = TRACE_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = open(path, "a")
+        self.size = self.file.tell()
+        self.last_flush = time.monotonic()
+
+    def write(self, line: str):
+        with self.lock:
+            if self.file is None:
+                return
+            if self.max_bytes and self.size + len(line) > self.max_bytes:
+                self.rotate()
+            self.file.write(line)
+            self.size += len(line)
+            now = time.monotonic()
+            if now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def rotate(self):
+        self.file.close()
+        os.replace(self.path, self.path + ".1")
+        self.file = open(self.path, "a")
+        self.size = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+traceFile = None
+if EVENT_TRACE_FILE is not None:
+    traceFile = TraceFile(EVENT_TRACE_FILE)
+    atexit.register(traceFile.close)
+
+
+def ingest():
+    """Return the Event of a serial read, or None if neither the metadata nor the trace is on"""
+    if EVENT_TIME_METADATA or traceFile is not None:
+        return Event()
+    return None
+
+
+def metadata():
+    """Return the TimeInstant metadata of the current event, or None"""
+    event = current.get()
+    if event is None or not EVENT_TIME_METADATA:
+        return None
+    return {"TimeInstant": {"type": "DateTime", "value": event.time_instant()}}
+
+
+def record(event: Event, command_id: str, started: float, finished: float, ok: bool):
+    """Write the trace line of a handled event if the trace is on
+
+    Args:
+        started, finished: time.monotonic() when the handling started and finished
+    """
+    if traceFile is None:
+        return
+    traceFile.write("%.3f %s %.3f %.3f %d\n" % (
+        event.time, command_id, (started - event.received) * 1000, (finished - started) * 1000, ok))
@@ -2,13 +2,20 @@
 """
 
 # Standard Library imports
+import threading
+import time
 
 # PyPI imports
 
 # Custom imports
 from OrionObject import OrionObject
 from Logger import getLogger
+from Reconciler import reconciler
+import CycleFlusher
 import Orion
+import StateJournal
+
+logger = getLogger(__name__)
 
 
 class JobHandler(OrionObject):
@@ -17,10 +24,11 @@ class JobHandler(OrionObject):
     It is an extraodinary object because it is possible that 
     we do not know which Job the JobHandler refers to. 
 
-    Upon initiating, the JobHandler tries to query the Job and Operation 
-    objects to calculate the number of cycles producing good and reject parts
-    respectively. If it suceeds, the counters continue from these values. 
-    If it does not succeed, the counters start from 0.
+    Upon initiating, the JobHandler is scheduled in the Reconciler, which queries
+    the Job and Operation objects in the background to calculate the number
+    of cycles producing good and reject parts respectively. The counters start
+    from 0 and the cycles are counted locally, when the Reconciler succeeds,
+    the cycles already finished in Orion are added to them.
 
     The Raspberry Pi knows when a new job is started and how many
     cycles have been completed so far in the current job.
@@ -50,65 +58,149 @@ class JobHandler(OrionObject):
             handles the event of reject parts completed
             in a Workstation cycle 
             also sends the data to the IoT agent
+
+        flush_cycles():
+            writes the part counters of the cycles not written yet,
+            see CycleFlusher
     """
 
-    def __init__(self, workstation_id: str):
+    def __init__(self, workstation_id: str, fetch: bool = True, restore: bool = False):
         self.workstation_id = workstation_id
-        self.logger = getLogger(__name__)
+        self.logger = logger
         self.good_cycle_counter = 0
         self.reject_cycle_counter = 0
         self.are_counters_initiated_from_Orion = False
-        if Orion.is_reachable():
-            self.logger.debug("Orion is reachable")
-            self.update_cycle_counters()
-
-    def update_cycle_counters(self):
-        """Update good and reject part counters
-
-        This update procedure is tried at initiation and also
-        before handling any type of cycle. 
-
-        The point is that the Job's goodPartCounter and rejectPartCounter
-        may already contain a lot of parts, and we would like to continue from
-        where it was left befores. 
-
-        Since we do not know which cycle the procedure will succeed,
-        the method is called update. When the update suceeds, it is never
-        executed again as long as rpi_commands runs. The function calculates
-        how many cycles had already been finished before starting rpi_commands
-        and adds these cycle counts to the current cycle counts. 
-        This way, if the connection is restored after X good cycles and there
-        were already Y good cycles before, the counter will be X+Y. The same
-        applies for the reject part counter.
+        # cycles were counted before the counters were initiated, these are not in Orion yet
+        self.has_unsent_cycles = False
+        # the cycles counted since the last flush, see CycleFlusher
+        self.unflushed_cycles = 0
+        self.unflushed_counters = set()
+        self.first_unflushed_time = None
+        # the Reconciler's thread changes the counters too
+        self.lock = threading.Lock()
+        # the flushes are written one at a time, so an older value never overwrites a newer one
+        self.flush_lock = threading.Lock()
+        if restore:
+            self.restore_cycle_counters()
+        # at startup, the counters of all JobHandlers are fetched in bulk instead, see fetch_jobHandlers
+        if fetch and not self.are_counters_initiated_from_Orion:
+            # the counters are initiated in the background, the dispatch never waits for Orion
+            reconciler.schedule(self)
+
+    def fetch_cycle_counters(self):
+        """Download the Job's part counters and the Operation's partsPerCycle
+
+        Returns:
+            job_id, good_part_counter, reject_part_counter, parts_per_cycle
+
+        Raises:
+            RuntimeError: if Orion cannot be reached or an object does not exist
         """
-        try:
-            workstation = Orion.get(self.workstation_id)
-            self.logger.debug(f"update_cycle_counters: workstation: {workstation}")
-            job = Orion.get(workstation["refJob"]["value"])
-            self.logger.debug(f"update_cycle_counters: job: {job}")
-            good_part_counter = job["goodPartCounter"]["value"]
-            self.logger.debug(f"update_cycle_counters: good_part_counter: {good_part_counter}")
-            reject_part_counter = job["rejectPartCounter"]["value"]
-            self.logger.debug(f"update_cycle_counters: reject_part_counter: {reject_part_counter}")
-            operation = Orion.get(job["refOperation"]["value"])
-            self.logger.debug(f"update_cycle_counters: operation: {operation}")
-            parts_per_cycle = operation["partsPerCycle"]["value"]
-            self.logger.debug(f"update_cycle_counters: parts_per_cycle: {parts_per_cycle}")
-            if good_part_counter % parts_per_cycle != 0:
-                raise ValueError(f"The goodPartCounter is not divisible by partsPerCycle for {job['id']}. {good_part_counter} % {parts_per_cycle} != 0")
-            if reject_part_counter % parts_per_cycle != 0:
-                raise ValueError(f"The rejectPartCounter is not divisible by partsPerCycle for {job['id']}. {reject_part_counter} % {parts_per_cycle} != 0")
-            good_cycles_already_finished_in_Orion = good_part_counter / parts_per_cycle
-            self.logger.debug(f"update_cycle_counters: good_cycles_already_finished_in_Orion: {good_cycles_already_finished_in_Orion}")
-            self.good_cycle_counter += good_cycles_already_finished_in_Orion
-            reject_cycles_already_finished_in_Orion = reject_part_counter / parts_per_cycle
-            self.logger.debug(f"update_cycle_counters: reject_cycles_already_finished_in_Orion: {reject_cycles_already_finished_in_Orion}")
-            self.reject_cycle_counter += reject_cycles_already_finished_in_Orion
-            self.id = job["id"]
-            self.parts_per_cycle = parts_per_cycle 
+        # only the necessary attributes are downloaded, without types and metadata
+        workstation = Orion.get(self.workstation_id, attrs=["refJob"], key_values=True)
+        self.logger.debug("fetch_cycle_counters: workstation: %s", workstation)
+        job = Orion.get(workstation["refJob"], attrs=["refOperation", "goodPartCounter", "rejectPartCounter"],
+                        key_values=True)
+        self.logger.debug("fetch_cycle_counters: job: %s", job)
+        operation = Orion.get(job["refOperation"], attrs=["partsPerCycle"], key_values=True)
+        self.logger.debug("fetch_cycle_counters: operation: %s", operation)
+        return job["id"], job["goodPartCounter"], job["rejectPartCounter"], operation["partsPerCycle"]
+
+    def reconcile(self):
+        """Initiate the counters from Orion, then write them to Orion
+
+        Called by the Reconciler until it returns True.
+        The cycles counted meanwhile were not written to Orion,
+        because the partsPerCycle was not known yet.
+
+        The counters are written without holding the lock, so the cycles
+        are still counted meanwhile. Until the write succeeds, has_unsent_cycles
+        stays True and count_cycle leaves the writing to the Reconciler,
+        so an older value never overwrites a newer one.
+
+        Returns:
+            True if the counters are initiated and written to Orion
+
+        Raises:
+            ValueError: if the Job's data is invalid, retrying does not help
+            RuntimeError: if Orion cannot be reached or an object does not exist,
+                the counters are written at the next attempt
+        """
+        if not self.are_counters_initiated_from_Orion:
+            counters = self.fetch_cycle_counters()
+            with self.lock:
+                if not self.are_counters_initiated_from_Orion:
+                    self.init_cycle_counters(*counters)
+        while True:
+            with self.lock:
+                if not self.has_unsent_cycles:
+                    return True
+                values = (self.good_cycle_counter, self.reject_cycle_counter)
+            self.update_part_counter("goodPartCounter", values[0])
+            self.update_part_counter("rejectPartCounter", values[1])
+            with self.lock:
+                # the cycles counted during the write are written in the next round
+                if values == (self.good_cycle_counter, self.reject_cycle_counter):
+                    self.has_unsent_cycles = False
+
+    def init_cycle_counters(self, job_id: str, good_part_counter: int, reject_part_counter: int, parts_per_cycle: int):
+        """Continue the cycle counters from the Job's part counters
+
+        The Job's part counters may already contain a lot of parts, so the cycles
+        finished in Orion are added to the cycles counted locally: if X good cycles
+        were counted before the counters could be read from Orion and Orion had
+        Y good cycles, the counter continues from X+Y. The same applies to the rejects.
+
+        Raises:
+            ValueError: if a part counter is not divisible by partsPerCycle
+        """
+        self.logger.debug("init_cycle_counters: job: %s, good_part_counter: %s, reject_part_counter: %s, "
+                          "parts_per_cycle: %s", job_id, good_part_counter, reject_part_counter, parts_per_cycle)
+        if good_part_counter % parts_per_cycle != 0:
+            raise ValueError(f"The goodPartCounter is not divisible by partsPerCycle for {job_id}. {good_part_counter} % {parts_per_cycle} != 0")
+        if reject_part_counter % parts_per_cycle != 0:
+            raise ValueError(f"The rejectPartCounter is not divisible by partsPerCycle for {job_id}. {reject_part_counter} % {parts_per_cycle} != 0")
+        # the counters are integers, a float would be sent to Orion
+        parts_per_cycle = int(parts_per_cycle)
+        good_cycles_already_finished_in_Orion = int(good_part_counter) // parts_per_cycle
+        self.logger.debug("init_cycle_counters: good_cycles_already_finished_in_Orion: %s", good_cycles_already_finished_in_Orion)
+        self.good_cycle_counter += good_cycles_already_finished_in_Orion
+        reject_cycles_already_finished_in_Orion = int(reject_part_counter) // parts_per_cycle
+        self.logger.debug("init_cycle_counters: reject_cycles_already_finished_in_Orion: %s", reject_cycles_already_finished_in_Orion)
+        self.reject_cycle_counter += reject_cycles_already_finished_in_Orion
+        self.id = job_id
+        self.parts_per_cycle = parts_per_cycle
+        self.are_counters_initiated_from_Orion = True
+        self.persist_cycle_counters()
+
+    def restore_cycle_counters(self):
+        """Continue the cycle counters persisted in the StateJournal before a restart
+
+        Returns True if the counters were restored"""
+        journal = StateJournal.journal
+        state = None if journal is None else journal.get(StateJournal.jobHandler_key(self.workstation_id))
+        if state is None:
+            return False
+        self.good_cycle_counter = state["good"]
+        self.reject_cycle_counter = state["reject"]
+        if state["job"] is not None:
+            self.id = state["job"]
+            self.parts_per_cycle = state["parts_per_cycle"]
             self.are_counters_initiated_from_Orion = True
-        except Exception as error:
-            self.logger.error(f"Error: initiating counters failed: {error}")
+        self.logger.info(f"Cycle counters restored for {self.workstation_id}: {state}")
+        return True
+
+    def persist_cycle_counters(self):
+        journal = StateJournal.journal
+        if journal is None:
+            return
+        initiated = self.are_counters_initiated_from_Orion
+        journal.record(StateJournal.jobHandler_key(self.workstation_id), {
+            "job": self.id if initiated else None,
+            "parts_per_cycle": self.parts_per_cycle if initiated else None,
+            "good": self.good_cycle_counter,
+            "reject": self.reject_cycle_counter,
+        })
 
     def update_part_counter(self, counter_name: str, cycle_counter_value: int):
         try:
@@ -116,23 +208,141 @@ class JobHandler(OrionObject):
         except RuntimeError as error:
             raise RuntimeError(f"Error: could not update counters: {error}") from error
 
-    def add_already_finished_cycle_counters_if_necessary_and_possible(self):
-        if (not self.are_counters_initiated_from_Orion 
-            and Orion.is_reachable()):
-            self.update_cycle_counters()
+    def count_cycle(self, counter_name: str):
+        """Count a cycle locally and write the part counter to Orion
+
+        Never waits for the reconciliation with Orion: until the counters
+        are initiated, the JobHandler is only scheduled in the Reconciler,
+        which writes the counters to Orion after initiating them.
+        If the CycleFlusher is enabled, the part counter is only written
+        when the CycleFlusher decides so.
+        """
+        flusher = CycleFlusher.flusher
+        flush_now = False
+        with self.lock:
+            if counter_name == "goodPartCounter":
+                self.good_cycle_counter += 1
+                cycle_counter_value = self.good_cycle_counter
+            else:
+                self.reject_cycle_counter += 1
+                cycle_counter_value = self.reject_cycle_counter
+            self.persist_cycle_counters()
+            # until the Reconciler wrote the counters, it writes the new cycles too
+            initiated = self.are_counters_initiated_from_Orion and not self.has_unsent_cycles
+            if not initiated:
+                self.has_unsent_cycles = True
+            elif flusher is not None:
+                if self.unflushed_cycles == 0:
+                    self.first_unflushed_time = time.monotonic()
+                self.unflushed_cycles += 1
+                self.unflushed_counters.add(counter_name)
+                flush_now = flusher.add_cycle(self, self.unflushed_cycles, self.first_unflushed_time)
+        if not initiated:
+            reconciler.schedule(self)
+            return
+        if flusher is None:
+            self.update_part_counter(counter_name=counter_name, cycle_counter_value=cycle_counter_value)
+        elif flush_now:
+            self.flush_cycles()
+
+    def flush_cycles(self):
+        """Write the part counters changed since the last flush
+
+        Called by the CycleFlusher, when the Workstation is turned off
+        and before a new Job is started. Does nothing if every cycle is written already.
+        If a write fails, the counters not written are marked unflushed again
+        and the JobHandler is rescheduled in the CycleFlusher, then the error is raised.
+        """
+        flusher = CycleFlusher.flusher
+        with self.flush_lock:
+            with self.lock:
+                if self.unflushed_cycles == 0:
+                    return
+                values = {"goodPartCounter": self.good_cycle_counter, "rejectPartCounter": self.reject_cycle_counter}
+                counters = {name: values[name] for name in self.unflushed_counters}
+                unflushed_cycles = self.unflushed_cycles
+                first_unflushed_time = self.first_unflushed_time
+                self.unflushed_cycles = 0
+                self.unflushed_counters = set()
+                self.first_unflushed_time = None
+                if flusher is not None:
+                    flusher.discard(self)
+            written = set()
+            try:
+                for counter_name, cycle_counter_value in counters.items():
+                    self.update_part_counter(counter_name=counter_name, cycle_counter_value=cycle_counter_value)
+                    written.add(counter_name)
+            except Exception:
+                self.restore_unflushed_cycles(set(counters) - written, unflushed_cycles, first_unflushed_time)
+                raise
+            if flusher is not None:
+                flusher.record_flush(first_unflushed_time)
+
+    def restore_unflushed_cycles(self, counter_names: set, unflushed_cycles: int, first_unflushed_time: float):
+        """Mark the counters of a failed flush unflushed again, so the next flush writes them"""
+        flusher = CycleFlusher.flusher
+        with self.lock:
+            # the cycles counted during the failed write are unflushed already
+            self.unflushed_counters |= counter_names
+            self.unflushed_cycles += unflushed_cycles
+            if self.first_unflushed_time is None or first_unflushed_time < self.first_unflushed_time:
+                self.first_unflushed_time = first_unflushed_time
+            if flusher is not None:
+                flusher.reschedule(self)
 
     def handle_good_cycle(self):
         self.logger.info("Good cycle completed")
-        self.add_already_finished_cycle_counters_if_necessary_and_possible()
-        self.good_cycle_counter += 1
-        self.update_part_counter(counter_name="goodPartCounter",
-                                 cycle_counter_value=self.good_cycle_counter)
+        self.count_cycle("goodPartCounter")
 
     def handle_reject_cycle(self):
         self.logger.info("Reject cycle completed")
-        self.add_already_finished_cycle_counters_if_necessary_and_possible()
-        self.reject_cycle_counter += 1
-        self.update_part_counter(counter_name="rejectPartCounter",
-                                 cycle_counter_value=self.reject_cycle_counter)
+        self.count_cycle("rejectPartCounter")
+
+
+def fetch_jobHandlers(workstation_ids):
+    """Create the JobHandlers of many Workstations with bulk queries
+
+    Instead of 3 GET requests per Workstation, the Workstations, their Jobs
+    and the Jobs' Operations are queried in 3 bulk requests in total
+    (see Orion.query), downloading only the necessary attributes in keyValues format.
 
+    The counters persisted in the StateJournal are restored first,
+    these are kept if the Workstation's Job did not change.
+    The counters of a JobHandler whose objects could not be queried
+    are initiated later in the background, after its first cycle, see Reconciler.
 
+    Args:
+        workstation_ids: an iterable containing the Workstation ids
+
+    Returns:
+        A dict of the JobHandlers: {workstation_id: jobHandler}
+    """
+    jobHandlers = {workstation_id: JobHandler(workstation_id, fetch=False, restore=True)
+                   for workstation_id in workstation_ids}
+    if not jobHandlers:
+        return jobHandlers
+    try:
+        workstations = Orion.query(jobHandlers.keys(), attrs=["refJob"], key_values=True)
+        job_ids = [workstation["refJob"] for workstation in workstations.values() if "refJob" in workstation]
+        jobs = Orion.query(job_ids, attrs=["refOperation", "goodPartCounter", "rejectPartCounter"], key_values=True)
+        operation_ids = [job["refOperation"] for job in jobs.values() if "refOperation" in job]
+        operations = Orion.query(operation_ids, attrs=["partsPerCycle"], key_values=True)
+    except (RuntimeError, ValueError) as error:
+        logger.error(f"Error: fetching the Jobs failed: {error}")
+        workstations, jobs, operations = {}, {}, {}
+    for workstation_id, jobHandler in list(jobHandlers.items()):
+        try:
+            job = jobs[workstations[workstation_id]["refJob"]]
+            if jobHandler.are_counters_initiated_from_Orion:
+                if jobHandler.id == job["id"]:
+                    # the restored counters are at least as new as Orion's
+                    continue
+                # the Job changed while the service was not running
+                jobHandler = JobHandler(workstation_id, fetch=False)
+                jobHandlers[workstation_id] = jobHandler
+            operation = operations[job["refOperation"]]
+            jobHandler.init_cycle_counters(job["id"], job["goodPartCounter"], job["rejectPartCounter"],
+                                           operation["partsPerCycle"])
+        except Exception as error:
+            logger.error(f"Error: initiating counters failed for {workstation_id}: {error}")
+    return jobHandlers
@@ -19,11 +19,30 @@ LOG_TO_FILE:
 LOG_TO_STDOUT:
     TRUE*
     FALSE
+
+LOG_FILE_MAX_BYTES:
+    the size of the log file when it is rotated, 10485760* (10 MiB)
+    0 means that the log file is never rotated
+
+LOG_FILE_BACKUP_COUNT:
+    the number of rotated log files kept, 3*
+
+The loggers do not write the records themselves: each logger has the same
+QueueHandler that puts the record into a queue, and a single background
+QueueListener formats and writes the records. This way the serial reader
+and the dispatch workers never wait for the disk or the terminal.
+Log with %-style arguments on the hot paths, for example
+    logger.debug("update: data: %s", data)
+so the message is only built if the level is enabled.
 """
 # Standard Library imports
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import threading
 
 # get environment variables
 # if they are missing, set default values
@@ -47,6 +66,90 @@ elif LOG_TO_STDOUT.lower() == "false":
 else:
     LOG_TO_STDOUT = True
 
+LOG_FILE_MAX_BYTES = os.environ.get("LOG_FILE_MAX_BYTES")
+if LOG_FILE_MAX_BYTES is None:
+    LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+else:
+    LOG_FILE_MAX_BYTES = int(LOG_FILE_MAX_BYTES)
+
+LOG_FILE_BACKUP_COUNT = os.environ.get("LOG_FILE_BACKUP_COUNT")
+if LOG_FILE_BACKUP_COUNT is None:
+    LOG_FILE_BACKUP_COUNT = 3
+else:
+    LOG_FILE_BACKUP_COUNT = int(LOG_FILE_BACKUP_COUNT)
+
+logging_levels = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that leaves the formatting to the QueueListener's thread
+
+    The standard QueueHandler formats the whole record (including the time)
+    in the logging thread. Only the parts that cannot be done later are done here:
+    the message is merged with its arguments, because they may change meanwhile,
+    and the traceback is rendered to text.
+    """
+
+    def prepare(self, record: logging.LogRecord):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def make_handlers():
+    formatter = logging.Formatter("%(asctime)s:%(name)s:%(message)s")
+    handlers = []
+    if LOG_TO_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            f"{__name__}.log", maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT))
+    if LOG_TO_STDOUT:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+# all loggers share the same queue and QueueHandler
+log_queue = queue.SimpleQueue()
+queue_handler = LazyQueueHandler(log_queue)
+# the background writer is started when the first logger is requested
+listener = None
+lock = threading.Lock()
+
+
+def start():
+    """Start the background writer if it is not running and return the shared QueueHandler"""
+    global listener
+    with lock:
+        if listener is None:
+            listener = logging.handlers.QueueListener(log_queue, *make_handlers())
+            listener.start()
+        return queue_handler
+
+
+def stop():
+    """Write the queued records, then stop the background writer"""
+    global listener
+    with lock:
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+            listener = None
+
+
+# the records queued before exiting are written
+atexit.register(stop)
+
 
 def getLogger(name: str):
     """Return a configured logger
@@ -57,22 +160,10 @@ def getLogger(name: str):
     Returns:
         A logger for a specific file.
     """
-    logging_levels = {
-        "DEBUG": logging.DEBUG,
-        "INFO": logging.INFO,
-        "WARNING": logging.WARNING,
-        "ERROR": logging.ERROR,
-        "CRITICAL": logging.CRITICAL,
-    }
     logger = logging.getLogger(name)
-    formatter = logging.Formatter("%(asctime)s:%(name)s:%(message)s")
     logger.setLevel(logging_levels[LOGGING_LEVEL])
-    if LOG_TO_FILE:
-        file_handler = logging.FileHandler(f"{__name__}.log")
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    if LOG_TO_STDOUT:
-        stream_handler = logging.StreamHandler(sys.stdout)
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(stream_handler)
+    handler = start()
+    # a logger requested several times (for example by every JobHandler) gets the handler only once
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
     return logger
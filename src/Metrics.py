@@ -0,0 +1,168 @@
+"""Metrics
+
+Latency histograms and counters of the pipeline stages in Prometheus format
+
+The time between an Arduino edge and the Orion update is spent in stages:
+the serial read, the parsing of the JSON frames, the dispatch of the command
+(CommandHandler.handle_command) and the HTTP calls (Orion.update_attribute
+and post_to_IoT_agent). If METRICS_PORT is set, the duration of each stage
+is recorded in a histogram with fixed buckets. The dispatch histograms are
+labelled with the command type and the object, so their _count is the number
+of events per command type and per object. The failures are counted too.
+A small HTTP server serves the metrics on http://<host>:METRICS_PORT/metrics
+in the Prometheus text format.
+
+If METRICS_PORT is not set, metrics is None, and each instrumented stage
+only checks that, so the instrumentation costs nothing.
+
+Environment variables:
+    METRICS_PORT: the port of the metrics endpoint. Default: not set, no metrics are recorded
+"""
+
+# Standard Library imports
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+METRICS_PORT = os.environ.get("METRICS_PORT")
+if METRICS_PORT is not None:
+    METRICS_PORT = int(METRICS_PORT)
+
+# the upper bounds of the histogram buckets in seconds, from 100 us to 10 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = "rpi_commands"
+HELP = {
+    "stage_duration_seconds": "The duration of the pipeline stages",
+    "errors_total": "The number of failed stages",
+    "serial_bytes_total": "The number of bytes read from the serial devices",
+}
+
+
+def format_labels(labels: tuple, extra: str = ""):
+    parts = [f'{name}="{str(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics():
+    """Thread-safe registry of fixed-bucket histograms and counters
+
+    The labels are given as a tuple of (name, value) pairs,
+    for example (("stage", "dispatch"), ("type", "turn_on"), ("object", object_id)).
+
+    Attributes:
+        histograms (dict): {labels: [bucket counts..., +Inf count, sum]}
+        counters (dict): {(name, labels): value}
+
+    Usage:
+        __init__:
+            metrics = Metrics()
+
+        observe(labels, seconds):
+            record the duration of a stage
+
+        increment(name, labels, value=1):
+            increase a counter
+
+        render():
+            return all metrics in the Prometheus text format
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def observe(self, labels: tuple, seconds: float):
+        index = bisect_left(self.buckets, seconds)
+        with self.lock:
+            histogram = self.histograms.get(labels)
+            if histogram is None:
+                histogram = self.histograms[labels] = [0] * (len(self.buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def increment(self, name: str, labels: tuple, value: float = 1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        with self.lock:
+            histograms = {labels: list(histogram) for labels, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        name = f"{PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} {HELP['stage_duration_seconds']}", f"# TYPE {name} histogram"]
+        for labels, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{format_labels(labels, le)} {cumulative}")
+            cumulative += histogram[-2]
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{format_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        for counter_name in sorted({counter_name for counter_name, _ in counters}):
+            name = f"{PREFIX}_{counter_name}"
+            lines.append(f"# HELP {name} {HELP.get(counter_name, counter_name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (other_name, labels), value in sorted(counters.items()):
+                if other_name == counter_name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def make_handler(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start_server(self, port: int = METRICS_PORT):
+        """Serve the metrics on http://<host>:port/metrics in a background thread, return the port"""
+        self.server = ThreadingHTTPServer(("", port), self.make_handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="Metrics", daemon=True).start()
+        port = self.server.server_address[1]
+        logger.info(f"Metrics served on port {port}")
+        return port
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+metrics = None
+if METRICS_PORT is not None:
+    metrics = Metrics()
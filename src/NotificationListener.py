@@ -0,0 +1,162 @@
+"""NotificationListener
+
+Receives the notifications of an Orion subscription
+
+The listener is a small HTTP server running in a background thread.
+It subscribes to the changes of the Workstations' refJob attribute.
+Whenever Orion notifies a change, the changed objects are invalidated
+in the EntityCache, then the on_change callback is called with each
+notified object (in keyValues format), for example to reset
+the JobHandler of the Workstation without a new_job command.
+
+Orion must be able to reach the listener, so the address of this device
+must be given, the listener only listens on that address.
+The subscription is deleted when the listener stops, at the latest at exit.
+The subscriptions to the same URL left by a killed previous run
+are deleted before subscribing, so they do not pile up in Orion.
+
+Environment variables:
+    NOTIFICATION_HOST: the address of this device that Orion can reach.
+        Default: not set, there is no subscription
+    NOTIFICATION_PORT: the port of the listener. Default: 8765
+"""
+
+# Standard Library imports
+import atexit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+
+# PyPI imports
+
+# Custom imports
+from ErrorAggregator import errors
+from Logger import getLogger
+import Orion
+
+logger = getLogger(__name__)
+
+# environment variables
+NOTIFICATION_HOST = os.environ.get("NOTIFICATION_HOST")
+
+NOTIFICATION_PORT = os.environ.get("NOTIFICATION_PORT")
+if NOTIFICATION_PORT is None:
+    NOTIFICATION_PORT = 8765
+else:
+    NOTIFICATION_PORT = int(NOTIFICATION_PORT)
+
+
+class NotificationListener():
+    """Embedded HTTP server receiving the Orion notifications
+
+    Attributes:
+        on_change (callable): called with each notified object
+        host (str): the address the listener listens on, Orion must be able to reach it
+        server (ThreadingHTTPServer): the HTTP server
+        port (int): the port of the listener
+        subscription_ids (list): the ids of the subscriptions made by the listener
+        notifications (int): the number of notifications received
+
+    Usage:
+        __init__:
+            listener = NotificationListener(on_change)
+
+        start():
+            start serving in a background thread
+
+        subscribe(object_ids, attrs):
+            subscribe to the changes of the objects' attributes
+
+        stop():
+            delete the subscriptions, then stop the server, it is also called at exit
+    """
+
+    def __init__(self, on_change, port: int = NOTIFICATION_PORT, host: str = NOTIFICATION_HOST):
+        self.on_change = on_change
+        # without a reachable address, only the local clients can notify
+        self.host = "127.0.0.1" if host is None else host
+        self.server = ThreadingHTTPServer((self.host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.subscription_ids = []
+        self.notifications = 0
+        self.thread = None
+        self.stopped = False
+
+    def make_handler(self):
+        listener = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    notification = json.loads(self.rfile.read(length))
+                    listener.handle_notification(notification)
+                    status = 204
+                except Exception as error:
+                    errors.report(logger, error, "Invalid notification: ")
+                    status = 400
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+    def handle_notification(self, notification: dict):
+        logger.debug("Notification: %s", notification)
+        self.notifications += 1
+        for object in notification["data"]:
+            Orion.invalidate(object["id"])
+            try:
+                self.on_change(object)
+            except Exception as error:
+                errors.report(logger, error, f"Handling the notification of {object['id']} failed: ")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="NotificationListener", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        logger.info(f"NotificationListener started on {self.host}:{self.port}")
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/notify"
+
+    def delete_stale_subscriptions(self):
+        """Delete the subscriptions to this listener's URL, left by a previous run"""
+        for subscription in Orion.get_subscriptions():
+            url = subscription.get("notification", {}).get("http", {}).get("url")
+            if url == self.url and subscription["id"] not in self.subscription_ids:
+                Orion.unsubscribe(subscription["id"])
+                logger.info(f"Deleted a stale subscription: {subscription['id']}")
+
+    def subscribe(self, object_ids, attrs: list):
+        if not self.subscription_ids:
+            try:
+                self.delete_stale_subscriptions()
+            except Exception as error:
+                logger.warning(f"Could not delete the stale subscriptions: {error}")
+        subscription_id = Orion.subscribe(object_ids, attrs, self.url)
+        self.subscription_ids.append(subscription_id)
+        logger.info(f"Subscribed to {attrs} of {len(object_ids)} objects: {subscription_id}")
+        return subscription_id
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        atexit.unregister(self.stop)
+        for subscription_id in self.subscription_ids:
+            try:
+                Orion.unsubscribe(subscription_id)
+            except Exception as error:
+                logger.error(f"{error}")
+        self.subscription_ids = []
+        self.server.shutdown()
+        self.server.server_close()
+        logger.info(f"NotificationListener stopped: notifications: {self.notifications}")
@@ -4,6 +4,12 @@ A set of modules for interacting with the Orion broker
 
 The Orion host and port are read from the environment variables
 
+All requests are sent over the pooled, keep-alive OrionClient,
+see OrionClient.py for the pool size and timeout settings
+
+If the EntityCache is enabled, the downloaded objects are cached
+and every write invalidates the written objects, see EntityCache.py
+
 Environment variables:
     ORION_HOST: the URL of the Orion broker
     ORION_PORT: the port of the Orion broker
@@ -12,7 +18,10 @@ Raises:
     RuntimeError: if the Orion_HOST is not set
 """
 # Standard Library imports
+from concurrent.futures import ThreadPoolExecutor
 import os
+import random
+import time
 
 # PyPI packages
 import requests
@@ -20,6 +29,9 @@ import requests
 # Custom imports
 # from modules.log_it import log_it
 from Logger import getLogger
+from OrionClient import client, HTTP_POOL_SIZE, HTTPStatusError
+import EntityCache
+import Metrics
 
 logger_Orion = getLogger(__name__)
 
@@ -36,12 +48,25 @@ if ORION_PORT is None:
     )
     ORION_PORT = default_port
 
+# the maximum number of entities queried in one /v2/op/query request
+# Orion's maximum page size is 1000, smaller chunks are sent concurrently
+QUERY_CHUNK_SIZE = 100
+# the readiness probe's first and longest wait between 2 probes in seconds
+PROBE_BACKOFF_BASE = 0.5
+PROBE_BACKOFF_MAX = 5
+
+# the ids of the objects that are confirmed to exist in Orion
+# filled at startup by confirm_known_entities and by every successful get,
+# so that the attribute updates do not need to check existence again
+known_entities = set()
 
-def getRequest(url: str):
+
+def getRequest(url: str, params: dict = None):
     """Send a GET request to Orion
 
     Args:
         url (str): any Orion that is suitable for GET requests
+        params (dict): the query parameters of the request
 
     Returns:
         the response status code and the json
@@ -51,19 +76,27 @@ def getRequest(url: str):
         ValueError: if the json parsing fails
     """
     try:
-        response = requests.get(url)
-        response.close()
+        response = client.get(url, params=params)
     except Exception as error:
         raise RuntimeError(f"Get request failed to URL: {url}") from error
 
     else:
         try:
-            response.json()
+            json_ = response.json()
         except requests.exceptions.JSONDecodeError as error:
             raise ValueError(
                 f"The JSON could not be decoded after GET request to {url}. Response:\n{response}"
             ) from error
-        return response.status_code, response.json()
+        return response.status_code, json_
+
+def projection_params(attrs: list = None, key_values: bool = False):
+    """Return the query parameters that select the attributes and the format of the objects"""
+    params = {}
+    if attrs is not None:
+        params["attrs"] = ",".join(attrs)
+    if key_values:
+        params["options"] = "keyValues"
+    return params
 
 def is_reachable():
     """Return True if the OCB is reachable, False otherwise
@@ -84,13 +117,50 @@ def is_reachable():
         logger_Orion.error(f"Error while trying to reach Orion: {error}")
         return False
 
-def get(object_id: str, host: str=ORION_HOST, port: int =ORION_PORT):
+def wait_until_reachable(max_wait: float):
+    """Probe Orion until it is reachable, waiting more and more between the probes
+
+    Replaces a fixed sleep at startup: the service starts as soon as Orion answers.
+
+    Args:
+        max_wait (float): the longest time to wait in seconds
+
+    Returns:
+        True if Orion became reachable, False if max_wait elapsed
+    """
+    deadline = time.monotonic() + max_wait
+    wait = PROBE_BACKOFF_BASE
+    while True:
+        if is_reachable():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger_Orion.error(f"Orion is not reachable after {max_wait} s")
+            return False
+        time.sleep(min(remaining, wait * random.uniform(0.5, 1)))
+        wait = min(PROBE_BACKOFF_MAX, wait * 2)
+
+def cache_variant(attrs: list = None, key_values: bool = False):
+    """Return the EntityCache variant of an object downloaded with these options"""
+    return (None if attrs is None else tuple(attrs), key_values)
+
+def invalidate(object_id: str):
+    """Forget the cached variants of an object, if the EntityCache is enabled"""
+    cache = EntityCache.cache
+    if cache is not None:
+        cache.invalidate(object_id)
+
+def get(object_id: str, host: str=None, port: int=None, attrs: list=None, key_values: bool=False):
     """Get an object from Orion identified by the ID
 
     Args:
         object_id (str): the Orion object id
         host (str): Orion host. Default: ORION_HOST environment variable
         port (int): Orion port. Default: ORION_PORT environment variable
+        attrs (list): if set, only these attributes are downloaded
+        key_values (bool): if True, the object is downloaded in keyValues format:
+            {"id": ..., "type": ..., "counter": 1} instead of
+            {"id": ..., "type": ..., "counter": {"type": "Number", "value": 1, "metadata": {}}}
 
     Returns:
         The object in JSON format idenfitied by object_id
@@ -98,13 +168,28 @@ def get(object_id: str, host: str=ORION_HOST, port: int =ORION_PORT):
     Raises:
         RuntimeError: if the get request's status code is not 200
     """
+    # only the objects of the default Orion broker are cached
+    cache = EntityCache.cache if host is None and port is None else None
+    if cache is not None and not cache.is_cacheable(attrs):
+        cache = None
+    if cache is not None:
+        cached = cache.get(object_id, cache_variant(attrs, key_values))
+        if cached is not None:
+            return cached
+    if host is None:
+        host = ORION_HOST
+    if port is None:
+        port = ORION_PORT
     url = f"http://{host}:{port}/v2/entities/{object_id}"
-    logger_Orion.debug(f"Get: {url}")
-    status_code, json_ = getRequest(url)
+    logger_Orion.debug("Get: %s", url)
+    status_code, json_ = getRequest(url, projection_params(attrs, key_values))
     if status_code != 200:
         raise RuntimeError(
             f"Failed to get object from Orion broker:{object_id}, status_code:{status_code}; no OEE data"
         )
+    known_entities.add(object_id)
+    if cache is not None:
+        cache.put(object_id, json_, cache_variant(attrs, key_values))
     return json_
 
 
@@ -119,23 +204,125 @@ def exists(object_id: str):
         False otherwise.
     """
     try:
-        get(object_id)
+        # only the id is needed: "id" is not an attribute, so no attribute is downloaded
+        get(object_id, attrs=["id"], key_values=True)
         return True
     except RuntimeError:
         return False
 
 
-def getWorkstations():
+def query_chunk(object_ids: list, attrs: list = None, key_values: bool = False):
+    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/op/query"
+    data = {"entities": [{"id": object_id} for object_id in object_ids]}
+    if attrs is not None:
+        data["attrs"] = list(attrs)
+    params = {"limit": len(object_ids)}
+    params.update(projection_params(key_values=key_values))
+    logger_Orion.debug("query: url: %s, data: %s", url, data)
+    try:
+        response = client.post(url, json=data, params=params)
+    except Exception as error:
+        raise RuntimeError(f"Query request failed to URL: {url}") from error
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Failed to query objects from Orion broker, status_code:{response.status_code}"
+        )
+    try:
+        return response.json()
+    except requests.exceptions.JSONDecodeError as error:
+        raise ValueError(
+            f"The JSON could not be decoded after POST request to {url}. Response:\n{response}"
+        ) from error
+
+
+def query(object_ids, attrs: list = None, key_values: bool = False):
+    """Get many objects from Orion in bulk
+
+    The objects are queried with POST /v2/op/query requests,
+    each containing at most QUERY_CHUNK_SIZE ids. The chunks are sent concurrently.
+    More information:
+    https://fiware-orion.readthedocs.io/en/master/orion-api.html#query-post-v2opquery
+
+    Args:
+        object_ids: an iterable containing Orion object ids
+        attrs (list): if set, only these attributes are downloaded
+        key_values (bool): if True, the attributes are downloaded
+            in keyValues format (only the values, without types and metadata)
+
+    Returns:
+        A dict of the found objects: {object_id: object}
+        The objects that do not exist are missing from the dict.
+
+    Raises:
+        RuntimeError: if any of the requests fails or its status code is not 200
+    """
+    object_ids = list(dict.fromkeys(object_ids))
+    chunks = [object_ids[i:i + QUERY_CHUNK_SIZE] for i in range(0, len(object_ids), QUERY_CHUNK_SIZE)]
+    if len(chunks) <= 1:
+        results = [query_chunk(chunk, attrs, key_values) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), HTTP_POOL_SIZE)) as executor:
+            results = list(executor.map(lambda chunk: query_chunk(chunk, attrs, key_values), chunks))
+    objects = {}
+    for result in results:
+        for object in result:
+            objects[object["id"]] = object
+    known_entities.update(objects.keys())
+    cache = EntityCache.cache
+    if cache is not None and cache.is_cacheable(attrs):
+        for object_id, object in objects.items():
+            cache.put(object_id, object, cache_variant(attrs, key_values))
+    return objects
+
+
+def is_known(object_id: str):
+    """Return True if the object is confirmed to exist in Orion, False otherwise"""
+    return object_id in known_entities
+
+
+def confirm_known_entities(object_ids):
+    """Confirm the existence of the objects once, at startup
+
+    The objects are queried in bulk, see query.
+    The existing objects are stored in the known_entities set.
+
+    Args:
+        object_ids: an iterable containing Orion object ids
+
+    Returns:
+        A list of the object ids that could not be confirmed
+    """
+    object_ids = list(object_ids)
+    try:
+        # only the ids are needed: "id" is not an attribute, so no attribute is downloaded
+        found = query(object_ids, attrs=["id"], key_values=True)
+    except (RuntimeError, ValueError) as error:
+        logger_Orion.error(f"Could not confirm the objects: {error}")
+        found = {}
+    missing = [object_id for object_id in object_ids if object_id not in found]
+    for object_id in missing:
+        logger_Orion.warning(f"Object {object_id} does not exist in Orion or Orion is unreachable")
+    return missing
+
+
+def getWorkstations(attrs: list = None, key_values: bool = False):
     """Download all Workstation objects at once from Orion
 
+    Args:
+        attrs (list): if set, only these attributes are downloaded
+        key_values (bool): if True, the objects are downloaded in keyValues format,
+            see get
+
     Returns:
         A list of the Workstation objects
 
     Raises:
         RuntimeError: if the get request's status_code is not 200
     """
-    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/entities?type=i40Asset&q=i40AssetType==Workstation"
-    status_code, workstations = getRequest(url)
+    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/entities"
+    params = {"type": "i40Asset", "q": "i40AssetType==Workstation"}
+    params.update(projection_params(attrs, key_values))
+    status_code, workstations = getRequest(url, params)
     if status_code != 200:
         raise RuntimeError(
             f"Critical: could not get Workstations from Orion with GET request to URL: {url}"
@@ -156,67 +343,171 @@ def update(objects: list):
 
     Raises:
         TypeError: if the objects does not contain an iterable
-        RuntimeError: if the POST request's status code is not 204
+        HTTPStatusError: if the POST request's status code is not 204
     """
-    logger_Orion.debug(f"update: objects: {objects}")
+    logger_Orion.debug("update: objects: %s", objects)
     url = f"http://{ORION_HOST}:{ORION_PORT}/v2/op/update"
     try:
         data = {"actionType": "append", "entities": list(objects)}
-        logger_Orion.debug(f"update: data: {data}")
+        logger_Orion.debug("update: data: %s", data)
     except TypeError as error:
         raise TypeError(
             f"The objects {objects} are not iterable, cannot make a list. Please, provide an iterable object"
         ) from error
-    response = requests.post(url, json=data)
+    response = client.post(url, json=data)
+    for object in data["entities"]:
+        invalidate(object["id"])
     if response.status_code != 204:
-        raise RuntimeError(
-            f"Failed to update objects in Orion.\nStatus_code: {response.status_code}\nObjects:\n{objects}"
+        raise HTTPStatusError(
+            f"Failed to update objects in Orion.\nStatus_code: {response.status_code}\nObjects:\n{objects}",
+            response.status_code
         )
     else:
         return response.status_code
 
-def update_attribute(object_id: str, attribute_name: str, attribute_type: str, attribute_value):
+def update_attribute(object_id: str, attribute_name: str, attribute_type: str, attribute_value, metadata: dict = None):
     """Updates the object's given attribute in Orion
 
     This method takes an object id and an attribute name and value pair
     then updates the specified attribute with the given value in Orion.
-    If the attribute already exists, it will be overwritten. More information:
-    https://github.com/FIWARE/tutorials.CRUD-Operations#batch-create-new-data-entities-or-attributes
+    If the attribute already exists, it will be overwritten.
+    See update_attributes for more information.
 
     Args:
         object_id (str): the object's id in Orion
         attribute_name (str): the specified attribute's name
         attribute_type (str): the specified attribute's type
         attribute_value (string or dict): the specified attribute's new value
+        metadata (dict): the attribute's metadata in NGSIv2 format like
+            {"TimeInstant": {"type": "DateTime", "value": "2026-10-18T08:00:00.123Z"}}, optional
 
     Raises:
-        RuntimeError: if the POST request's status code is not 204
+        RuntimeError: if the object does not exist
+            or the POST request's status code is not 204
     """
-    logger_Orion.debug(f"""update_attribute:
-object_id: {object_id}
-attribute_name: {attribute_name}
-attribute_value: {attribute_value}""")
-    if not exists(object_id=object_id):
-        raise RuntimeError(f"Object {object_id} does not exist")
-    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/op/update"
-    logger_Orion.debug(f"update_attribute: url: {url}")
-    payload = {
-        "id": object_id,
+    logger_Orion.debug("update_attribute:\nobject_id: %s\nattribute_name: %s\nattribute_value: %s",
+                       object_id, attribute_name, attribute_value)
+    attributes = {
         attribute_name: {
             "type": attribute_type,
             "value": attribute_value
             }
         }
-    data = {
-        "actionType": "append",
-        "entities": [payload]
-        }
-    logger_Orion.debug(f"update_attribute: data: {data}")
-    response = requests.post(url, json=data)
+    if metadata is not None:
+        attributes[attribute_name]["metadata"] = metadata
+    metrics = Metrics.metrics
+    if metrics is None:
+        return update_attributes(object_id, attributes)
+    labels = (("stage", "orion_update"), ("object", object_id))
+    start = time.perf_counter()
+    try:
+        return update_attributes(object_id, attributes)
+    except Exception:
+        metrics.increment("errors_total", labels)
+        raise
+    finally:
+        metrics.observe(labels, time.perf_counter() - start)
+
+def update_attributes(object_id: str, attributes: dict):
+    """Updates several attributes of an object in Orion in one request
+
+    If an attribute already exists, it will be overwritten,
+    otherwise it will be appended to the object. More information:
+    https://fiware-orion.readthedocs.io/en/master/orion-api.html#update-or-append-entity-attributes-post-v2entitiesidattrs
+
+    The existence of the object is not checked beforehand: Orion answers
+    with 404 if the object does not exist, so a single request is sent.
+
+    Args:
+        object_id (str): the object's id in Orion
+        attributes (dict): the attributes in NGSIv2 format like
+            {"counter": {"type": "Number", "value": 1}}
+
+    Raises:
+        HTTPStatusError: if the object does not exist
+            or the POST request's status code is not 204
+    """
+    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/entities/{object_id}/attrs"
+    logger_Orion.debug("update_attributes: url: %s", url)
+    logger_Orion.debug("update_attributes: data: %s", attributes)
+    response = client.post(url, json=attributes)
+    invalidate(object_id)
+    if response.status_code == 404:
+        known_entities.discard(object_id)
+        raise HTTPStatusError(f"Object {object_id} does not exist", response.status_code)
     if response.status_code != 204:
-        raise RuntimeError(
-            f"Failed to update attribute in Orion. Status_code: {response.status_code}"
+        raise HTTPStatusError(
+            f"Failed to update attribute in Orion. Status_code: {response.status_code}", response.status_code
         )
     else:
+        known_entities.add(object_id)
         return response.status_code
 
+
+def subscribe(object_ids, attrs: list, notification_url: str, description: str = "rpi_commands"):
+    """Subscribe to the changes of the objects' attributes
+
+    Orion sends a notification in keyValues format to notification_url
+    whenever any of the attributes changes. More information:
+    https://fiware-orion.readthedocs.io/en/master/orion-api.html#subscriptions
+
+    Args:
+        object_ids: an iterable containing Orion object ids
+        attrs (list): the watched attributes, these are also notified
+        notification_url (str): the URL of the NotificationListener
+        description (str): the description of the subscription
+
+    Returns:
+        The id of the subscription
+
+    Raises:
+        RuntimeError: if the POST request's status code is not 201
+    """
+    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/subscriptions"
+    data = {
+        "description": description,
+        "subject": {
+            "entities": [{"id": object_id} for object_id in object_ids],
+            "condition": {"attrs": list(attrs)},
+        },
+        "notification": {
+            "http": {"url": notification_url},
+            "attrs": list(attrs),
+            "attrsFormat": "keyValues",
+        },
+    }
+    logger_Orion.debug("subscribe: data: %s", data)
+    response = client.post(url, json=data)
+    if response.status_code != 201:
+        raise RuntimeError(
+            f"Failed to subscribe in Orion. Status_code: {response.status_code}"
+        )
+    # Location: /v2/subscriptions/<subscription id>
+    return response.headers["Location"].rsplit("/", 1)[-1]
+
+def get_subscriptions():
+    """Return the subscriptions in Orion as a list
+
+    Raises:
+        RuntimeError: if the GET request's status code is not 200
+    """
+    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/subscriptions"
+    response = client.get(url, params={"limit": 1000})
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Failed to get the subscriptions from Orion. Status_code: {response.status_code}"
+        )
+    return response.json()
+
+def unsubscribe(subscription_id: str):
+    """Delete a subscription
+
+    Raises:
+        RuntimeError: if the DELETE request's status code is not 204
+    """
+    url = f"http://{ORION_HOST}:{ORION_PORT}/v2/subscriptions/{subscription_id}"
+    response = client.delete(url)
+    if response.status_code != 204:
+        raise RuntimeError(
+            f"Failed to delete subscription {subscription_id} in Orion. Status_code: {response.status_code}"
+        )
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+A pooled, keep-alive HTTP client for the Orion broker and the IoT agent
+
+The module level requests.get and requests.post functions open
+a new TCP connection for every request. The OrionClient keeps
+a requests.Session with a connection pool instead, so consecutive
+requests to the same host reuse the kept-alive connections.
+
+All modules share the module level client, so the Orion broker and
+the IoT agent requests are sent over the same pool.
+
+Environment variables:
+    HTTP_POOL_SIZE: the maximum number of kept-alive connections per host. Default: 4
+    TIMEOUT: the timeout of the HTTP requests in seconds. Default: 5
+"""
+# Standard Library imports
+import os
+
+# PyPI packages
+import requests
+from requests.adapters import HTTPAdapter
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+HTTP_POOL_SIZE = os.environ.get("HTTP_POOL_SIZE")
+if HTTP_POOL_SIZE is None:
+    HTTP_POOL_SIZE = 4
+else:
+    HTTP_POOL_SIZE = int(HTTP_POOL_SIZE)
+
+TIMEOUT = os.environ.get("TIMEOUT")
+if TIMEOUT is None:
+    TIMEOUT = 5
+    logger.warning(f"TIMEOUT environtment variable is not set, using default value: {TIMEOUT}")
+else:
+    TIMEOUT = int(TIMEOUT)
+
+
+class HTTPStatusError(RuntimeError):
+    """Orion or the IoT agent answered with an unexpected status code
+
+    Attributes:
+        status_code (int): the status code of the response
+    """
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def transient(self):
+        """True if the same request may succeed later: a server error, 408 or 429"""
+        return self.status_code >= 500 or self.status_code in (408, 429)
+
+
+class OrionClient():
+    """HTTP client with a persistent connection pool
+
+    Attributes:
+        pool_size (int): the maximum number of kept-alive connections per host
+        timeout (float or tuple): the default timeout of each request,
+            either a single number or a (connect, read) tuple
+        session (requests.Session): the session holding the connection pool
+
+    Usage:
+        __init__:
+            client = OrionClient(pool_size=4, timeout=5)
+
+        get(url, **kwargs), post(url, **kwargs), delete(url, **kwargs), request(method, url, **kwargs):
+            send a request over the pool. Any keyword argument of
+            requests.Session.request is accepted, a timeout keyword
+            overrides the default timeout for that single request.
+
+        close():
+            close all pooled connections
+    """
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, timeout=TIMEOUT):
+        if pool_size < 1:
+            raise ValueError(f"Invalid pool size: {pool_size}, it must be at least 1")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        # the Orion broker and the IoT agent are 2 different hosts (ports)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+
+    def request(self, method: str, url: str, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url: str, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+client = OrionClient()
@@ -1,21 +1,121 @@
-"""An abstract Orion object class 
+"""An abstract Orion object class
 
 Used by Storage.py, Workstation.py, Job.py
+
+The Arduino resends some events periodically, for example the Workstations'
+_on and _off events every 60 seconds. If WRITE_HEARTBEAT_INTERVAL is set,
+a write is skipped if its value equals the last value acknowledged by Orion
+for the same attribute, unless that value was written more than
+WRITE_HEARTBEAT_INTERVAL seconds ago. This way Orion is still refreshed
+periodically, but most of the steady-state writes are suppressed.
+
+A value is acknowledged only once Orion accepted it: a direct write when it returns,
+a write queued in the Outbox or the WriteBatcher when they report its delivery
+(see confirm_delivery). Until then, the same value is written again.
+If the Outbox drops or the WriteBatcher fails to send the writes of an object,
+its acknowledged values are forgotten.
+
+Environment variables:
+    WRITE_HEARTBEAT_INTERVAL: the longest time an unchanged value is not rewritten in seconds.
+        Default: 0, every write is sent
 """
 
 # Standard Library imports
 from abc import ABC
+import atexit
+from collections import Counter
+import os
+import threading
+import time
 
 # PyPI imports
 
 # Custom imports
+import EventTrace
+from Logger import getLogger
 import Orion
+import Outbox
+import WriteBatcher
+
+logger = getLogger(__name__)
+
+# environment variables
+WRITE_HEARTBEAT_INTERVAL = os.environ.get("WRITE_HEARTBEAT_INTERVAL")
+if WRITE_HEARTBEAT_INTERVAL is None:
+    WRITE_HEARTBEAT_INTERVAL = 0
+else:
+    WRITE_HEARTBEAT_INTERVAL = float(WRITE_HEARTBEAT_INTERVAL)
+
+# the last acknowledged writes: {object_id: {attr_name: (attr_type, attr_value, time)}}
+# the time is None while the write waits in the Outbox or the WriteBatcher
+acknowledged = {}
+# the number of suppressed writes by attribute name
+suppressed = Counter()
+lock = threading.Lock()
+
+
+def forget_acknowledged(object_id: str):
+    """Forget the acknowledged values of an object, for example after it was changed by someone else"""
+    with lock:
+        acknowledged.pop(object_id, None)
+
+
+def confirm_delivery(object_id: str, attributes: dict):
+    """Acknowledge the attributes delivered by the Outbox or the WriteBatcher
+
+    Only the values still waiting for their delivery are acknowledged,
+    a value superseded by a newer write meanwhile is not.
+    """
+    with lock:
+        object_acknowledged = acknowledged.get(object_id)
+        if object_acknowledged is None:
+            return
+        now = time.monotonic()
+        for attr_name, attribute in attributes.items():
+            last = object_acknowledged.get(attr_name)
+            if last is not None and (last[0], last[1]) == (attribute["type"], attribute["value"]):
+                object_acknowledged[attr_name] = (last[0], last[1], now)
+
+
+def stats():
+    with lock:
+        return {"suppressed": sum(suppressed.values()), "suppressed_by_attribute": dict(suppressed)}
+
+
+def log_stats():
+    if WRITE_HEARTBEAT_INTERVAL > 0:
+        logger.info(f"Write suppression statistics: {stats()}")
+
+
+atexit.register(log_stats)
+
+# the Outbox and the WriteBatcher report the fate of the queued writes
+for sender in (Outbox.outbox, WriteBatcher.batcher):
+    if sender is not None:
+        sender.delivered = confirm_delivery
+        sender.failed = forget_acknowledged
 
 
 class OrionObject(ABC):
     def __init__(self, id):
         self.id = id
 
+    def is_unchanged(self, attr_name, attr_type, attr_value):
+        """Return True if Orion acknowledged the same value within the heartbeat interval"""
+        with lock:
+            last = acknowledged.get(self.id, {}).get(attr_name)
+            if last is None or last[2] is None or (last[0], last[1]) != (attr_type, attr_value):
+                return False
+            if time.monotonic() - last[2] >= WRITE_HEARTBEAT_INTERVAL:
+                return False
+            suppressed[attr_name] += 1
+            return True
+
+    def acknowledge(self, attr_name, attr_type, attr_value, delivered: bool = True):
+        with lock:
+            acknowledged.setdefault(self.id, {})[attr_name] = (
+                attr_type, attr_value, time.monotonic() if delivered else None)
+
     def update_attribute(self, attr_name, attr_type, attr_value):
         """update attribute in Orion
 
@@ -28,5 +128,26 @@ class OrionObject(ABC):
         #         attr_value = "true"
         #     if attr_value is False:
         #         attr_value = "false"
-        Orion.update_attribute(self.id, attr_name, attr_type, attr_value)
-
+        heartbeat = WRITE_HEARTBEAT_INTERVAL > 0
+        if heartbeat and self.is_unchanged(attr_name, attr_type, attr_value):
+            logger.debug("Unchanged write suppressed: %s %s: %s", self.id, attr_name, attr_value)
+            return
+        # the outbox compacts and sends the writes itself, it makes the batcher unnecessary
+        # the batch update would create the objects that do not exist,
+        # so only the confirmed objects are batched
+        outbox = Outbox.outbox
+        batcher = WriteBatcher.batcher
+        # the time of the serial event that caused the write, see EventTrace
+        metadata = EventTrace.metadata()
+        if outbox is not None or (batcher is not None and Orion.is_known(self.id)):
+            # the outbox and the batcher deliver the write later, see confirm_delivery
+            if heartbeat:
+                self.acknowledge(attr_name, attr_type, attr_value, delivered=False)
+            if outbox is not None:
+                outbox.put_attribute(self.id, attr_name, attr_type, attr_value, metadata)
+            else:
+                batcher.add(self.id, attr_name, attr_type, attr_value, metadata)
+            return
+        Orion.update_attribute(self.id, attr_name, attr_type, attr_value, metadata)
+        if heartbeat:
+            self.acknowledge(attr_name, attr_type, attr_value)
@@ -0,0 +1,251 @@
+"""Outbox
+
+A durable, append-only outbox for the outgoing Orion and IoT agent writes
+
+When the outbox is enabled, every attribute update and every special
+request is first appended to a local sqlite database, which returns
+without waiting for the network. A background sender drains the outbox
+in order: it compacts the superseded attribute values (the attributes hold
+absolute values, so only the newest value of each attribute is sent),
+sends the writes and deletes them once Orion or the IoT agent accepted them.
+
+If Orion or the IoT agent is unreachable, the sender retries with
+exponential backoff, while the new writes keep accumulating on disk.
+The writes survive a restart of the service: a new Outbox
+on the same file continues sending where the previous one stopped.
+
+Connection errors, timeouts and the answers that may change later
+(5xx, for example while Orion's database is down or from a proxy,
+408 and 429) are retried indefinitely. Other errors (4xx, for example
+the object does not exist or the value is invalid) are retried
+MAX_ATTEMPTS times, then the write is dropped and logged.
+
+Environment variables:
+    OUTBOX_PATH: the path of the sqlite outbox file.
+        Default: not set, the outbox is disabled and the writes are sent immediately
+"""
+
+# Standard Library imports
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+
+# PyPI imports
+import requests
+
+# Custom imports
+from ErrorAggregator import errors
+from Logger import getLogger
+import Orion
+from OrionClient import HTTPStatusError
+from post_to_IoT_agent import post_to_IoT_agent
+
+logger = getLogger(__name__)
+
+# environment variables
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH")
+
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 60  # seconds
+MAX_ATTEMPTS = 5
+DRAIN_SIZE = 100
+
+
+def is_transient(error: Exception):
+    """Return True if the write may succeed later, so it must never be dropped"""
+    # the connection errors and timeouts
+    if isinstance(error, requests.exceptions.RequestException):
+        return True
+    return isinstance(error, HTTPStatusError) and error.transient
+
+
+class Outbox():
+    """sqlite backed outbox with a background sender thread
+
+    Attributes:
+        path (str): the sqlite database file
+        send_attributes (callable): sends (object_id, attributes). Default: Orion.update_attributes
+        send_request (callable): sends a special request. Default: post_to_IoT_agent
+        delivered (callable): called with (object_id, attributes) after the attributes were sent
+        failed (callable): called with the object_id after its attribute writes were dropped
+        sent (int): the number of writes sent so far
+        compacted (int): the number of superseded attribute writes that were not sent
+        dropped (int): the number of writes dropped after MAX_ATTEMPTS failures
+
+    Usage:
+        __init__:
+            outbox = Outbox("/home/pi/outbox.sqlite")
+                starts the sender thread, that also sends the writes
+                left in the file by a previous run
+
+        put_attribute(object_id, attr_name, attr_type, attr_value, metadata=None):
+            append an attribute update
+
+        put_request(req):
+            append a special request to the IoT agent
+
+        pending():
+            return the number of writes not sent yet
+
+        stop():
+            stop the sender thread, the unsent writes stay in the file
+    """
+
+    def __init__(self, path: str, send_attributes=None, send_request=None,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 delivered=None, failed=None):
+        self.path = path
+        self.send_attributes = Orion.update_attributes if send_attributes is None else send_attributes
+        self.send_request = post_to_IoT_agent if send_request is None else send_request
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.delivered = delivered
+        self.failed = failed
+        self.sent = 0
+        self.compacted = 0
+        self.dropped = 0
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # the WAL journal does not need an fsync on every insert
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            object_id TEXT,
+            attr_name TEXT,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS outbox_attribute ON outbox (object_id, attr_name)")
+        pending = self.pending()
+        if pending:
+            logger.info(f"Outbox: {pending} writes left from the previous run")
+        self.thread = threading.Thread(target=self.run, name="Outbox", daemon=True)
+        self.thread.start()
+
+    def put(self, kind: str, object_id, attr_name, payload: str):
+        with self.condition:
+            self.db.execute(
+                "INSERT INTO outbox (kind, object_id, attr_name, payload) VALUES (?, ?, ?, ?)",
+                (kind, object_id, attr_name, payload))
+            self.condition.notify()
+
+    def put_attribute(self, object_id: str, attr_name: str, attr_type: str, attr_value, metadata: dict = None):
+        attribute = {"type": attr_type, "value": attr_value}
+        if metadata is not None:
+            attribute["metadata"] = metadata
+        payload = json.dumps(attribute)
+        self.put("attribute", object_id, attr_name, payload)
+
+    def put_request(self, req):
+        # a pre-encoded request (see RequestTemplate) is stored as it is
+        payload = req.decode() if isinstance(req, bytes) else json.dumps(req)
+        self.put("request", None, None, payload)
+
+    def pending(self):
+        with self.condition:
+            return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def compact(self):
+        """Delete the attribute writes superseded by a newer write of the same attribute"""
+        with self.condition:
+            cursor = self.db.execute("""DELETE FROM outbox WHERE kind = 'attribute' AND id NOT IN (
+                SELECT MAX(id) FROM outbox WHERE kind = 'attribute' GROUP BY object_id, attr_name)""")
+            self.compacted += cursor.rowcount
+
+    def take(self):
+        """Wait for writes, then return the oldest ones"""
+        with self.condition:
+            while not self.stopped.is_set():
+                rows = self.db.execute(
+                    "SELECT id, kind, object_id, attr_name, payload, attempts FROM outbox ORDER BY id LIMIT ?",
+                    (DRAIN_SIZE,)).fetchall()
+                if rows:
+                    return rows
+                self.condition.wait()
+        return []
+
+    def delete(self, ids: list):
+        with self.condition:
+            self.db.executemany("DELETE FROM outbox WHERE id = ?", [(id,) for id in ids])
+        self.sent += len(ids)
+
+    def next_group(self, rows: list):
+        """Return the writes that are sent next
+
+        A special request is sent alone. The leading attribute writes
+        are grouped by object, so each object is updated in one request.
+        """
+        if rows[0][1] == "request":
+            return [rows[0]]
+        object_id = rows[0][2]
+        group = []
+        for row in rows:
+            if row[1] == "request":
+                break
+            if row[2] == object_id:
+                group.append(row)
+        return group
+
+    def send_group(self, group: list):
+        if group[0][1] == "request":
+            self.send_request(json.loads(group[0][4]))
+        else:
+            attributes = {row[3]: json.loads(row[4]) for row in group}
+            self.send_attributes(group[0][2], attributes)
+            if self.delivered is not None:
+                self.delivered(group[0][2], attributes)
+
+    def handle_failure(self, group: list, error: Exception):
+        self.failures += 1
+        if not is_transient(error):
+            with self.condition:
+                self.db.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?",
+                                    [(row[0],) for row in group])
+            if max(row[5] for row in group) + 1 >= MAX_ATTEMPTS:
+                with self.condition:
+                    self.db.executemany("DELETE FROM outbox WHERE id = ?", [(row[0],) for row in group])
+                self.dropped += len(group)
+                logger.error(f"Outbox: dropped {len(group)} writes after {MAX_ATTEMPTS} attempts: {error}")
+                if self.failed is not None and group[0][1] == "attribute":
+                    self.failed(group[0][2])
+                return
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+        delay *= random.uniform(0.5, 1)
+        logger.debug("Outbox: retrying in %.1f s", delay)
+        errors.report(logger, error, "Outbox: sending failed: ")
+        self.stopped.wait(delay)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.compact()
+            rows = self.take()
+            if not rows:
+                continue
+            group = self.next_group(rows)
+            try:
+                self.send_group(group)
+            except Exception as error:
+                self.handle_failure(group, error)
+                continue
+            self.failures = 0
+            self.delete([row[0] for row in group])
+
+    def stop(self, timeout: float = None):
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify()
+        self.thread.join(timeout)
+        logger.info(f"Outbox: sent: {self.sent}, compacted: {self.compacted}, dropped: {self.dropped}, pending: {self.pending()}")
+
+
+outbox = None
+if OUTBOX_PATH is not None:
+    outbox = Outbox(OUTBOX_PATH)
+    atexit.register(outbox.stop, 1)
+    logger.info(f"Outbox enabled: {OUTBOX_PATH}")
@@ -0,0 +1,242 @@
+"""Profiler
+
+On-demand CPU and memory profiling of the running service
+
+A debugger can not be attached on a production Raspberry Pi, so the service
+can be profiled with signals:
+    kill -USR1 <pid>: start cProfile over the dispatch, the second signal stops it,
+        dumps the pstats to PROFILE_DIR/profile-<time>-<n>.pstats and logs the top functions
+    kill -USR2 <pid>: take a tracemalloc snapshot, dump it to PROFILE_DIR/snapshot-<time>-<n>.tracemalloc
+        and log the difference to the previous snapshot, for example to chase
+        the memory growth of long-running JobHandlers and loggers.
+        The first signal starts tracemalloc and takes the baseline snapshot.
+
+The dispatch is profiled by shadowing CommandHandler.handle_command
+with a profiled version while the profiling is on, in every dispatch thread,
+and the thread reading the serial devices (the main thread) is profiled too.
+When the profiling is off, nothing is wrapped or traced,
+so the service runs exactly as without the Profiler.
+
+The dumped files can be read with:
+    python -m pstats PROFILE_DIR/profile-<time>-<n>.pstats
+    tracemalloc.Snapshot.load("PROFILE_DIR/snapshot-<time>-<n>.tracemalloc")
+
+Environment variables:
+    PROFILE_AT_STARTUP: start cProfile at startup. Default: false
+    TRACEMALLOC_AT_STARTUP: start tracemalloc at startup. Default: false
+    PROFILE_DIR: the directory of the dumped profiles and snapshots. Default: the temporary directory
+    PROFILE_SIGNAL: the signal toggling cProfile. Default: SIGUSR1
+    TRACEMALLOC_SIGNAL: the signal taking a tracemalloc snapshot. Default: SIGUSR2
+"""
+
+# Standard Library imports
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import signal
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+PROFILE_AT_STARTUP = os.environ.get("PROFILE_AT_STARTUP")
+if PROFILE_AT_STARTUP is None:
+    PROFILE_AT_STARTUP = False
+else:
+    PROFILE_AT_STARTUP = PROFILE_AT_STARTUP.lower() == "true"
+
+TRACEMALLOC_AT_STARTUP = os.environ.get("TRACEMALLOC_AT_STARTUP")
+if TRACEMALLOC_AT_STARTUP is None:
+    TRACEMALLOC_AT_STARTUP = False
+else:
+    TRACEMALLOC_AT_STARTUP = TRACEMALLOC_AT_STARTUP.lower() == "true"
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+if PROFILE_DIR is None:
+    PROFILE_DIR = tempfile.gettempdir()
+
+PROFILE_SIGNAL = os.environ.get("PROFILE_SIGNAL")
+if PROFILE_SIGNAL is None:
+    PROFILE_SIGNAL = "SIGUSR1"
+
+TRACEMALLOC_SIGNAL = os.environ.get("TRACEMALLOC_SIGNAL")
+if TRACEMALLOC_SIGNAL is None:
+    TRACEMALLOC_SIGNAL = "SIGUSR2"
+
+# the number of lines logged from the profiles and the snapshot differences
+TOP_N = 20
+# the depth of the tracebacks stored by tracemalloc
+TRACEMALLOC_FRAMES = 1
+
+
+class Profiler():
+    """Toggles cProfile over the dispatch and takes tracemalloc snapshots
+
+    Attributes:
+        commandHandler (CommandHandler): its handle_command is profiled
+        directory (str): the directory of the dumped files
+        profiles (list): the cProfile.Profile of each profiled thread
+        main_profile (cProfile.Profile): the profile of the main thread
+        snapshot (tracemalloc.Snapshot): the previous snapshot
+
+    Usage:
+        __init__:
+            profiler = Profiler(commandHandler)
+
+        install():
+            handle the signals
+
+        start() / stop():
+            start the profiling / stop it and dump the pstats, return the file's path
+
+        take_snapshot():
+            take a tracemalloc snapshot, dump it and log the difference to the previous one,
+            return the file's path
+    """
+
+    def __init__(self, commandHandler, directory: str = PROFILE_DIR):
+        self.commandHandler = commandHandler
+        self.directory = directory
+        self.profiles = []
+        self.main_profile = None
+        self.snapshot = None
+        self.dumps = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @property
+    def profiling(self):
+        return "handle_command" in vars(self.commandHandler)
+
+    def install(self, profile_signal: str = PROFILE_SIGNAL, tracemalloc_signal: str = TRACEMALLOC_SIGNAL):
+        """Handle the signals, must be called from the main thread"""
+        signal.signal(getattr(signal, profile_signal), self.handle_profile_signal)
+        signal.signal(getattr(signal, tracemalloc_signal), self.handle_tracemalloc_signal)
+        logger.info("Profiling: kill -%s %s toggles cProfile, kill -%s %s takes a tracemalloc snapshot",
+                    profile_signal[3:], os.getpid(), tracemalloc_signal[3:], os.getpid())
+        return self
+
+    def handle_profile_signal(self, signum, frame):
+        # the signal handler interrupts the main thread anywhere,
+        # the dumps are written in another thread to avoid taking its locks here
+        if self.profiling:
+            self.stop_main_profile()
+            threading.Thread(target=self.stop, name="Profiler", daemon=True).start()
+        else:
+            self.start()
+
+    def handle_tracemalloc_signal(self, signum, frame):
+        threading.Thread(target=self.take_snapshot, name="Profiler", daemon=True).start()
+
+    def profile(self):
+        """Return the cProfile.Profile of the current thread"""
+        profile = getattr(self.local, "profile", None)
+        if profile is None:
+            profile = self.local.profile = cProfile.Profile()
+            with self.lock:
+                self.profiles.append(profile)
+        return profile
+
+    def start(self, main_thread: bool = True):
+        """Start profiling the dispatch (and the calling thread)"""
+        if self.profiling:
+            return
+        handle_command = type(self.commandHandler).handle_command.__get__(self.commandHandler)
+
+        def profiled_handle_command(command_id: str, arg=None, event=None):
+            if self.main_profile is not None and threading.current_thread() is threading.main_thread():
+                # already profiled by the main thread's profile
+                return handle_command(command_id, arg, event)
+            return self.profile().runcall(handle_command, command_id, arg, event)
+
+        self.commandHandler.handle_command = profiled_handle_command
+        if main_thread:
+            self.main_profile = cProfile.Profile()
+            self.main_profile.enable()
+        logger.info("Profiling started")
+
+    def stop_main_profile(self):
+        if self.main_profile is not None:
+            self.main_profile.disable()
+
+    def stop(self):
+        """Stop profiling, dump the pstats and log the top functions, return the file's path"""
+        if not self.profiling:
+            return None
+        del self.commandHandler.handle_command
+        if threading.current_thread() is threading.main_thread():
+            self.stop_main_profile()
+        with self.lock:
+            profiles = self.profiles
+            self.profiles = []
+        # the threads create a new profile at the next start
+        self.local = threading.local()
+        if self.main_profile is not None:
+            profiles.append(self.main_profile)
+            self.main_profile = None
+        profiles = [profile for profile in profiles if profile.getstats()]
+        if not profiles:
+            logger.info("Profiling stopped, nothing was profiled")
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        path = self.make_path("profile", "pstats")
+        stats.dump_stats(path)
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats("cumulative").print_stats(TOP_N)
+        logger.info("Profiling stopped, pstats dumped to %s\n%s", path, output.getvalue())
+        return path
+
+    def make_path(self, kind: str, extension: str):
+        with self.lock:
+            self.dumps += 1
+            return os.path.join(self.directory, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{self.dumps}.{extension}")
+
+    def take_snapshot(self):
+        """Take a tracemalloc snapshot, dump it and log the difference to the previous one, return the file's path"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            logger.info("tracemalloc started")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        path = self.make_path("snapshot", "tracemalloc")
+        snapshot.dump(path)
+        current, peak = tracemalloc.get_traced_memory()
+        if self.snapshot is None:
+            logger.info("tracemalloc snapshot dumped to %s, traced memory: %s B, peak: %s B",
+                        path, current, peak)
+        else:
+            differences = snapshot.compare_to(self.snapshot, "lineno")[:TOP_N]
+            logger.info("tracemalloc snapshot dumped to %s, traced memory: %s B, peak: %s B, "
+                        "the largest changes since the previous snapshot:\n%s",
+                        path, current, peak, "\n".join(str(difference) for difference in differences))
+        self.snapshot = snapshot
+        return path
+
+
+def install(commandHandler):
+    """Handle the profiling signals and start the profiling requested at startup, return the Profiler"""
+    profiler = Profiler(commandHandler)
+    if hasattr(signal, PROFILE_SIGNAL) and hasattr(signal, TRACEMALLOC_SIGNAL):
+        profiler.install()
+    if TRACEMALLOC_AT_STARTUP:
+        profiler.take_snapshot()
+    if PROFILE_AT_STARTUP:
+        profiler.start()
+        # the profile is dumped at exit if no signal stops it before
+        atexit.register(profiler.stop)
+    return profiler
@@ -0,0 +1,159 @@
+"""Reconciler
+
+Initiates the JobHandlers' cycle counters from Orion in the background
+
+A new JobHandler (for example, after the Workstation's Job changed)
+or one that could not read its Job from Orion (for example, because Orion
+was down at startup) counts the cycles locally. It is scheduled here,
+and the background thread retries it every RECONCILE_PERIOD seconds.
+When it succeeds, the cycles already finished in Orion are added
+to the local counters, and the counters are written to Orion.
+This way the cycle handling never waits for Orion.
+
+All attempts go through a CircuitBreaker: during an outage the breaker opens,
+and Orion is only probed every BREAKER_RESET_TIMEOUT seconds.
+
+If the Job's data is invalid (a part counter is not divisible by partsPerCycle),
+retrying does not help: the JobHandler is set aside, and it is only
+attempted again when the Workstation's Job changes in Orion, see recheck.
+"""
+
+# Standard Library imports
+import threading
+
+# PyPI imports
+
+# Custom imports
+from CircuitBreaker import CircuitBreaker
+from ErrorAggregator import errors
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# the time between 2 rounds of retries in seconds
+RECONCILE_PERIOD = 1
+# the number of consecutive Orion failures that open the circuit breaker
+BREAKER_FAILURE_THRESHOLD = 3
+# the time after which an open circuit breaker lets a probe through in seconds
+BREAKER_RESET_TIMEOUT = 10
+
+
+class Reconciler():
+    """Background thread retrying the pending JobHandlers
+
+    Attributes:
+        breaker (CircuitBreaker): guards the Orion requests of the reconciliation
+        period (float): the time between 2 rounds of retries in seconds
+        pending (dict): the scheduled JobHandlers: {id(jobHandler): jobHandler}
+        invalid (dict): the JobHandlers set aside because of their invalid Job data
+        reconciled (int): the number of JobHandlers reconciled so far
+
+    Usage:
+        __init__:
+            reconciler = Reconciler()
+
+        schedule(jobHandler):
+            retry the JobHandler until jobHandler.reconcile() returns True,
+            it never blocks, a JobHandler set aside is not scheduled again
+
+        recheck(jobHandler):
+            schedule the JobHandler even if it was set aside, for example after its Job changed
+
+        discard(jobHandler):
+            stop retrying the JobHandler
+
+        drain(timeout=None):
+            wait until no JobHandler is pending
+
+        stop(timeout=None):
+            stop the thread
+    """
+
+    def __init__(self, breaker: CircuitBreaker = None, period: float = RECONCILE_PERIOD):
+        if breaker is None:
+            breaker = CircuitBreaker("Orion", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.breaker = breaker
+        self.period = period
+        self.pending = {}
+        self.invalid = {}
+        self.reconciled = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    def schedule(self, jobHandler):
+        with self.condition:
+            if id(jobHandler) in self.invalid:
+                return
+            self.pending[id(jobHandler)] = jobHandler
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="Reconciler", daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def recheck(self, jobHandler):
+        with self.condition:
+            self.invalid.pop(id(jobHandler), None)
+        self.schedule(jobHandler)
+
+    def discard(self, jobHandler):
+        with self.condition:
+            self.pending.pop(id(jobHandler), None)
+            self.invalid.pop(id(jobHandler), None)
+            self.condition.notify_all()
+
+    def attempt(self, jobHandler):
+        """Reconcile a JobHandler once, return True if it is done"""
+        try:
+            done = jobHandler.reconcile()
+        except ValueError as error:
+            # Orion answered, but the Job's data is invalid
+            self.breaker.record_success()
+            logger.error(f"Reconciling the counters of {jobHandler.workstation_id} failed: {error}, "
+                         f"it is retried after the Workstation's Job changes")
+            with self.condition:
+                if self.pending.pop(id(jobHandler), None) is not None:
+                    self.invalid[id(jobHandler)] = jobHandler
+                self.condition.notify_all()
+            return False
+        except Exception as error:
+            self.breaker.record_failure()
+            # during an outage, every period fails the same way
+            errors.report(logger, error, f"Reconciling the counters of {jobHandler.workstation_id} failed: ")
+            return False
+        self.breaker.record_success()
+        return done
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                jobHandlers = list(self.pending.values())
+            for jobHandler in jobHandlers:
+                if not self.breaker.allow():
+                    break
+                if self.attempt(jobHandler):
+                    with self.condition:
+                        if self.pending.pop(id(jobHandler), None) is not None:
+                            self.reconciled += 1
+                        self.condition.notify_all()
+            with self.condition:
+                if self.pending and not self.stopped:
+                    self.condition.wait(self.period)
+
+    def drain(self, timeout: float = None):
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout)
+
+    def stop(self, timeout: float = None):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+reconciler = Reconciler()
@@ -0,0 +1,211 @@
+"""RequestBatcher
+
+Sends the special requests to the IoT agent in concurrent batches
+
+The Arduino may send several special commands in one set, for example
+{"job_change": ..., "operator_change": ...}. Without the RequestBatcher,
+each of them is sent and answered before the next one.
+With it, the special requests arriving within a short time window
+are collected and sent concurrently over the pooled connections.
+The requests with the same URL are still sent one after another,
+in the order of their events.
+
+Each request has its own result: add returns a Future that is resolved
+with the IoT agent's status code, or with the exception if the request failed.
+The caller handles the result of each request, for example the CommandHandler
+reports a failed request with the id of its command.
+
+Environment variables:
+    SPECIAL_BATCH_WINDOW_MS: the time window of a batch in milliseconds.
+        Default: 0, batching is disabled and every special request is sent immediately
+    SPECIAL_BATCH_MAX_SIZE: the maximum number of requests in a batch. Default: 100
+"""
+
+# Standard Library imports
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+from OrionClient import HTTP_POOL_SIZE
+from post_to_IoT_agent import post_to_IoT_agent
+
+logger = getLogger(__name__)
+
+# environment variables
+SPECIAL_BATCH_WINDOW_MS = os.environ.get("SPECIAL_BATCH_WINDOW_MS")
+if SPECIAL_BATCH_WINDOW_MS is None:
+    SPECIAL_BATCH_WINDOW_MS = 0
+else:
+    SPECIAL_BATCH_WINDOW_MS = float(SPECIAL_BATCH_WINDOW_MS)
+
+SPECIAL_BATCH_MAX_SIZE = os.environ.get("SPECIAL_BATCH_MAX_SIZE")
+if SPECIAL_BATCH_MAX_SIZE is None:
+    SPECIAL_BATCH_MAX_SIZE = 100
+else:
+    SPECIAL_BATCH_MAX_SIZE = int(SPECIAL_BATCH_MAX_SIZE)
+
+
+class RequestBatcher():
+    """Collects special requests and sends each batch concurrently, ordered per URL
+
+    Attributes:
+        window_ms (float): the time window of a batch in milliseconds
+        max_size (int): the maximum number of requests in a batch
+        workers (int): the maximum number of requests sent at the same time
+        send (callable): sends a request, returns its status code. Default: post_to_IoT_agent
+        pending (list): the collected (url, req, future) tuples
+        requests (int): the number of requests added so far
+        sent (int): the number of requests sent successfully
+        failed (int): the number of failed requests
+
+    Usage:
+        __init__:
+            requestBatcher = RequestBatcher(window_ms=20, max_size=100)
+
+        add(url, req):
+            queue a request, it never blocks on the network, returns a Future
+
+        flush():
+            send the pending requests immediately
+
+        stop():
+            send the pending requests and stop the background thread
+
+        stats():
+            return the batch statistics in a dict
+    """
+
+    def __init__(self, window_ms: float = SPECIAL_BATCH_WINDOW_MS, max_size: int = SPECIAL_BATCH_MAX_SIZE,
+                 workers: int = HTTP_POOL_SIZE, send=None):
+        if max_size < 1:
+            raise ValueError(f"Invalid batch size: {max_size}, it must be at least 1")
+        self.window_ms = window_ms
+        self.max_size = max_size
+        self.workers = workers
+        self.send = post_to_IoT_agent if send is None else send
+        self.pending = []
+        self.first_request_time = None
+        self.requests = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.condition = threading.Condition()
+        # only one batch is sent at a time, so the order of the requests with the same URL is kept
+        self.send_lock = threading.Lock()
+        self.stopped = False
+        self.thread = None
+        self.executor = None
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="RequestBatcher")
+        self.thread = threading.Thread(target=self.run, name="RequestBatcher", daemon=True)
+        self.thread.start()
+
+    def add(self, url: str, req):
+        future = Future()
+        with self.condition:
+            self.pending.append((url, req, future))
+            self.requests += 1
+            if self.first_request_time is None:
+                self.first_request_time = time.monotonic()
+            if self.thread is None:
+                self.start()
+            self.condition.notify()
+        return future
+
+    def take_batch(self):
+        batch = self.pending
+        self.pending = []
+        self.first_request_time = None
+        return batch
+
+    def send_group(self, group: list):
+        """Send the requests with the same URL one after another"""
+        for url, req, future in group:
+            try:
+                status_code = self.send(req)
+            except Exception as error:
+                with self.condition:
+                    self.failed += 1
+                logger.debug("Sending special request to %s failed: %s", url, error)
+                future.set_exception(error)
+            else:
+                with self.condition:
+                    self.sent += 1
+                future.set_result(status_code)
+
+    def send_batch(self, batch: list):
+        if not batch:
+            return
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[0], []).append(item)
+        with self.send_lock:
+            if len(groups) == 1 or self.executor is None:
+                for group in groups.values():
+                    self.send_group(group)
+            else:
+                # wait for the whole batch, the next batch may contain the same URLs
+                list(self.executor.map(self.send_group, groups.values()))
+        with self.condition:
+            self.batches += 1
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+        logger.debug("Special request batch sent: %s requests to %s URLs", len(batch), len(groups))
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped and not self.pending:
+                    return
+                deadline = self.first_request_time + self.window_ms / 1000
+                while len(self.pending) < self.max_size and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = self.take_batch()
+            self.send_batch(batch)
+
+    def flush(self):
+        with self.condition:
+            batch = self.take_batch()
+        self.send_batch(batch)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+        logger.info(f"Special request batch statistics: {self.stats()}")
+
+    def stats(self):
+        with self.condition:
+            return {
+                "requests": self.requests,
+                "sent": self.sent,
+                "failed": self.failed,
+                "batches": self.batches,
+                "mean_batch_size": (self.sent + self.failed) / self.batches if self.batches else 0,
+                "max_batch_size": self.max_batch_size,
+            }
+
+
+requestBatcher = None
+if SPECIAL_BATCH_WINDOW_MS > 0:
+    requestBatcher = RequestBatcher()
+    atexit.register(requestBatcher.stop)
+    logger.info(f"Batching special requests: window: {SPECIAL_BATCH_WINDOW_MS} ms, "
+                f"max size: {SPECIAL_BATCH_MAX_SIZE}")
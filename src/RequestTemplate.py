@@ -0,0 +1,75 @@
+"""RequestTemplate
+
+A special request encoded once, when the commands are loaded
+
+The requests of the special commands never change, only the argument
+of the event is put into their "data". So each request is encoded
+to JSON bytes at startup, split around the "data" value, and for each
+event only the argument is encoded and put between the 2 constant parts.
+The shared command dict is never modified.
+
+If orjson is installed, it is used to encode the JSON, otherwise the
+standard library's json module. Both produce the same compact JSON.
+"""
+
+# Standard Library imports
+import json
+
+# PyPI imports
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Custom imports
+
+# a string that never occurs in a request, it marks the place of the argument
+ARG_SLOT = "\x00rpi_commands_arg\x00"
+# json.dumps with arguments creates a new encoder for every call
+encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def dumps(obj) -> bytes:
+    """Encode an object to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return encoder.encode(obj).encode()
+
+
+class RequestTemplate():
+    """Immutable, pre-encoded special request
+
+    Attributes:
+        url (str): the URL of the request
+        body (bytes): the encoded request without argument
+
+    Usage:
+        __init__:
+            template = RequestTemplate(command["request"])
+
+        render(arg=None):
+            return the encoded request with "data" set to arg,
+            or the request unchanged if arg is None
+    """
+    __slots__ = ("url", "body", "prefix", "suffix")
+
+    def __init__(self, req: dict):
+        url = req["url"]
+        body = dumps(req)
+        # the request with the slot in place of "data" is split around the encoded slot
+        prefix, suffix = dumps({**req, "data": ARG_SLOT}).split(dumps(ARG_SLOT))
+        object.__setattr__(self, "url", url)
+        object.__setattr__(self, "body", body)
+        object.__setattr__(self, "prefix", prefix)
+        object.__setattr__(self, "suffix", suffix)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def render(self, arg=None) -> bytes:
+        if arg is None:
+            return self.body
+        return self.prefix + dumps(arg) + self.suffix
+
+    def __repr__(self):
+        return f"RequestTemplate({self.body.decode()})"
@@ -0,0 +1,90 @@
+"""SerialFramer
+
+Incremental framing of the JSON objects sent by the microcontroller
+
+The microcontroller sends sets of commands as JSON objects, usually one per line,
+but a burst may arrive in any number of chunks: an object may be split
+between 2 reads and a single read may contain several objects,
+even on the same line like '{"1": null}{"3": 0.45}'.
+
+The SerialFramer keeps the partial frames between the reads and returns
+every complete JSON object as soon as it has arrived.
+It scans with json.JSONDecoder.raw_decode, so nested objects and
+strings containing braces are decoded correctly.
+
+A frame that cannot be decoded although its line is complete
+(a newline follows it) or it is longer than the maximum frame size is corrupt:
+the framer skips it and continues with the next object.
+"""
+
+# Standard Library imports
+import codecs
+import json
+
+# PyPI imports
+
+# Custom imports
+
+MAX_FRAME_SIZE = 4096
+
+
+class SerialFramer():
+    """Stateful JSON object framer for a byte stream
+
+    Attributes:
+        buffer (str): the received, not yet decoded characters
+        max_frame_size (int): the maximum length of an incomplete frame
+        frames (int): the number of decoded objects so far
+        discarded (int): the number of characters skipped as corrupt data
+
+    Usage:
+        __init__:
+            framer = SerialFramer()
+
+        feed(data):
+            add the received bytes, return the list of completed JSON objects
+    """
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.decoder = json.JSONDecoder()
+        # a multi-byte UTF-8 character may be split between 2 reads
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.buffer = ""
+        self.frames = 0
+        self.discarded = 0
+
+    def feed(self, data: bytes):
+        self.buffer += self.text_decoder.decode(data)
+        return self.extract()
+
+    def skip(self, text: str):
+        self.discarded += len(text.strip())
+
+    def extract(self):
+        buffer = self.buffer
+        objects = []
+        pos = 0
+        while True:
+            start = buffer.find("{", pos)
+            if start == -1:
+                self.skip(buffer[pos:])
+                pos = len(buffer)
+                break
+            self.skip(buffer[pos:start])
+            try:
+                obj, end = self.decoder.raw_decode(buffer, start)
+            except json.JSONDecodeError:
+                is_line_complete = "\n" in buffer[start:]
+                if not is_line_complete and len(buffer) - start <= self.max_frame_size:
+                    # wait for the rest of the frame
+                    pos = start
+                    break
+                self.discarded += 1
+                pos = start + 1
+                continue
+            objects.append(obj)
+            pos = end
+        self.buffer = buffer[pos:]
+        self.frames += len(objects)
+        return objects
@@ -0,0 +1,138 @@
+"""SerialHub
+
+Serves many microcontrollers' serial devices in a single process
+
+The devices are given as paths or glob patterns like /dev/ttyUSB*.
+The hub multiplexes all open devices with a selector, so one thread
+waits for the data of all of them without spinning.
+Every SERIAL_RECHECK_PERIOD seconds the patterns are matched again:
+the newly plugged devices are opened, while the devices that
+were unplugged are closed as soon as they report the disconnection.
+"""
+
+# Standard Library imports
+import glob
+import os
+import selectors
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from ErrorAggregator import errors
+from Logger import getLogger
+from SerialFramer import SerialFramer
+
+logger = getLogger(__name__)
+
+SERIAL_RECHECK_PERIOD = 5
+# the longest time the stop event is not checked
+POLL_TIMEOUT = 1
+
+
+def match_devices(patterns: list) -> list:
+    """Return the sorted existing device paths matching the paths or glob patterns"""
+    paths = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.update(glob.glob(pattern))
+        elif os.path.exists(pattern):
+            paths.add(pattern)
+    return sorted(paths)
+
+
+class SerialHub():
+    """Selector based multiplexer of serial devices with hot-plug support
+
+    Attributes:
+        patterns (list): device paths or glob patterns
+        open_device (callable): opens a device path, returns a serial.Serial
+        on_data (callable): on_data(ser, framer) reads and handles
+            the available data of a readable device
+        recheck_period (float): the time between 2 scans of the patterns in seconds
+        devices (dict): the open devices: {path: (ser, framer)}
+
+    Usage:
+        __init__:
+            hub = SerialHub(["/dev/ttyUSB*", "/dev/ttyACM0"], open_device, on_data)
+
+        run(stop_event):
+            serve the devices until the stop event is set
+
+        close():
+            close all devices
+    """
+
+    def __init__(self, patterns: list, open_device, on_data, recheck_period: float = SERIAL_RECHECK_PERIOD):
+        self.patterns = patterns
+        self.open_device = open_device
+        self.on_data = on_data
+        self.recheck_period = recheck_period
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}
+        self.next_scan = 0
+
+    def match(self):
+        return match_devices(self.patterns)
+
+    def scan(self):
+        for path in self.match():
+            if path not in self.devices:
+                self.add(path)
+        self.next_scan = time.monotonic() + self.recheck_period
+
+    def add(self, path: str):
+        try:
+            ser = self.open_device(path)
+        except Exception as error:
+            logger.error(f"Could not open serial device {path}: {error}")
+            return
+        # the selector tells when the data arrives, the reads must never block
+        ser.timeout = 0
+        self.devices[path] = (ser, SerialFramer())
+        self.selector.register(ser.fileno(), selectors.EVENT_READ, path)
+        logger.info(f"Serial device added: {path}")
+
+    def remove(self, path: str):
+        ser, _ = self.devices.pop(path)
+        try:
+            self.selector.unregister(ser.fileno())
+        except (KeyError, ValueError):
+            pass
+        try:
+            ser.close()
+        except Exception:
+            pass
+        logger.info(f"Serial device removed: {path}")
+
+    def poll(self, timeout: float):
+        if not self.devices:
+            # the selector cannot wait without any file descriptors on every platform
+            time.sleep(timeout)
+            return
+        for key, _ in self.selector.select(timeout):
+            path = key.data
+            ser, framer = self.devices[path]
+            try:
+                self.on_data(ser, framer)
+            except OSError as error:
+                # lost connection with serial device
+                errors.report(logger, error, f"{path}: ")
+                self.remove(path)
+            except Exception as error:
+                # a noisy serial line produces the same error again and again
+                errors.report(logger, error, f"{path}: ")
+
+    def run(self, stop_event: threading.Event = None):
+        if stop_event is None:
+            stop_event = threading.Event()
+        while not stop_event.is_set():
+            if time.monotonic() >= self.next_scan:
+                self.scan()
+            self.poll(max(0, min(POLL_TIMEOUT, self.next_scan - time.monotonic())))
+
+    def close(self):
+        for path in list(self.devices):
+            self.remove(path)
+        self.selector.close()
@@ -0,0 +1,201 @@
+"""StateJournal
+
+Persists the Storage and JobHandler counters in a local journal file
+
+Without it, a restarted service resets the Storages to full or empty,
+and the JobHandlers must rebuild their cycle counters from Orion,
+which needs Orion to be reachable. With the journal, the counters
+are restored instantly from the file, even offline.
+
+Every counter change appends one short JSON line {"k": key, "v": value}
+to the journal, then the file is fsync'd, so the change survives a power loss.
+On an SD card, an fsync takes milliseconds: if STATE_JOURNAL_FSYNC_INTERVAL
+is set, the file is fsync'd at most that often, and a timer fsyncs the changes
+left unsynced once the interval has passed, even if no other change follows.
+A power loss then loses the changes of at most the last interval
+(a crash of the service alone does not lose any change).
+
+When the journal is opened, the lines are replayed (the last value of each key wins),
+a torn last line is ignored. The journal is compacted into a snapshot
+of the current values when opened and whenever it grows too long.
+
+Environment variables:
+    STATE_JOURNAL_PATH: the path of the journal file.
+        Default: not set, the counters are not persisted
+    STATE_JOURNAL_FSYNC_INTERVAL: the longest time between 2 fsyncs in seconds.
+        Default: 0, every change is fsync'd
+"""
+
+# Standard Library imports
+import atexit
+import json
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+# environment variables
+STATE_JOURNAL_PATH = os.environ.get("STATE_JOURNAL_PATH")
+
+STATE_JOURNAL_FSYNC_INTERVAL = os.environ.get("STATE_JOURNAL_FSYNC_INTERVAL")
+if STATE_JOURNAL_FSYNC_INTERVAL is None:
+    STATE_JOURNAL_FSYNC_INTERVAL = 0
+else:
+    STATE_JOURNAL_FSYNC_INTERVAL = float(STATE_JOURNAL_FSYNC_INTERVAL)
+
+# the journal is compacted when it has this many more lines than keys
+COMPACT_THRESHOLD = 10000
+
+
+class StateJournal():
+    """Append-only, fsync'd journal of key-value pairs
+
+    Attributes:
+        path (str): the path of the journal file
+        fsync_interval (float): the longest time between 2 fsyncs in seconds
+        state (dict): the current value of each key
+        lines (int): the number of lines in the journal file
+        records (int): the number of values recorded since opening
+        fsyncs (int): the number of fsyncs since opening
+        dirty (bool): some records are not fsync'd yet
+
+    Usage:
+        __init__:
+            journal = StateJournal("/home/pi/rpi_commands_state.journal")
+
+        get(key, default=None):
+            return the last recorded value of the key
+
+        record(key, value):
+            persist a new value of the key, the value must be JSON serializable,
+            raise RuntimeError if the journal is closed
+
+        compact():
+            rewrite the journal with only the current values
+
+        close():
+            fsync and close the journal
+    """
+
+    def __init__(self, path: str, fsync_interval: float = STATE_JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.state = {}
+        self.lines = 0
+        self.records = 0
+        self.fsyncs = 0
+        self.last_fsync = time.monotonic()
+        self.dirty = False
+        # fsyncs the dirty records once fsync_interval has passed
+        self.timer = None
+        self.replay()
+        self.file = None
+        self.compact()
+        logger.info(f"StateJournal opened: {path}, keys: {len(self.state)}")
+
+    def replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self.state[record["k"]] = record["v"]
+                except (ValueError, KeyError, TypeError):
+                    # a torn last line of a power loss, or a corrupt line
+                    logger.warning(f"StateJournal: ignoring invalid line: {line[:100]}")
+
+    def get(self, key: str, default=None):
+        with self.lock:
+            return self.state.get(key, default)
+
+    def record(self, key: str, value):
+        line = json.dumps({"k": key, "v": value}, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self.lock:
+            if self.file is None:
+                raise RuntimeError(f"The state journal is closed, {key} is not recorded")
+            self.state[key] = value
+            self.file.write(line)
+            self.lines += 1
+            self.records += 1
+            elapsed = time.monotonic() - self.last_fsync
+            if self.fsync_interval <= 0 or elapsed >= self.fsync_interval:
+                self.sync()
+            else:
+                self.dirty = True
+                if self.timer is None:
+                    self.timer = threading.Timer(self.fsync_interval - elapsed, self.sync_if_dirty)
+                    self.timer.daemon = True
+                    self.timer.start()
+            if self.lines > len(self.state) + COMPACT_THRESHOLD:
+                self.rewrite()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.fsyncs += 1
+        self.last_fsync = time.monotonic()
+        self.dirty = False
+
+    def sync_if_dirty(self):
+        with self.lock:
+            self.timer = None
+            if self.file is not None and self.dirty:
+                self.sync()
+
+    def rewrite(self):
+        """Atomically replace the journal with a snapshot of the current values"""
+        if self.file is not None:
+            self.file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for key, value in self.state.items():
+                f.write(json.dumps({"k": key, "v": value}, separators=(",", ":")).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.lines = len(self.state)
+        # unbuffered: each record is a single write system call
+        self.file = open(self.path, "ab", buffering=0)
+
+    def compact(self):
+        with self.lock:
+            self.rewrite()
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.sync()
+            self.file.close()
+            self.file = None
+        logger.info(f"StateJournal closed: records: {self.records}, fsyncs: {self.fsyncs}")
+
+
+def storage_key(storage_id: str):
+    return f"Storage:{storage_id}"
+
+
+def jobHandler_key(workstation_id: str):
+    return f"JobHandler:{workstation_id}"
+
+
+journal = None
+if STATE_JOURNAL_PATH is not None:
+    journal = StateJournal(STATE_JOURNAL_PATH)
+    atexit.register(journal.close)
@@ -9,6 +9,7 @@ Made from the abstract class OrionObject
 
 # Custom imports
 from OrionObject import OrionObject
+import StateJournal
 
 
 class Storage(OrionObject):
@@ -63,8 +64,16 @@ class Storage(OrionObject):
             raise ValueError(
                 f'Invalid type: {type}: supported types: "emptying", "filling"'
             )
+        # continue from the persisted counter after a restart
+        journal = StateJournal.journal
+        if journal is not None:
+            self.counter = journal.get(StateJournal.storage_key(self.id), self.counter)
 
     def update_counter(self):
+        # the counter is persisted before Orion is updated, so it survives a failed update
+        journal = StateJournal.journal
+        if journal is not None:
+            journal.record(StateJournal.storage_key(self.id), self.counter)
         self.update_attribute(attr_name="counter", attr_type="Number", attr_value=self.counter)
 
     def reset(self):
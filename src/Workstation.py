@@ -10,6 +10,8 @@ Made from the abstract class OrionObject
 # Custom imports
 from OrionObject import OrionObject
 from JobHandler import JobHandler
+from Reconciler import reconciler
+import Orion
 
 
 class Workstation(OrionObject):
@@ -21,6 +23,8 @@ class Workstation(OrionObject):
     Usage:
         __init__:
             workstation = Workstation(id)
+            workstation = Workstation(id, jobHandler)
+                with a JobHandler created beforehand, see JobHandler.fetch_jobHandlers
 
         turn_on(): 
             sets the available attribute of the object to True,
@@ -29,15 +33,42 @@ class Workstation(OrionObject):
         turn_off():
             sets the available attribute of the object to False,
             also updates it in Orion
+
+        handle_job_change(ref_job):
+            resets the JobHandler if the Workstation's Job changed
     """
-    def __init__(self, id: str):
+    def __init__(self, id: str, jobHandler: JobHandler = None):
         super().__init__(id)
         self.available = False  # off by default
-        self.reset_jobHandler()
+        if jobHandler is None:
+            jobHandler = JobHandler(self.id)
+        self.jobHandler = jobHandler
 
     def reset_jobHandler(self):
-        # getting a brand new JobHandler ensures that the JobHandler's counters are 0
-        self.jobHandler = JobHandler(self.id)
+        # the Workstation's refJob has changed, it must not be read from the cache
+        Orion.invalidate(self.id)
+        try:
+            # the previous Job's cycles must be written before the Job changes
+            self.jobHandler.flush_cycles()
+        finally:
+            # the previous Job's counters must not be reconciled any more
+            reconciler.discard(self.jobHandler)
+            # getting a brand new JobHandler ensures that the JobHandler's counters are 0
+            self.jobHandler = JobHandler(self.id)
+            # the previous Job's counters must not be restored after a restart
+            self.jobHandler.persist_cycle_counters()
+
+    def handle_job_change(self, ref_job: str):
+        """Reset the JobHandler if the Workstation's refJob differs from its Job
+
+        Called on the Orion notifications. If the JobHandler's counters are not
+        initiated yet, they will be initiated from the new Job anyway,
+        even if the previous Job's data was invalid.
+        """
+        if not self.jobHandler.are_counters_initiated_from_Orion:
+            reconciler.recheck(self.jobHandler)
+        elif self.jobHandler.id != ref_job:
+            self.reset_jobHandler()
 
     def update_available(self):
         self.update_attribute(attr_name="available", attr_type="Boolean", attr_value=self.available)
@@ -48,7 +79,11 @@ class Workstation(OrionObject):
 
     def turn_off(self):
         self.available = False
-        self.update_available()
+        try:
+            # the cycles are written before the Workstation is shown as off
+            self.jobHandler.flush_cycles()
+        finally:
+            self.update_available()
 
     def handle_good_cycle(self):
         self.jobHandler.handle_good_cycle()
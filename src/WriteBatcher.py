@@ -0,0 +1,203 @@
+"""WriteBatcher
+
+Coalesces attribute updates into one /v2/op/update request
+
+High-cadence machines can send several events within a few milliseconds.
+Instead of sending a POST for each of them, the WriteBatcher collects the
+pending attribute writes per object and per attribute, keeps only the
+newest value (the attributes hold absolute values, so the last write wins)
+and sends them to Orion in a single batch update with many objects.
+
+A batch is sent when the time window since its first write is over
+or when the number of pending attributes reaches the maximum batch size,
+whichever comes first.
+
+Environment variables:
+    BATCH_WINDOW_MS: the time window of a batch in milliseconds.
+        Default: 0, batching is disabled and every update is sent immediately
+    BATCH_MAX_SIZE: the maximum number of attributes in a batch. Default: 100
+"""
+
+# Standard Library imports
+import atexit
+from collections import Counter
+import os
+import threading
+import time
+
+# PyPI imports
+
+# Custom imports
+from ErrorAggregator import errors
+from Logger import getLogger
+import Orion
+
+logger = getLogger(__name__)
+
+# environment variables
+BATCH_WINDOW_MS = os.environ.get("BATCH_WINDOW_MS")
+if BATCH_WINDOW_MS is None:
+    BATCH_WINDOW_MS = 0
+else:
+    BATCH_WINDOW_MS = float(BATCH_WINDOW_MS)
+
+BATCH_MAX_SIZE = os.environ.get("BATCH_MAX_SIZE")
+if BATCH_MAX_SIZE is None:
+    BATCH_MAX_SIZE = 100
+else:
+    BATCH_MAX_SIZE = int(BATCH_MAX_SIZE)
+
+
+class WriteBatcher():
+    """Collects attribute writes and flushes them in batches from a background thread
+
+    Attributes:
+        window_ms (float): the time window of a batch in milliseconds
+        max_size (int): the maximum number of attributes in a batch
+        send (callable): sends a list of Orion objects. Default: Orion.update
+        delivered (callable): called with (object_id, attributes) for each object of a sent batch
+        failed (callable): called with the object_id of each object of a failed batch
+        pending (dict): {object_id: {attribute_name: {"type": ..., "value": ...}}}
+        batch_sizes (Counter): how many batches were sent of each size
+        writes (int): the number of writes added so far
+        coalesced (int): the number of writes superseded by a newer value before sending
+
+    Usage:
+        __init__:
+            batcher = WriteBatcher(window_ms=20, max_size=100)
+
+        add(object_id, attr_name, attr_type, attr_value, metadata=None):
+            queue a write, it never blocks on the network,
+            except after stop: then the write is sent immediately
+
+        flush():
+            send the pending writes immediately
+
+        stop():
+            send the pending writes and stop the background thread
+
+        stats():
+            return the batch statistics in a dict
+    """
+
+    def __init__(self, window_ms: float = BATCH_WINDOW_MS, max_size: int = BATCH_MAX_SIZE, send=None,
+                 delivered=None, failed=None):
+        if max_size < 1:
+            raise ValueError(f"Invalid batch size: {max_size}, it must be at least 1")
+        self.window_ms = window_ms
+        self.max_size = max_size
+        self.send = Orion.update if send is None else send
+        self.delivered = delivered
+        self.failed = failed
+        self.pending = {}
+        self.pending_count = 0
+        self.first_write_time = None
+        self.batch_sizes = Counter()
+        self.writes = 0
+        self.coalesced = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="WriteBatcher", daemon=True)
+        self.thread.start()
+
+    def add(self, object_id: str, attr_name: str, attr_type: str, attr_value, metadata: dict = None):
+        attr = {"type": attr_type, "value": attr_value}
+        if metadata is not None:
+            attr["metadata"] = metadata
+        with self.condition:
+            self.writes += 1
+            if not self.stopped:
+                attrs = self.pending.setdefault(object_id, {})
+                if attr_name in attrs:
+                    self.coalesced += 1
+                else:
+                    self.pending_count += 1
+                attrs[attr_name] = attr
+                if self.first_write_time is None:
+                    self.first_write_time = time.monotonic()
+                if self.thread is None:
+                    self.start()
+                self.condition.notify()
+                return
+        # nothing would flush the pending writes after stop
+        self.send_batch([{"id": object_id, attr_name: attr}], 1)
+
+    def take_batch(self):
+        """Return the pending writes as a list of Orion objects and clear them"""
+        batch = [{"id": object_id, **attrs} for object_id, attrs in self.pending.items()]
+        size = self.pending_count
+        self.pending = {}
+        self.pending_count = 0
+        self.first_write_time = None
+        return batch, size
+
+    def send_batch(self, batch: list, size: int):
+        if not batch:
+            return
+        try:
+            self.send(batch)
+        except Exception as error:
+            errors.report(logger, error, "Sending batch failed: ")
+            if self.failed is not None:
+                for object in batch:
+                    self.failed(object["id"])
+            return
+        with self.condition:
+            self.batch_sizes[size] += 1
+        logger.debug("Batch sent: %s attributes of %s objects", size, len(batch))
+        if self.delivered is not None:
+            for object in batch:
+                self.delivered(object["id"], {name: value for name, value in object.items() if name != "id"})
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped and not self.pending:
+                    return
+                deadline = self.first_write_time + self.window_ms / 1000
+                while self.pending_count < self.max_size and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, size = self.take_batch()
+            self.send_batch(batch, size)
+
+    def flush(self):
+        with self.condition:
+            batch, size = self.take_batch()
+        self.send_batch(batch, size)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        logger.info(f"Batch statistics: {self.stats()}")
+
+    def stats(self):
+        with self.condition:
+            batches = sum(self.batch_sizes.values())
+            sent = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                "writes": self.writes,
+                "coalesced": self.coalesced,
+                "batches": batches,
+                "mean_batch_size": sent / batches if batches else 0,
+                "max_batch_size": max(self.batch_sizes, default=0),
+                "batch_sizes": dict(self.batch_sizes),
+            }
+
+
+batcher = None
+if BATCH_WINDOW_MS > 0:
+    batcher = WriteBatcher()
+    atexit.register(batcher.stop)
+    logger.info(f"Batching attribute updates: window: {BATCH_WINDOW_MS} ms, max size: {BATCH_MAX_SIZE}")
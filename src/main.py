@@ -3,10 +3,14 @@
 
 This program loops and processes commands
 by sending pre-configured data packet to the Orion broker.
+
+Several microcontrollers can be served by a single process:
+the devices can be given as several paths or as glob patterns.
+The devices plugged in later are added, the unplugged ones are removed
+without restarting the service.
 """
 
 # Standard Library imports
-import json
 import sys
 import time
 
@@ -16,80 +20,136 @@ import serial
 # custom imports
 from Logger import getLogger
 from CommandHandler import CommandHandler
+from Dispatcher import Dispatcher
+import EventTrace
+from NotificationListener import NotificationListener, NOTIFICATION_HOST
+from SerialHub import SerialHub, SERIAL_RECHECK_PERIOD
+import Metrics
+import Orion
+import Profiler
 
 logger = getLogger(__name__)
 
 BAUD_RATE = 9600
+# the longest time to wait for Orion at startup, it is probed with backoff
 BOOT_TIME = 20
-SERIAL_RECHECK_PERIOD = 5
+# the longest time a serial read blocks while waiting for data
+SERIAL_READ_TIMEOUT = 1
+# the labels of the stages recorded by Metrics
+SERIAL_READ_LABELS = (("stage", "serial_read"),)
+PARSE_LABELS = (("stage", "parse"),)
 
 def check_args():
-    if len(sys.argv) != 2:
+    if len(sys.argv) < 2:
         print("Error: no device specified. Correct usage:")
         print("./main.py /dev/ttyUSB0")
         print("Replace /dev/ttyUSB0 with the Arduino board that will send the event numbers")
+        print("Several devices or glob patterns can be given, for example:")
+        print("./main.py /dev/ttyUSB0 /dev/ttyACM0")
+        print("./main.py '/dev/ttyUSB*'")
         sys.exit(1)
 
 def init_serial_device(dev):
-    ser = serial.Serial(dev, BAUD_RATE, timeout=1)
+    ser = serial.Serial(dev, BAUD_RATE, timeout=SERIAL_READ_TIMEOUT)
     ser.reset_input_buffer()
-    logger.info("Serial connection initialised")
+    logger.info(f"Serial connection initialised: {dev}")
     return ser
 
-def parse_concatenated_jsons(s: str):
-    """This is necessary, because the Arduino might send
-    2 or more sets of commands while the previous ones as processed like
-    '{"1": None, "3": 0.45}{"1": None, "3": 0.45}' 
-    These are concatenated jsons"""
-    comma_separated = s.replace("}{", "},{")
-    return json.loads(f"[{comma_separated}]")
-
-def handle_set_of_commands(commandHandler, set_of_commands):
-    logger.debug(f"Processing set of commands: {set_of_commands}")
+def handle_set_of_commands(dispatcher, set_of_commands, event=None):
+    logger.debug("Processing set of commands: %s", set_of_commands)
     """The Arduino sends commands in sets
     A set of commands consists of a dictionary
     For example: {"1": None, "3": 0.45} means that
     the Arduino sent 2 commands in a set:
         command "1" with arg: null,
         command "3" with arg: 0.45
-    Now let's handle each command separately"""
+    Now let's queue each command separately for the dispatch workers,
+    with the time of the serial read (see EventTrace)"""
     for command_id, arg in set_of_commands.items():
-        commandHandler.handle_command(command_id, arg)
-
-def handle_incoming_data_if_exists(commandHandler, ser):
+        dispatcher.submit(command_id, arg, event)
+
+def handle_incoming_data_if_exists(dispatcher, ser, framer):
+    """Wait for incoming data, then read everything available at once
+
+    The read blocks until the first byte arrives or the serial timeout expires,
+    so the loop does not spin while the line is idle.
+    The partial frames are kept in the framer until the rest of them arrives.
+    If the metrics are on, the time of reading the available data
+    (not the idle wait for the first byte) and of parsing it is recorded."""
+    data = ser.read(max(1, ser.in_waiting))
+    if not data:
+        return
+    event = EventTrace.ingest()
+    metrics = Metrics.metrics
+    if metrics is not None:
+        start = time.perf_counter()
     if ser.in_waiting > 0:
-        line = ser.readline().decode("utf-8").rstrip()
-        ser.reset_input_buffer()
-        logger.debug(f"Serial: incoming data: {line}")
-        decoded_commands = parse_concatenated_jsons(line)
-        logger.debug(f"Decoded commands: {decoded_commands}")
-        for set_of_commands in decoded_commands:
-            handle_set_of_commands(commandHandler, set_of_commands)
-
-def loop(commandHandler, ser):
-    while True:
-        try:
-            handle_incoming_data_if_exists(commandHandler, ser)
-        except OSError as error:
-            logger.error(f"{error}")
-            if error.errno == 5:
-                # lost connection with serial device
-                raise
-        except KeyboardInterrupt:
-            logger.info("Exiting...")
-            sys.exit()
-        except Exception as error:
-            logger.error(f"{error}")
+        data += ser.read(ser.in_waiting)
+    logger.debug("Serial: incoming data: %s", data)
+    if metrics is None:
+        decoded_commands = framer.feed(data)
+    else:
+        read = time.perf_counter()
+        decoded_commands = framer.feed(data)
+        metrics.observe(SERIAL_READ_LABELS, read - start)
+        metrics.observe(PARSE_LABELS, time.perf_counter() - read)
+        metrics.increment("serial_bytes_total", (), len(data))
+    logger.debug("Decoded commands: %s", decoded_commands)
+    for set_of_commands in decoded_commands:
+        handle_set_of_commands(dispatcher, set_of_commands, event)
+
+def loop(dispatcher, devices: list, stop_event=None):
+    """Serve the serial devices (paths or glob patterns) until the stop event is set"""
+    hub = SerialHub(devices, init_serial_device,
+                    lambda ser, framer: handle_incoming_data_if_exists(dispatcher, ser, framer),
+                    recheck_period=SERIAL_RECHECK_PERIOD)
+    try:
+        hub.run(stop_event)
+    except KeyboardInterrupt:
+        logger.info("Exiting...")
+        dispatcher.stop()
+        sys.exit()
+    finally:
+        hub.close()
+
+def start_notification_listener(commandHandler, submit, notification_host: str = NOTIFICATION_HOST):
+    """Subscribe to the Workstations' refJob changes if the NOTIFICATION_HOST is set
+
+    The notifications are turned into events and submitted like the serial events,
+    so they are handled in order with the other events of the same Workstation.
+    Returns the started NotificationListener or None."""
+    if notification_host is None:
+        return None
+
+    def submit_notification(object):
+        for command_id, arg in commandHandler.notification_events(object):
+            submit(command_id, arg)
+
+    listener = NotificationListener(submit_notification, host=notification_host).start()
+    try:
+        listener.subscribe(commandHandler.workstation_ids(), ["refJob"])
+    except Exception as error:
+        logger.error(f"Could not subscribe to the job changes: {error}")
+        listener.stop()
+        return None
+    return listener
 
 def main():
     check_args()
-    time.sleep(BOOT_TIME)
+    Orion.wait_until_reachable(BOOT_TIME)
+    if Metrics.metrics is not None:
+        Metrics.metrics.start_server()
     commandHandler = CommandHandler()
-    dev = sys.argv[1]
-    ser = init_serial_device(dev)
-    loop(commandHandler, ser)
+    Profiler.install(commandHandler)
+    dispatcher = Dispatcher(commandHandler)
+    listener = start_notification_listener(commandHandler, dispatcher.submit)
+    devices = sys.argv[1:]
+    try:
+        loop(dispatcher, devices)
+    finally:
+        if listener is not None:
+            listener.stop()
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""The asyncio service mode
+
+An alternative entry point to main.py. Usage:
+    ./main_asyncio.py /dev/ttyUSB0 /dev/ttyACM0
+    ./main_asyncio.py '/dev/ttyUSB*'
+
+The serial devices are read without blocking: their file descriptors are added
+to the event loop, which calls the reader whenever data arrives.
+The glob patterns are expanded once at startup, unlike in main.py,
+the devices plugged in later are not served.
+The events are dispatched concurrently: each Orion object
+(and each special request target) has its own queue and consumer task,
+so the writes to the same object stay in order, while the writes to different
+Workstations and Storages are sent in parallel.
+
+The Storage, Workstation and JobHandler state logic and the HTTP requests
+are the same as in main.py: the consumer tasks call CommandHandler.handle_command
+in a thread pool, whose size is the HTTP connection pool size.
+"""
+
+# Standard Library imports
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import time
+
+# PyPI imports
+
+# custom imports
+from Logger import getLogger
+from CommandHandler import CommandHandler
+from Dispatcher import EVENT_QUEUE_SIZE
+from ErrorAggregator import errors
+import EventTrace
+import Metrics
+from OrionClient import HTTP_POOL_SIZE
+from SerialFramer import SerialFramer
+from SerialHub import match_devices
+import main
+import Orion
+import Profiler
+
+logger = getLogger(__name__)
+
+
+class AsyncDispatcher():
+    """Per-object ordered, concurrent dispatch on an asyncio event loop
+
+    Attributes:
+        commandHandler (CommandHandler): handles the events
+        executor (ThreadPoolExecutor): runs the blocking handle_command calls
+        queues (dict): the queue of each ordering key
+        queue_size (int): the maximum number of queued events per key,
+            if a queue is full, its oldest event is dropped
+        dispatched (int): the number of events handled successfully
+        failed (int): the number of events whose handling raised an exception
+        dropped (int): the number of events dropped because a queue was full
+
+    Usage:
+        __init__:
+            dispatcher = AsyncDispatcher(commandHandler)
+                must be created in a running event loop
+
+        submit(command_id, arg, event=None):
+            queue an event, it never blocks
+
+        join():
+            coroutine, wait until all queued events are handled
+
+        stop():
+            coroutine, cancel the consumer tasks and shut down the executor
+    """
+
+    def __init__(self, commandHandler, workers: int = HTTP_POOL_SIZE, queue_size: int = EVENT_QUEUE_SIZE):
+        self.commandHandler = commandHandler
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="AsyncDispatcher")
+        self.queue_size = queue_size
+        self.queues = {}
+        self.tasks = []
+        self.dispatched = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def submit(self, command_id: str, arg=None, event=None):
+        key = self.commandHandler.ordering_key(command_id)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue(self.queue_size)
+            self.queues[key] = queue
+            self.tasks.append(asyncio.get_running_loop().create_task(self.consume(queue)))
+        if queue.full():
+            queue.get_nowait()
+            queue.task_done()
+            self.dropped += 1
+        queue.put_nowait((command_id, arg, event))
+
+    async def consume(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            command_id, arg, event = await queue.get()
+            try:
+                await loop.run_in_executor(self.executor, self.commandHandler.handle_command, command_id, arg, event)
+                self.dispatched += 1
+            except Exception as error:
+                self.failed += 1
+                errors.report(logger, error)
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        for queue in list(self.queues.values()):
+            await queue.join()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+        logger.info(f"AsyncDispatcher stopped: dispatched: {self.dispatched}, failed: {self.failed}, dropped: {self.dropped}")
+
+
+def read_serial(dispatcher, ser, framer, lost: asyncio.Future):
+    """Called by the event loop whenever a serial device is readable
+
+    A disconnected device is no longer read, and its lost future gets the error
+    """
+    try:
+        waiting = ser.in_waiting
+        data = ser.read(waiting)
+        if not data:
+            # readable, but no data: the device is disconnected
+            raise OSError(5, "Serial device disconnected")
+        event = EventTrace.ingest()
+        logger.debug("Serial: incoming data: %s", data)
+        metrics = Metrics.metrics
+        if metrics is None:
+            decoded_commands = framer.feed(data)
+        else:
+            start = time.perf_counter()
+            decoded_commands = framer.feed(data)
+            metrics.observe(main.PARSE_LABELS, time.perf_counter() - start)
+            metrics.increment("serial_bytes_total", (), len(data))
+        for set_of_commands in decoded_commands:
+            main.handle_set_of_commands(dispatcher, set_of_commands, event)
+    except OSError as error:
+        errors.report(logger, error, f"{ser.port}: ")
+        # a disconnected device stays readable, the loop would call the reader again and again
+        asyncio.get_running_loop().remove_reader(ser.fileno())
+        if not lost.done():
+            lost.set_exception(error)
+    except Exception as error:
+        errors.report(logger, error)
+
+
+async def serve(commandHandler, *devices):
+    """Dispatch the events of the serial devices until all of them are disconnected
+
+    Raises:
+        OSError: the error of the first disconnected device
+    """
+    loop = asyncio.get_running_loop()
+    dispatcher = AsyncDispatcher(commandHandler)
+    losts = []
+    for ser in devices:
+        lost = loop.create_future()
+        # the event loop calls the reader, the reads must never block
+        ser.timeout = 0
+        loop.add_reader(ser.fileno(), read_serial, dispatcher, ser, SerialFramer(), lost)
+        losts.append(lost)
+    # the notifications arrive in the listener's thread
+    listener = main.start_notification_listener(
+        commandHandler, lambda command_id, arg: loop.call_soon_threadsafe(dispatcher.submit, command_id, arg))
+    try:
+        await asyncio.wait(losts)
+        raise [lost.exception() for lost in losts][0]
+    finally:
+        for ser in devices:
+            loop.remove_reader(ser.fileno())
+        if listener is not None:
+            listener.stop()
+        await dispatcher.join()
+        await dispatcher.stop()
+
+
+def main_asyncio():
+    main.check_args()
+    Orion.wait_until_reachable(main.BOOT_TIME)
+    if Metrics.metrics is not None:
+        Metrics.metrics.start_server()
+    commandHandler = CommandHandler()
+    Profiler.install(commandHandler)
+    paths = match_devices(sys.argv[1:])
+    if not paths:
+        logger.error(f"No serial device matches {sys.argv[1:]}")
+        sys.exit(1)
+    devices = [main.init_serial_device(path) for path in paths]
+    try:
+        asyncio.run(serve(commandHandler, *devices))
+    except KeyboardInterrupt:
+        logger.info("Exiting...")
+        sys.exit()
+
+
+if __name__ == "__main__":
+    main_asyncio()
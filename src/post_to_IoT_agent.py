@@ -1,8 +1,9 @@
 import os
-
-import requests
+import time
 
 from Logger import getLogger
+from OrionClient import client, HTTPStatusError
+import Metrics
 
 logger = getLogger(__name__)
 
@@ -14,17 +15,36 @@ IOTAGENT_HTTP_PORT = os.environ.get("IOTAGENT_HTTP_PORT")
 if IOTAGENT_HTTP_PORT is None:
     raise ValueError("IOTAGENT_HTTP_PORT environment variable is not set")
 
-TIMEOUT = os.environ.get("TIMEOUT")
-if TIMEOUT is None:
-    TIMEOUT = 5
-    logger.warning(f"TIMEOUT environtment variable is not set, using default value: {TIMEOUT}")
-else:
-    TIMEOUT = int(TIMEOUT)
-
-def post_to_IoT_agent(req: dict):
-    logger.debug(f"post_to_IoT_agent: req: {req}")
-    logger.debug(f"post_to_IoT_agent: url: http://{MOMAMS_HOST}:{IOTAGENT_HTTP_PORT}")
-    res = requests.post(url=f"http://{MOMAMS_HOST}:{IOTAGENT_HTTP_PORT}", headers={"Content-Type": "application/json"}, json=req, timeout=TIMEOUT)
-    if res.status_code != 204:
-        raise RuntimeError(f"Sending request to the IoT agent failed. Response:{res}")
+# the labels of the stage recorded by Metrics
+METRIC_LABELS = (("stage", "iot_agent"),)
+
+def post_to_IoT_agent(req):
+    """Send a special request to the IoT agent
 
+    If the metrics are on, the duration of the request is recorded.
+
+    Args:
+        req: the request as a dict, or already encoded to JSON bytes (see RequestTemplate)
+    """
+    metrics = Metrics.metrics
+    if metrics is None:
+        return send(req)
+    start = time.perf_counter()
+    try:
+        return send(req)
+    except Exception:
+        metrics.increment("errors_total", METRIC_LABELS)
+        raise
+    finally:
+        metrics.observe(METRIC_LABELS, time.perf_counter() - start)
+
+def send(req):
+    logger.debug("post_to_IoT_agent: req: %s", req)
+    logger.debug("post_to_IoT_agent: url: http://%s:%s", MOMAMS_HOST, IOTAGENT_HTTP_PORT)
+    if isinstance(req, bytes):
+        res = client.post(url=f"http://{MOMAMS_HOST}:{IOTAGENT_HTTP_PORT}", headers={"Content-Type": "application/json"}, data=req)
+    else:
+        res = client.post(url=f"http://{MOMAMS_HOST}:{IOTAGENT_HTTP_PORT}", headers={"Content-Type": "application/json"}, json=req)
+    if res.status_code != 204:
+        raise HTTPStatusError(f"Sending request to the IoT agent failed. Response:{res}", res.status_code)
+    return res.status_code
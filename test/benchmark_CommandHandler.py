@@ -0,0 +1,106 @@
+"""
+Benchmark: events per second through the CommandHandler's dispatch layer
+with the network stubbed out
+
+The compiled handlers of CommandHandler.handle_command are compared
+with interpreting the command dict for every event (the lookup, the special check,
+the isinstance checks and the command type if-chains), as it was done before.
+The Orion writes are replaced by a no-op, so only the dispatch is measured.
+Run it from the test directory:
+    python benchmark_CommandHandler.py [number of events]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+N_EVENTS = 200000
+N_WORKSTATIONS = 4
+N_STORAGES = 4
+
+# the stub and the configuration must exist before the service modules are imported
+stub = StubOrion().start()
+config = tempfile.TemporaryDirectory()
+for obj in make_test_config.main(config.name, N_WORKSTATIONS, N_STORAGES):
+    stub.put(obj)
+os.environ.update(ORION_HOST=stub.host, ORION_PORT=str(stub.port), IOTAGENT_HTTP_PORT=str(stub.port),
+                  RPI_COMMANDS_CONFIG=config.name, LOGGING_LEVEL="WARNING", TIMEOUT="5")
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from RequestTemplate import RequestTemplate
+from Storage import Storage
+from Workstation import Workstation
+import Orion
+
+
+def interpreted_handle_command(commandHandler: CommandHandler, command_id: str, arg=None):
+    """The dispatch of every event before the commands were compiled"""
+    if command_id not in commandHandler.commands:
+        raise ValueError(f"command not specified in commands.json: {command_id}")
+    command = commandHandler.commands[command_id]
+    if "special" in command.keys():
+        commandHandler.handle_special_command(RequestTemplate(command["request"]), arg)
+        return
+    if "object_id" not in command:
+        raise ValueError(f'Missing key: "object_id" in command: {command}')
+    object_id = command["object_id"]
+    if object_id not in commandHandler.objects:
+        raise ValueError(f"Object not specified in a json file: {object_id}")
+    object = commandHandler.objects[object_id]["py"]
+    if isinstance(object, Storage):
+        if command["type"] not in ("step", "reset", "set_empty", "set_full"):
+            raise NotImplementedError(f"command type {command['type']} not implemented for {object.id}")
+        if command["type"] == "step":
+            object.step()
+        if command["type"] == "reset":
+            object.reset()
+        if command["type"] == "set_empty":
+            object.set_empty()
+        if command["type"] == "set_full":
+            object.set_full()
+    if isinstance(object, Workstation):
+        if command["type"] not in ("turn_on", "turn_off", "handle_good_cycle", "handle_reject_cycle", "new_job"):
+            raise NotImplementedError(f"command type {command['type']} not implemented for {object.id}")
+        if command["type"] == "turn_on":
+            object.turn_on()
+        if command["type"] == "turn_off":
+            object.turn_off()
+        if command["type"] == "handle_good_cycle":
+            object.handle_good_cycle()
+        if command["type"] == "handle_reject_cycle":
+            object.handle_reject_cycle()
+
+
+def events_per_second(handle_command, command_ids: list, n: int):
+    start = time.perf_counter()
+    for i in range(n):
+        handle_command(command_ids[i % len(command_ids)])
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVENTS
+    try:
+        commandHandler = CommandHandler()
+    finally:
+        stub.stop()
+        config.cleanup()
+    # stub out the network
+    Orion.update_attribute = lambda *args, **kwargs: None
+    # new_job reads the new Job from Orion, so it is left out
+    command_ids = [command_id for command_id in commandHandler.commands if not command_id.endswith("_new_job")]
+    interpreted = events_per_second(lambda command_id: interpreted_handle_command(commandHandler, command_id),
+                                    command_ids, n)
+    compiled = events_per_second(commandHandler.handle_command, command_ids, n)
+    print(f"{n} events, {len(command_ids)} commands")
+    print(f"interpreted command dicts: {interpreted:8.0f} events/s")
+    print(f"compiled handlers:         {compiled:8.0f} events/s")
+    print(f"speedup: {compiled / interpreted:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
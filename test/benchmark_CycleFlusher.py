@@ -0,0 +1,76 @@
+"""
+Benchmark: Orion writes and staleness of the part counters with the CycleFlusher
+
+A fast press finishing a cycle every CYCLE_PERIOD seconds is simulated.
+Without the CycleFlusher every cycle writes the Job's part counter,
+with it the counter is written at most every CYCLE_FLUSH_INTERVAL_MS
+or every CYCLE_FLUSH_MAX_CYCLES cycles. The write reduction ratio
+(cycles per write) and the longest time between a cycle and its write
+(the staleness of the counter in Orion) are measured.
+Run it from the test directory:
+    python benchmark_CycleFlusher.py [number of cycles]
+"""
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+N_CYCLES = 500
+CYCLE_PERIOD = 0.005  # s
+SETTINGS = [(50, 10), (200, 10), (200, 50), (1000, 100)]  # (CYCLE_FLUSH_INTERVAL_MS, CYCLE_FLUSH_MAX_CYCLES)
+
+# the stub must exist before the service modules are imported
+stub = StubOrion().start()
+for obj in make_test_config.make_objects(1):
+    stub.put(obj)
+os.environ.update(ORION_HOST=stub.host, ORION_PORT=str(stub.port), IOTAGENT_HTTP_PORT=str(stub.port),
+                  RPI_COMMANDS_CONFIG=tempfile.gettempdir(), LOGGING_LEVEL="WARNING", TIMEOUT="5")
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CycleFlusher import CycleFlusher
+from JobHandler import JobHandler
+from Reconciler import reconciler
+import CycleFlusher as CycleFlusherModule
+
+JOB_ID = make_test_config.job_id(0)
+
+
+def run(n: int, flusher: CycleFlusher):
+    """Return the number of writes and the staleness in ms"""
+    with patch.object(CycleFlusherModule, "flusher", flusher):
+        jobHandler = JobHandler(make_test_config.workstation_id(0))
+        reconciler.drain(5)
+        writes_before = stub.count("POST", f"/v2/entities/{JOB_ID}/attrs")
+        staleness = 0
+        for _ in range(n):
+            start = time.monotonic()
+            jobHandler.handle_good_cycle()
+            staleness = max(staleness, time.monotonic() - start)
+            time.sleep(CYCLE_PERIOD)
+        if flusher is not None:
+            flusher.stop()
+            staleness = flusher.max_staleness
+    writes = stub.count("POST", f"/v2/entities/{JOB_ID}/attrs") - writes_before
+    return writes, staleness * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_CYCLES
+    print(f"{n} cycles, one every {CYCLE_PERIOD * 1000:.0f} ms")
+    writes, staleness = run(n, None)
+    print(f"{'every cycle written':32s} writes: {writes:5d}, reduction: {n / writes:6.1f}x, "
+          f"max staleness: {staleness:6.1f} ms")
+    for interval_ms, max_cycles in SETTINGS:
+        writes, staleness = run(n, CycleFlusher(interval_ms=interval_ms, max_cycles=max_cycles))
+        name = f"interval {interval_ms} ms, {max_cycles} cycles"
+        print(f"{name:32s} writes: {writes:5d}, reduction: {n / writes:6.1f}x, "
+              f"max staleness: {staleness:6.1f} ms (bound: {interval_ms} ms + 1 write)")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
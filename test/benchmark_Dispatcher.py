@@ -0,0 +1,66 @@
+"""
+Benchmark: events per second handled by the Dispatcher
+with different numbers of dispatch workers
+
+Runs against a local StubOrion that answers every request after DELAY seconds,
+like a remote MOMAMS server, no MOMAMS is needed.
+The events are good cycles of N_WORKSTATIONS Workstations,
+so the events of each Workstation are handled in order by one worker.
+Run it from the test directory:
+    python benchmark_Dispatcher.py [number of events]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+N_EVENTS = 400
+N_WORKSTATIONS = 16
+WORKERS = (1, 2, 4, 8, 16)
+DELAY = 0.01  # s
+
+# the stub and the configuration must exist before the service modules are imported
+stub = StubOrion(delay=DELAY).start()
+config = tempfile.TemporaryDirectory()
+for obj in make_test_config.main(config.name, N_WORKSTATIONS):
+    stub.put(obj)
+os.environ.update(ORION_HOST=stub.host, ORION_PORT=str(stub.port), IOTAGENT_HTTP_PORT=str(stub.port),
+                  RPI_COMMANDS_CONFIG=config.name, HTTP_POOL_SIZE=str(max(WORKERS)),
+                  LOGGING_LEVEL="WARNING", TIMEOUT="5")
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from Dispatcher import Dispatcher
+
+
+def events_per_second(commandHandler: CommandHandler, workers: int, n: int):
+    dispatcher = Dispatcher(commandHandler, workers=workers, queue_size=n, policy="block")
+    start = time.perf_counter()
+    for i in range(n):
+        dispatcher.submit(f"Workstation{i % N_WORKSTATIONS}_good_parts_completed")
+    dispatcher.stop()
+    elapsed = time.perf_counter() - start
+    stats = dispatcher.stats()
+    if stats["dispatched"] != n:
+        raise RuntimeError(f"Not all events were dispatched: {stats}")
+    return n / elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVENTS
+    try:
+        commandHandler = CommandHandler()
+        results = {workers: events_per_second(commandHandler, workers, n) for workers in WORKERS}
+    finally:
+        stub.stop()
+        config.cleanup()
+    print(f"{n} events of {N_WORKSTATIONS} Workstations, Orion delay: {DELAY * 1000:.0f} ms")
+    for workers, rate in results.items():
+        print(f"{workers:2d} workers: {rate:6.0f} events/s, speedup: {rate / results[1]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
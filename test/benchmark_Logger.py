@@ -0,0 +1,89 @@
+"""
+Benchmark: the cost of logging per event at INFO level, in the event's thread
+
+Each event logs an INFO line (like "Good cycle completed") and a DEBUG line
+with a payload (like Orion.update's data). Before, every handler formatted
+and wrote the record in the event's thread, the DEBUG f-string was built
+even though DEBUG was disabled, and every JobHandler added another handler
+to the same logger. Now the record is queued to the background writer
+and the DEBUG message is never built.
+The records are written to a file in a temporary directory.
+Run it from the test directory:
+    python benchmark_Logger.py [number of events]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join("..", "src"))
+import Logger
+
+N_EVENTS = 20000
+N_JOB_HANDLERS = 5  # the number of JobHandlers created, each added a handler before
+PAYLOAD = [{"id": f"urn:ngsiv2:i40Asset:Storage{i}", "counter": {"type": "Number", "value": i}} for i in range(20)]
+
+
+def old_getLogger(name: str, path: str):
+    """Logger.getLogger before the queue: a new handler for every call"""
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(asctime)s:%(name)s:%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+def microseconds_per_event(log_event, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        log_event()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVENTS
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "old.log")
+        logger = old_getLogger("old_single", path)
+
+        def old_event():
+            logger.info("Good cycle completed")
+            logger.debug(f"update: data: {PAYLOAD}")
+
+        results["direct handler, eager f-string"] = microseconds_per_event(old_event, n)
+        for _ in range(N_JOB_HANDLERS):
+            duplicated = old_getLogger("old_duplicated", path)
+
+        def duplicated_event():
+            duplicated.info("Good cycle completed")
+            duplicated.debug(f"update: data: {PAYLOAD}")
+
+        results[f"{N_JOB_HANDLERS} duplicated handlers"] = microseconds_per_event(duplicated_event, n)
+
+        cwd = os.getcwd()
+        os.chdir(directory)
+        Logger.stop()
+        with patch.object(Logger, "LOG_TO_FILE", True), patch.object(Logger, "LOG_TO_STDOUT", False), \
+                patch.object(Logger, "LOGGING_LEVEL", "INFO"):
+            for _ in range(N_JOB_HANDLERS):
+                queued = Logger.getLogger("queued")
+
+            def queued_event():
+                queued.info("Good cycle completed")
+                queued.debug("update: data: %s", PAYLOAD)
+
+            results["queue, lazy %-formatting"] = microseconds_per_event(queued_event, n)
+            Logger.stop()
+        os.chdir(cwd)
+    baseline = results["direct handler, eager f-string"]
+    print(f"{n} events, cost in the event's thread")
+    for name, cost in results.items():
+        print(f"{name:32s} {cost:6.1f} us/event, speedup: {baseline / cost:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark: the overhead of the metrics per dispatched event
+
+A CommandHandler with a no-op handler is called directly, so only the
+instrumentation of handle_command is measured: with the metrics off
+(Metrics.metrics is None) and on (a histogram observation per event).
+Run it from the test directory:
+    python benchmark_Metrics.py [number of events]
+"""
+import os
+import sys
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+import Metrics
+
+N_EVENTS = 200000
+
+
+def make_commandHandler():
+    commandHandler = CommandHandler.__new__(CommandHandler)
+    commandHandler.commands = {"1": {"object_id": "urn:ngsiv2:i40Asset:Workstation1", "type": "turn_on"}}
+    commandHandler.handlers = {"1": lambda arg=None: None}
+    commandHandler.ordering_keys = {"1": "urn:ngsiv2:i40Asset:Workstation1"}
+    commandHandler.metric_labels = {"1": commandHandler.make_metric_labels("1")}
+    return commandHandler
+
+
+def nanoseconds_per_event(commandHandler, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        commandHandler.handle_command("1")
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVENTS
+    commandHandler = make_commandHandler()
+    with patch.object(Metrics, "metrics", None):
+        off = nanoseconds_per_event(commandHandler, n)
+    with patch.object(Metrics, "metrics", Metrics.Metrics()):
+        on = nanoseconds_per_event(commandHandler, n)
+    print(f"{n} events, handle_command with a no-op handler")
+    print(f"metrics off {off:6.0f} ns/event")
+    print(f"metrics on  {on:6.0f} ns/event, overhead: {on - off:.0f} ns/event")
+
+
+if __name__ == "__main__":
+    main()
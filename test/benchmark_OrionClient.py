@@ -0,0 +1,53 @@
+"""
+Benchmark: requests per second of the pooled OrionClient
+compared with the module level requests functions
+(a new TCP connection for every request)
+
+Runs against a local StubOrion, no MOMAMS is needed. Run it from the test directory:
+    python benchmark_OrionClient.py [number of requests]
+"""
+import os
+import sys
+import time
+
+import requests
+
+from modules.stub_Orion import StubOrion
+
+sys.path.insert(0, os.path.join("..", "src"))
+from OrionClient import OrionClient
+
+N_REQUESTS = 2000
+PAYLOAD = {
+    "actionType": "append",
+    "entities": [{"id": "urn:ngsiv2:i40Asset:Storage1", "counter": {"type": "Number", "value": 1}}],
+}
+
+
+def requests_per_second(post, url: str, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        response = post(url, json=PAYLOAD)
+        if response.status_code != 204:
+            raise RuntimeError(f"Unexpected status code: {response.status_code}")
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_REQUESTS
+    stub = StubOrion().start()
+    url = f"{stub.url}/v2/op/update"
+    client = OrionClient()
+    try:
+        per_call = requests_per_second(requests.post, url, n)
+        pooled = requests_per_second(client.post, url, n)
+    finally:
+        client.close()
+        stub.stop()
+    print(f"requests.post (new connection per request): {per_call:.0f} requests/s")
+    print(f"OrionClient (pooled, keep-alive):           {pooled:.0f} requests/s")
+    print(f"speedup: {pooled / per_call:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark: the cost of encoding a special request per event
+
+Before, the request was copied, its "data" was set to the argument,
+and the whole request was encoded to JSON for every event.
+The RequestTemplate encodes the request once, and only the argument
+is encoded for each event. Both JSON backends are measured.
+Run it from the test directory:
+    python benchmark_RequestTemplate.py [number of events]
+"""
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join("..", "src"))
+from RequestTemplate import RequestTemplate
+import RequestTemplate as RequestTemplateModule
+
+N_EVENTS = 200000
+REQUEST = {
+    "url": "http://orion:1026/v2/entities/urn:ngsi_ld:Workstation:InjectionMoulding1/attrs/RefJob/value",
+    "method": "PUT",
+    "headers": ["Content-Type: text/plain"],
+    "data": "urn:ngsi_ld:Job:202200047",
+}
+ARG = "urn:ngsi_ld:Job:202200048"
+
+
+def encode_every_time(arg):
+    """The encoding of every event before the templates, as requests encodes json= bodies"""
+    req = dict(REQUEST)
+    req["data"] = arg
+    return json.dumps(req, allow_nan=False).encode("utf-8")
+
+
+def nanoseconds_per_event(encode, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        encode(ARG)
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVENTS
+    results = {"encoding the whole request": nanoseconds_per_event(encode_every_time, n)}
+    with patch.object(RequestTemplateModule, "orjson", None):
+        results["template, json"] = nanoseconds_per_event(RequestTemplate(REQUEST).render, n)
+    if RequestTemplateModule.orjson is not None:
+        results["template, orjson"] = nanoseconds_per_event(RequestTemplate(REQUEST).render, n)
+    baseline = results["encoding the whole request"]
+    print(f"{n} events")
+    for name, cost in results.items():
+        print(f"{name:28s} {cost:7.0f} ns/event, speedup: {baseline / cost:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
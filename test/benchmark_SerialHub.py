@@ -0,0 +1,95 @@
+"""
+Benchmark: memory and CPU of one process serving N serial devices
+compared with N separate processes serving one device each
+
+Pseudo-terminals stand in for the Arduinos, a local StubOrion for MOMAMS.
+Each device sends EVENT_RATE good cycle events per second for DURATION seconds.
+Linux only (reads /proc). Run it from the test directory:
+    python benchmark_SerialHub.py [number of devices]
+"""
+import os
+import pty
+import subprocess
+import sys
+import tempfile
+import time
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+N_DEVICES = 8
+EVENT_RATE = 5  # events/s/device
+DURATION = 5  # s
+STARTUP_TIME = 3  # s
+SERVICE = "import sys, main; main.BOOT_TIME = 0; sys.argv = ['main.py'] + sys.argv[1:]; main.main()"
+
+
+def rss_kb(pid: int):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds(pid: int):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def start_services(device_groups: list, env: dict):
+    src = os.path.abspath(os.path.join("..", "src"))
+    return [subprocess.Popen([sys.executable, "-c", SERVICE, *devices], cwd=src, env=env)
+            for devices in device_groups]
+
+
+def measure(device_groups: list, masters: list, env: dict, stub: StubOrion):
+    processes = start_services(device_groups, env)
+    try:
+        time.sleep(STARTUP_TIME)
+        writes_start = stub.count("POST")
+        cpu_start = sum(cpu_seconds(p.pid) for p in processes)
+        for i in range(DURATION * EVENT_RATE):
+            for j, master in enumerate(masters):
+                os.write(master, f'{{"Workstation{j}_good_parts_completed": null}}\n'.encode("utf-8"))
+            time.sleep(1 / EVENT_RATE)
+        time.sleep(1)
+        cpu = sum(cpu_seconds(p.pid) for p in processes) - cpu_start
+        rss = sum(rss_kb(p.pid) for p in processes)
+        writes = stub.count("POST") - writes_start
+    finally:
+        for p in processes:
+            p.terminate()
+            p.wait()
+    return rss, cpu, writes
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_DEVICES
+    stub = StubOrion().start()
+    config = tempfile.TemporaryDirectory()
+    for obj in make_test_config.main(config.name, n):
+        stub.put(obj)
+    env = dict(os.environ, ORION_HOST=stub.host, ORION_PORT=str(stub.port), IOTAGENT_HTTP_PORT=str(stub.port),
+               RPI_COMMANDS_CONFIG=config.name, LOGGING_LEVEL="WARNING", TIMEOUT="5")
+    ptys = [pty.openpty() for _ in range(n)]
+    masters = [master for master, _ in ptys]
+    paths = [os.ttyname(slave) for _, slave in ptys]
+    try:
+        hub_rss, hub_cpu, hub_writes = measure([paths], masters, env, stub)
+        sep_rss, sep_cpu, sep_writes = measure([[path] for path in paths], masters, env, stub)
+    finally:
+        for master, slave in ptys:
+            os.close(slave)
+            os.close(master)
+        stub.stop()
+        config.cleanup()
+    events = n * DURATION * EVENT_RATE
+    print(f"{n} devices, {events} events in {DURATION} s")
+    print(f"1 process, {n} devices:   RSS: {hub_rss / 1024:6.1f} MiB, CPU: {hub_cpu:.2f} s, Orion writes: {hub_writes}")
+    print(f"{n} processes, 1 device: RSS: {sep_rss / 1024:6.1f} MiB, CPU: {sep_cpu:.2f} s, Orion writes: {sep_writes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark: the per-event cost of persisting the counters in the StateJournal
+
+Each event records one counter change, like a Storage step or a good cycle.
+The cost is measured on the local disk with an fsync after every event
+and with an fsync at most every FSYNC_INTERVAL seconds.
+An SD card (like the Raspberry Pi's) is simulated by adding SD_FSYNC_LATENCY
+to every fsync, a typical latency of a small synchronous write on an SD card.
+Run it from the test directory:
+    python benchmark_StateJournal.py [number of events]
+"""
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join("..", "src"))
+from StateJournal import StateJournal
+
+N_EVENTS = 2000
+FSYNC_INTERVAL = 1  # s
+SD_FSYNC_LATENCY = 0.01  # s
+
+
+def microseconds_per_event(path: str, n: int, fsync_interval: float):
+    journal = StateJournal(path, fsync_interval=fsync_interval)
+    start = time.perf_counter()
+    for i in range(n):
+        journal.record("JobHandler:urn:ngsiv2:i40Asset:Workstation1",
+                       {"job": "urn:ngsiv2:i40Process:Job1", "parts_per_cycle": 8, "good": i, "reject": 0})
+    elapsed = time.perf_counter() - start
+    journal.close()
+    return elapsed / n * 1e6, journal.fsyncs
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVENTS
+    fsync = os.fsync
+
+    def sd_card_fsync(fd):
+        fsync(fd)
+        time.sleep(SD_FSYNC_LATENCY)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.journal")
+        results["local disk, fsync every event"] = microseconds_per_event(path, n, 0)
+        results[f"local disk, fsync every {FSYNC_INTERVAL} s"] = microseconds_per_event(path, n, FSYNC_INTERVAL)
+        with patch("os.fsync", sd_card_fsync):
+            results["simulated SD card, fsync every event"] = microseconds_per_event(path, n // 10, 0)
+            results[f"simulated SD card, fsync every {FSYNC_INTERVAL} s"] = microseconds_per_event(path, n, FSYNC_INTERVAL)
+    print(f"{n} events, simulated SD card fsync latency: {SD_FSYNC_LATENCY * 1000:.0f} ms")
+    for name, (cost, fsyncs) in results.items():
+        print(f"{name:40s} {cost:9.1f} us/event, fsyncs: {fsyncs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: startup time of the CommandHandler with 1, 10 and 100 Workstations
+
+The bulk startup (the objects, Workstations, Jobs and Operations are queried
+with a few concurrent /v2/op/query requests) is compared with the sequential
+per-object GET requests used before (a reachability check and 3 GETs
+for each JobHandler, then one GET for each object to confirm its existence).
+The fixed 20 s boot sleep is replaced by a readiness probe, its time is also reported.
+
+Runs against a local StubOrion that answers every request after DELAY seconds,
+like a remote MOMAMS server, no MOMAMS is needed. Run it from the test directory:
+    python benchmark_startup.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+N_WORKSTATIONS = (1, 10, 100)
+DELAY = 0.005  # s
+
+# the stub must exist before the service modules are imported
+stub = StubOrion(delay=DELAY).start()
+os.environ.update(ORION_HOST=stub.host, ORION_PORT=str(stub.port), IOTAGENT_HTTP_PORT=str(stub.port),
+                  RPI_COMMANDS_CONFIG=tempfile.gettempdir(), LOGGING_LEVEL="WARNING", TIMEOUT="5")
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from Workstation import Workstation
+import Orion
+
+
+def sequential_startup(objects: list):
+    """The per-object requests of the startup before the bulk queries"""
+    for obj in objects:
+        if obj.get("i40AssetType", {}).get("value") == "Workstation":
+            Workstation(obj["id"])
+    for obj in objects:
+        Orion.exists(obj["id"])
+
+
+def measure(n: int):
+    with tempfile.TemporaryDirectory() as config:
+        objects = make_test_config.main(config, n)
+        for obj in objects:
+            stub.put(obj)
+        CommandHandler.RPI_COMMANDS_CONFIG = config
+        start = time.perf_counter()
+        sequential_startup(objects)
+        sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        CommandHandler()
+        bulk = time.perf_counter() - start
+    return sequential, bulk
+
+
+def main():
+    try:
+        start = time.perf_counter()
+        Orion.wait_until_reachable(20)
+        probe = time.perf_counter() - start
+        results = {n: measure(n) for n in N_WORKSTATIONS}
+    finally:
+        stub.stop()
+    print(f"Orion delay: {DELAY * 1000:.0f} ms")
+    print(f"readiness probe: {probe * 1000:.0f} ms (instead of the fixed 20 s boot sleep)")
+    for n, (sequential, bulk) in results.items():
+        print(f"{n:3d} Workstations: sequential GETs: {sequential * 1000:7.0f} ms, "
+              f"bulk queries: {bulk * 1000:5.0f} ms, speedup: {sequential / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
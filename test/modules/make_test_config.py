@@ -0,0 +1,98 @@
+"""
+Generates a configuration directory (commands.json and the json directory)
+with any number of Workstations and Storages, like the config repository does.
+
+The benchmarks use it together with the StubOrion:
+the generated objects are also returned, so they can be put into the stub.
+
+Each Workstation has a Job and an Operation (8 parts per cycle) and the commands
+Workstation<i>_on, Workstation<i>_off, Workstation<i>_good_parts_completed,
+Workstation<i>_reject_parts_completed and Workstation<i>_new_job.
+Each Storage has the commands Storage<i>_step and Storage<i>_reset.
+"""
+
+import json
+import os
+
+PARTS_PER_CYCLE = 8
+
+
+def workstation_id(i: int):
+    return f"urn:ngsiv2:i40Asset:Workstation{i}"
+
+
+def storage_id(i: int):
+    return f"urn:ngsiv2:i40Asset:Storage{i}"
+
+
+def job_id(i: int):
+    return f"urn:ngsiv2:i40Process:Job{i}"
+
+
+def make_objects(n_workstations: int, n_storages: int = 0):
+    """Return the Orion objects of the Workstations, their Jobs and Operations and the Storages"""
+    objects = []
+    for i in range(n_workstations):
+        operation_id = f"urn:ngsiv2:i40Recipe:Operation{i}"
+        objects.append({
+            "id": workstation_id(i),
+            "type": "i40Asset",
+            "i40AssetType": {"type": "Text", "value": "Workstation"},
+            "available": {"type": "Boolean", "value": False},
+            "refJob": {"type": "Relationship", "value": job_id(i)},
+        })
+        objects.append({
+            "id": job_id(i),
+            "type": "i40Process",
+            "refWorkstation": {"type": "Relationship", "value": workstation_id(i)},
+            "refOperation": {"type": "Relationship", "value": operation_id},
+            "goodPartCounter": {"type": "Number", "value": 0},
+            "rejectPartCounter": {"type": "Number", "value": 0},
+        })
+        objects.append({
+            "id": operation_id,
+            "type": "i40Recipe",
+            "partsPerCycle": {"type": "Number", "value": PARTS_PER_CYCLE},
+        })
+    for i in range(n_storages):
+        objects.append({
+            "id": storage_id(i),
+            "type": "i40Asset",
+            "i40AssetType": {"type": "Text", "value": "Storage"},
+            "i40AssetSubType": {"type": "Text", "value": "emptying"},
+            "capacity": {"type": "Number", "value": 1000},
+            "step": {"type": "Number", "value": -1},
+            "counter": {"type": "Number", "value": 1000},
+        })
+    return objects
+
+
+def make_commands(n_workstations: int, n_storages: int = 0):
+    commands = {}
+    types = {
+        "on": "turn_on",
+        "off": "turn_off",
+        "good_parts_completed": "handle_good_cycle",
+        "reject_parts_completed": "handle_reject_cycle",
+        "new_job": "new_job",
+    }
+    for i in range(n_workstations):
+        for suffix, type in types.items():
+            commands[f"Workstation{i}_{suffix}"] = {"object_id": workstation_id(i), "type": type}
+    for i in range(n_storages):
+        commands[f"Storage{i}_step"] = {"object_id": storage_id(i), "type": "step"}
+        commands[f"Storage{i}_reset"] = {"object_id": storage_id(i), "type": "reset"}
+    return commands
+
+
+def main(directory: str, n_workstations: int, n_storages: int = 0):
+    """Write the configuration into directory, return the Orion objects"""
+    objects = make_objects(n_workstations, n_storages)
+    os.makedirs(os.path.join(directory, "json"), exist_ok=True)
+    for obj in objects:
+        file_name = obj["id"].split(":")[-1] + ".json"
+        with open(os.path.join(directory, "json", file_name), "w") as f:
+            json.dump(obj, f)
+    with open(os.path.join(directory, "commands.json"), "w") as f:
+        json.dump(make_commands(n_workstations, n_storages), f)
+    return objects
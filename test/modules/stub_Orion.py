@@ -0,0 +1,174 @@
+"""
+A minimal in-process stand-in for the Orion broker and the IoT agent
+
+The tests and benchmarks that must not depend on a running MOMAMS
+start a StubOrion on a free local port. It keeps the entities in memory
+and answers the few NGSIv2 endpoints the service uses. Any other path
+(the IoT agent's root URL for example) is answered with 204.
+
+Usage:
+    stub = StubOrion(delay=0.01)
+    stub.start()
+    stub.put({"id": "urn:ngsiv2:i40Asset:Storage1", "type": "i40Asset", ...})
+    ... requests to stub.url ...
+    stub.stop()
+"""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def refused_port():
+    """Return a port nobody listens on"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubOrion():
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0):
+        self.entities = {}
+        self.subscriptions = {}
+        self.subscription_count = 0
+        self.received = []
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+        self.url = f"http://{self.host}:{self.port}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def put(self, entity: dict):
+        with self.lock:
+            self.entities[entity["id"]] = json.loads(json.dumps(entity))
+
+    def append_attrs(self, entity: dict):
+        with self.lock:
+            stored = self.entities.setdefault(entity["id"], {"id": entity["id"]})
+            for key, value in entity.items():
+                stored[key] = value
+
+    def project(self, entity: dict, attrs: list = None, key_values: bool = False):
+        """Return the entity with only the given attributes, optionally in keyValues format"""
+        projected = {}
+        for key, value in entity.items():
+            if key in ("id", "type"):
+                projected[key] = value
+            elif attrs is None or key in attrs:
+                projected[key] = value["value"] if key_values else value
+        return projected
+
+    def count(self, method: str, path_prefix: str = ""):
+        with self.lock:
+            return len([r for r in self.received if r[0] == method and r[1].startswith(path_prefix)])
+
+    def make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # the headers and the body are written separately, do not wait for the ACK between them
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, body=None, headers: dict = None):
+                data = b"" if body is None else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                if body is not None:
+                    self.send_header("Content-Type", "application/json")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def read_body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b""
+                return json.loads(raw) if raw else None
+
+            def handle_request(self, method: str):
+                body = self.read_body()
+                url = urlparse(self.path)
+                path = url.path
+                query = parse_qs(url.query)
+                key_values = "keyValues" in query.get("options", [""])[0].split(",")
+                attrs = query["attrs"][0].split(",") if "attrs" in query else None
+                with stub.lock:
+                    stub.received.append((method, path, body))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if method == "GET" and path == "/version":
+                    return self.reply(200, {"orion": {"version": "stub"}})
+                if method == "GET" and path.startswith("/v2/entities/"):
+                    object_id = path[len("/v2/entities/"):]
+                    with stub.lock:
+                        entity = stub.entities.get(object_id)
+                    if entity is None:
+                        return self.reply(404, {"error": "NotFound"})
+                    return self.reply(200, stub.project(entity, attrs, key_values))
+                if method == "GET" and path == "/v2/entities":
+                    with stub.lock:
+                        workstations = [stub.project(e, attrs, key_values) for e in stub.entities.values()
+                                        if e.get("i40AssetType", {}).get("value") == "Workstation"]
+                    return self.reply(200, workstations)
+                if method == "POST" and path.startswith("/v2/entities/") and path.endswith("/attrs"):
+                    object_id = path[len("/v2/entities/"):-len("/attrs")]
+                    with stub.lock:
+                        exists = object_id in stub.entities
+                    if not exists:
+                        return self.reply(404, {"error": "NotFound"})
+                    stub.append_attrs({"id": object_id, **body})
+                    return self.reply(204)
+                if method == "POST" and path == "/v2/op/query":
+                    ids = [entity["id"] for entity in body.get("entities", [])]
+                    with stub.lock:
+                        found = [stub.project(stub.entities[i], body.get("attrs"), key_values)
+                                 for i in ids if i in stub.entities]
+                    return self.reply(200, found)
+                if method == "POST" and path == "/v2/subscriptions":
+                    with stub.lock:
+                        stub.subscription_count += 1
+                        subscription_id = f"{stub.subscription_count:024x}"
+                        stub.subscriptions[subscription_id] = body
+                    return self.reply(201, headers={"Location": f"/v2/subscriptions/{subscription_id}"})
+                if method == "GET" and path == "/v2/subscriptions":
+                    with stub.lock:
+                        subscriptions = [{"id": i, **s} for i, s in stub.subscriptions.items()]
+                    return self.reply(200, subscriptions)
+                if method == "DELETE" and path.startswith("/v2/subscriptions/"):
+                    with stub.lock:
+                        deleted = stub.subscriptions.pop(path[len("/v2/subscriptions/"):], None)
+                    return self.reply(404 if deleted is None else 204)
+                if method == "POST" and path == "/v2/op/update":
+                    for entity in body["entities"]:
+                        stub.append_attrs(entity)
+                    return self.reply(204)
+                return self.reply(204)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def do_DELETE(self):
+                self.handle_request("DELETE")
+
+        return Handler
@@ -1,15 +1,27 @@
+import json
 import os
 import sys
+import tempfile
 import unittest
+from unittest.mock import patch
 
-
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+from modules import make_test_config
 from modules import reupload_jsons_to_Orion
+from modules.stub_Orion import StubOrion
 
 sys.path.insert(0, os.path.join("..", "src"))
 from Storage import Storage
 from Workstation import Workstation
 from CommandHandler import CommandHandler
+from Reconciler import Reconciler
+import JobHandler
+import Metrics
+import RequestBatcher
+import Workstation as WorkstationModule
 import Orion
+import StateJournal
 from Logger import getLogger
 
 logger = getLogger(__name__)
@@ -113,6 +125,179 @@ downloaded job:
         self.assertEqual(3, tl_storage_obj["counter"]["value"])
 
 
+class TestCommandHandlerWithStub(unittest.TestCase):
+    """Runs against a local StubOrion instead of the Orion broker"""
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubOrion().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def setUp(self):
+        self.config = tempfile.TemporaryDirectory()
+        self.stub.received.clear()
+        for obj in make_test_config.main(self.config.name, 3, 1):
+            self.stub.put(obj)
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+            patch.object(CommandHandler, "RPI_COMMANDS_CONFIG", self.config.name),
+        ]
+        # the JobHandlers of each test are reconciled with this test's objects
+        self.reconciler = Reconciler(period=0.05)
+        self.patches += [
+            patch.object(JobHandler, "reconciler", self.reconciler),
+            patch.object(WorkstationModule, "reconciler", self.reconciler),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        self.reconciler.stop(1)
+        for p in self.patches:
+            p.stop()
+        self.config.cleanup()
+
+    def test_bulk_startup(self):
+        job = self.stub.entities[make_test_config.job_id(1)]
+        job["goodPartCounter"]["value"] = 5 * make_test_config.PARTS_PER_CYCLE
+        commandHandler = CommandHandler()
+        # confirming the objects and the Workstations, Jobs and Operations of the JobHandlers
+        self.assertEqual(4, self.stub.count("POST", "/v2/op/query"))
+        self.assertEqual(0, self.stub.count("GET", "/v2/entities"))
+        jobHandler = commandHandler.objects[make_test_config.workstation_id(1)]["py"].jobHandler
+        self.assertTrue(jobHandler.are_counters_initiated_from_Orion)
+        self.assertEqual(5, jobHandler.good_cycle_counter)
+        self.assertEqual(make_test_config.job_id(1), jobHandler.id)
+
+    def test_job_objects_are_fetched_in_bulk(self):
+        job_id = make_test_config.job_id(2)
+        job = self.stub.entities[job_id]
+        job["i40AssetType"] = {"type": "Text", "value": "Job"}
+        with open(os.path.join(self.config.name, "json", job_id.split(":")[-1] + ".json"), "w") as f:
+            json.dump(job, f)
+        commandHandler = CommandHandler()
+        self.assertEqual(4, self.stub.count("POST", "/v2/op/query"))
+        self.assertEqual(0, self.stub.count("GET", "/v2/entities"))
+        jobHandler = commandHandler.objects[job_id]["py"]
+        self.assertTrue(jobHandler.are_counters_initiated_from_Orion)
+        self.assertIs(commandHandler.objects[make_test_config.workstation_id(2)]["py"].jobHandler, jobHandler)
+
+    def test_new_job(self):
+        commandHandler = CommandHandler()
+        job = self.stub.entities[make_test_config.job_id(2)]
+        job["rejectPartCounter"]["value"] = 3 * make_test_config.PARTS_PER_CYCLE
+        commandHandler.handle_command("Workstation2_new_job")
+        jobHandler = commandHandler.objects[make_test_config.workstation_id(2)]["py"].jobHandler
+        # the new Job's counters are initiated in the background
+        self.assertTrue(self.reconciler.drain(5))
+        self.assertTrue(jobHandler.are_counters_initiated_from_Orion)
+        self.assertEqual(3, jobHandler.reject_cycle_counter)
+
+    def test_job_change_notification(self):
+        commandHandler = CommandHandler()
+        workstation = commandHandler.objects[make_test_config.workstation_id(0)]["py"]
+        workstation.handle_good_cycle()
+        new_job = {"id": "urn:ngsiv2:i40Process:Job9", "type": "i40Process",
+                   "refWorkstation": {"type": "Relationship", "value": make_test_config.workstation_id(0)},
+                   "refOperation": {"type": "Relationship", "value": "urn:ngsiv2:i40Recipe:Operation0"},
+                   "goodPartCounter": {"type": "Number", "value": 0},
+                   "rejectPartCounter": {"type": "Number", "value": 0}}
+        self.stub.put(new_job)
+        self.stub.append_attrs({"id": make_test_config.workstation_id(0), "refJob": {"type": "Relationship", "value": new_job["id"]}})
+        # the notification of an unchanged Job does not reset the counters
+        for command_id, arg in commandHandler.notification_events({"id": make_test_config.workstation_id(0),
+                                                                   "refJob": make_test_config.job_id(0)}):
+            commandHandler.handle_command(command_id, arg)
+        self.assertEqual(1, workstation.jobHandler.good_cycle_counter)
+        events = commandHandler.notification_events({"id": make_test_config.workstation_id(0), "refJob": new_job["id"]})
+        self.assertEqual(make_test_config.workstation_id(0), commandHandler.ordering_key(events[0][0]))
+        for command_id, arg in events:
+            commandHandler.handle_command(command_id, arg)
+        self.assertTrue(self.reconciler.drain(5))
+        self.assertEqual(new_job["id"], workstation.jobHandler.id)
+        self.assertEqual(0, workstation.jobHandler.good_cycle_counter)
+
+    def test_restart_restores_counters_offline(self):
+        path = os.path.join(self.config.name, "state.journal")
+        with patch.object(StateJournal, "journal", StateJournal.StateJournal(path)):
+            commandHandler = CommandHandler()
+            commandHandler.handle_command("Storage0_step")
+            commandHandler.handle_command("Storage0_step")
+            commandHandler.handle_command("Workstation0_good_parts_completed")
+            StateJournal.journal.close()
+        with patch.object(StateJournal, "journal", StateJournal.StateJournal(path)), \
+                patch.object(Orion, "ORION_PORT", 1):
+            commandHandler = CommandHandler()
+            StateJournal.journal.close()
+        self.assertEqual(998, commandHandler.objects[make_test_config.storage_id(0)]["py"].counter)
+        jobHandler = commandHandler.objects[make_test_config.workstation_id(0)]["py"].jobHandler
+        self.assertTrue(jobHandler.are_counters_initiated_from_Orion)
+        self.assertEqual(make_test_config.job_id(0), jobHandler.id)
+        self.assertEqual(1, jobHandler.good_cycle_counter)
+
+    def test_failed_batched_special_request(self):
+        urls = [f"http://{self.stub.host}:{self.stub.port}/v2/entities/{make_test_config.storage_id(0)}/attrs/counter/value",
+                "http://iot-agent/failing"]
+        self.add_commands({
+            f"Special{i}": {"special": True, "request": {"url": url, "method": "PUT", "data": "1"}}
+            for i, url in enumerate(urls)
+        })
+
+        def send(req):
+            if json.loads(req)["url"] == urls[1]:
+                raise RuntimeError("Sending request to the IoT agent failed. Response:<Response [400]>")
+            return 204
+
+        commandHandler = CommandHandler()
+        requestBatcher = RequestBatcher.RequestBatcher(window_ms=10e3, max_size=2, send=send)
+        metrics = Metrics.Metrics()
+        with patch.object(RequestBatcher, "requestBatcher", requestBatcher), patch.object(Metrics, "metrics", metrics):
+            with self.assertLogs("CommandHandler", level="ERROR") as logs:
+                commandHandler.handle_command("Special0")
+                commandHandler.handle_command("Special1")
+                requestBatcher.stop()
+        # only the failed request of the batch is reported, with its command
+        self.assertEqual(1, len(logs.records))
+        self.assertIn("Special command Special1 failed", logs.records[0].getMessage())
+        self.assertEqual(1, metrics.counters[("errors_total", commandHandler.metric_labels["Special1"])])
+        self.assertNotIn(("errors_total", commandHandler.metric_labels["Special0"]), metrics.counters)
+
+    def add_commands(self, commands: dict):
+        file = os.path.join(self.config.name, "commands.json")
+        with open(file) as f:
+            all_commands = json.load(f)
+        all_commands.update(commands)
+        with open(file, "w") as f:
+            json.dump(all_commands, f)
+
+    def test_compiled_handlers(self):
+        commandHandler = CommandHandler()
+        self.assertTrue(set(commandHandler.commands) <= set(commandHandler.handlers))
+        storage = commandHandler.objects[make_test_config.storage_id(0)]["py"]
+        counter = storage.counter
+        commandHandler.handle_command("Storage0_step")
+        self.assertEqual(counter - 1, storage.counter)
+        self.assertEqual(make_test_config.workstation_id(0), commandHandler.ordering_key("Workstation0_on"))
+        self.assertEqual((make_test_config.workstation_id(0), "available"), commandHandler.coalesce_key("Workstation0_off"))
+        self.assertIsNone(commandHandler.coalesce_key("Workstation0_good_parts_completed"))
+        with self.assertRaises(ValueError):
+            commandHandler.handle_command("unknown")
+
+    def test_invalid_commands_fail_at_load(self):
+        self.add_commands({
+            "Missing_on": {"object_id": "urn:ngsiv2:i40Asset:Missing", "type": "turn_on"},
+            "Storage0_on": {"object_id": make_test_config.storage_id(0), "type": "turn_on"},
+            "Job0_step": {"object_id": make_test_config.job_id(0), "type": "step"},
+        })
+        with self.assertRaises(ValueError) as context:
+            CommandHandler()
+        for command_id in ("Missing_on", "Storage0_on", "Job0_step"):
+            self.assertIn(command_id, str(context.exception))
+
+
 if __name__ == "__main__":
     unittest.main()
 
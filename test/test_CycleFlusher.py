@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion, refused_port
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+from CycleFlusher import CycleFlusher
+from JobHandler import JobHandler
+from Reconciler import Reconciler
+from Workstation import Workstation
+import CycleFlusher as CycleFlusherModule
+import JobHandler as JobHandlerModule
+import Workstation as WorkstationModule
+import Orion
+
+WORKSTATION_ID = make_test_config.workstation_id(0)
+JOB_ID = make_test_config.job_id(0)
+PARTS_PER_CYCLE = make_test_config.PARTS_PER_CYCLE
+
+
+class TestCycleFlusher(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOrion().start()
+        for obj in make_test_config.make_objects(1):
+            self.stub.put(obj)
+        self.flusher = CycleFlusher(interval_ms=500, max_cycles=5)
+        # the new JobHandlers of each test are reconciled with this test's objects
+        self.reconciler = Reconciler(period=0.05)
+        self.patches = [
+            patch.object(CycleFlusherModule, "flusher", self.flusher),
+            patch.object(JobHandlerModule, "reconciler", self.reconciler),
+            patch.object(WorkstationModule, "reconciler", self.reconciler),
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+        ]
+        for p in self.patches:
+            p.start()
+        self.jobHandler = JobHandler(WORKSTATION_ID, fetch=False)
+        self.jobHandler.init_cycle_counters(JOB_ID, 2 * PARTS_PER_CYCLE, PARTS_PER_CYCLE, PARTS_PER_CYCLE)
+
+    def tearDown(self):
+        self.flusher.stop()
+        self.reconciler.stop(1)
+        for p in self.patches:
+            p.stop()
+        self.stub.stop()
+
+    def writes(self):
+        return self.stub.count("POST", f"/v2/entities/{JOB_ID}/attrs")
+
+    def good_part_counter(self):
+        return self.stub.entities[JOB_ID]["goodPartCounter"]["value"]
+
+    def test_integer_counters(self):
+        self.assertIsInstance(self.jobHandler.good_cycle_counter, int)
+        self.assertIsInstance(self.jobHandler.reject_cycle_counter, int)
+        self.jobHandler.flush_cycles()
+        self.jobHandler.handle_reject_cycle()
+        self.jobHandler.flush_cycles()
+        self.assertEqual(2 * PARTS_PER_CYCLE, self.stub.entities[JOB_ID]["rejectPartCounter"]["value"])
+        self.assertIsInstance(self.stub.entities[JOB_ID]["rejectPartCounter"]["value"], int)
+
+    def test_flush_every_max_cycles_or_interval(self):
+        for _ in range(12):
+            self.jobHandler.handle_good_cycle()
+        # the 5th and the 10th cycle are flushed at once
+        self.assertEqual(2, self.writes())
+        self.assertEqual(12 * PARTS_PER_CYCLE, self.good_part_counter())
+        # the last 2 cycles are flushed after the interval
+        deadline = time.monotonic() + 2
+        while self.good_part_counter() != 14 * PARTS_PER_CYCLE and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(14 * PARTS_PER_CYCLE, self.good_part_counter())
+        self.assertEqual(3, self.writes())
+        stats = self.flusher.stats()
+        self.assertEqual(12, stats["cycles"])
+        self.assertEqual(4, stats["write_reduction"])
+        self.assertLess(stats["max_staleness_ms"], 1000)
+
+    def test_turn_off_and_new_job_flush(self):
+        workstation = Workstation(WORKSTATION_ID, self.jobHandler)
+        workstation.handle_good_cycle()
+        self.assertEqual(0, self.writes())
+        workstation.turn_off()
+        self.assertEqual(3 * PARTS_PER_CYCLE, self.good_part_counter())
+        self.assertFalse(self.stub.entities[WORKSTATION_ID]["available"]["value"])
+        workstation.handle_good_cycle()
+        workstation.reset_jobHandler()
+        self.assertEqual(4 * PARTS_PER_CYCLE, self.good_part_counter())
+        self.assertEqual(2, self.writes())
+
+    def test_failed_flush_is_retried(self):
+        self.jobHandler.handle_good_cycle()
+        with patch.object(Orion, "ORION_PORT", refused_port()):
+            with self.assertRaises(Exception):
+                self.jobHandler.flush_cycles()
+        self.assertEqual(1, self.jobHandler.unflushed_cycles)
+        self.assertEqual({"goodPartCounter"}, self.jobHandler.unflushed_counters)
+        # the CycleFlusher writes it again once Orion is reachable
+        deadline = time.monotonic() + 5
+        while self.good_part_counter() != 3 * PARTS_PER_CYCLE and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(3 * PARTS_PER_CYCLE, self.good_part_counter())
+        self.assertEqual(0, self.jobHandler.unflushed_cycles)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join("..", "src"))
+from Dispatcher import Dispatcher
+from EventQueue import EventQueue
+
+STATE_COMMANDS = {
+    "InjectionMouldingMachine1_on": ("urn:ngsiv2:i40Asset:InjectionMouldingMachine1", "available"),
+    "InjectionMouldingMachine1_off": ("urn:ngsiv2:i40Asset:InjectionMouldingMachine1", "available"),
+}
+
+
+class FakeCommandHandler():
+    """Records the handled commands, blocks until released"""
+    def __init__(self):
+        self.handled = []
+        self.release = threading.Event()
+
+    def coalesce_key(self, command_id):
+        return STATE_COMMANDS.get(command_id)
+
+    def ordering_key(self, command_id):
+        return command_id.split("_")[0]
+
+    def handle_command(self, command_id, arg=None, event=None):
+        self.release.wait()
+        if command_id == "unknown":
+            raise ValueError(f"command not specified in commands.json: {command_id}")
+        self.handled.append((command_id, arg))
+
+
+class TestEventQueue(unittest.TestCase):
+    def test_drop_oldest(self):
+        eventQueue = EventQueue(2, "drop_oldest")
+        for i in range(4):
+            eventQueue.put(i)
+        self.assertEqual([2, 3], [eventQueue.get(0), eventQueue.get(0)])
+        self.assertEqual(2, eventQueue.stats()["dropped"])
+        self.assertEqual(2, eventQueue.stats()["max_depth"])
+
+    def test_coalesce(self):
+        eventQueue = EventQueue(2, "coalesce", coalesce_key=lambda event: STATE_COMMANDS.get(event))
+        eventQueue.put("InjectionMouldingMachine1_on")
+        eventQueue.put("InjectionMouldingMachine1_good_parts_completed")
+        eventQueue.put("InjectionMouldingMachine1_off")
+        self.assertEqual(["InjectionMouldingMachine1_off", "InjectionMouldingMachine1_good_parts_completed"],
+                         [eventQueue.get(0), eventQueue.get(0)])
+        self.assertEqual(1, eventQueue.stats()["coalesced"])
+        self.assertEqual(0, eventQueue.stats()["dropped"])
+        # no event to coalesce with: the oldest is dropped
+        eventQueue.put("TrayLoaderStorage1_step")
+        eventQueue.put("TrayLoaderStorage1_step")
+        eventQueue.put("InjectionMouldingMachine1_on")
+        self.assertEqual(1, eventQueue.stats()["dropped"])
+
+    def test_coalesce_keeps_order(self):
+        coalesce_key = lambda event: event[0] if event[1] in ("on", "off") else None
+        eventQueue = EventQueue(4, "coalesce", coalesce_key=coalesce_key)
+        for event in [("A", "on"), ("B", "step"), ("A", "step"), ("B", "on"), ("A", "off"), ("B", "off")]:
+            eventQueue.put(event)
+        # the new state takes the place of the replaced one, the other events stay in order
+        self.assertEqual([("A", "off"), ("B", "step"), ("A", "step"), ("B", "off")],
+                         [eventQueue.get(0) for _ in range(4)])
+        self.assertEqual(2, eventQueue.stats()["coalesced"])
+        self.assertEqual(0, eventQueue.stats()["dropped"])
+
+    def test_block(self):
+        eventQueue = EventQueue(1, "block")
+        eventQueue.put(1)
+        thread = threading.Thread(target=eventQueue.put, args=(2,))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(1, eventQueue.get(0))
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(2, eventQueue.get(0))
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            EventQueue(1, "drop_newest")
+
+
+class TestDispatcher(unittest.TestCase):
+    def test_submit_does_not_wait_for_handling(self):
+        commandHandler = FakeCommandHandler()
+        dispatcher = Dispatcher(commandHandler, workers=1, queue_size=10, policy="block")
+        dispatcher.submit("TrayLoaderStorage1_step")
+        dispatcher.submit("unknown")
+        dispatcher.submit("Test_TrayLoaderStorage1_set_to_x", 3)
+        self.assertEqual([], commandHandler.handled)
+        commandHandler.release.set()
+        dispatcher.stop(1)
+        self.assertEqual([("TrayLoaderStorage1_step", None), ("Test_TrayLoaderStorage1_set_to_x", 3)],
+                         commandHandler.handled)
+        stats = dispatcher.stats()
+        self.assertEqual(2, stats["dispatched"])
+        self.assertEqual(1, stats["failed"])
+        self.assertEqual(0, stats["depth"])
+
+    def test_events_of_an_object_stay_in_order(self):
+        commandHandler = FakeCommandHandler()
+        commandHandler.release.set()
+        dispatcher = Dispatcher(commandHandler, workers=4, queue_size=1000, policy="block")
+        objects = [f"Workstation{i}" for i in range(8)]
+        for step in range(50):
+            for obj in objects:
+                dispatcher.submit(f"{obj}_good_parts_completed", step)
+        dispatcher.stop(5)
+        self.assertEqual(400, dispatcher.stats()["dispatched"])
+        for obj in objects:
+            steps = [arg for command_id, arg in commandHandler.handled if command_id.startswith(f"{obj}_")]
+            self.assertEqual(list(range(50)), steps)
+
+    def test_objects_are_handled_in_parallel(self):
+        commandHandler = FakeCommandHandler()
+        dispatcher = Dispatcher(commandHandler, workers=2, queue_size=10, policy="block")
+        # find 2 objects on different workers
+        blocked = "Workstation0"
+        other = next(f"Workstation{i}" for i in range(1, 100)
+                     if dispatcher.shard(f"Workstation{i}_on") is not dispatcher.shard(f"{blocked}_on"))
+        commandHandler.handle_command = lambda command_id, arg=None, event=None: (
+            command_id.startswith(blocked) and commandHandler.release.wait(),
+            commandHandler.handled.append((command_id, arg)))
+        dispatcher.submit(f"{blocked}_on")
+        dispatcher.submit(f"{other}_on")
+        dispatcher.stop(0.5)
+        self.assertEqual([(f"{other}_on", None)], commandHandler.handled)
+        commandHandler.release.set()
+        dispatcher.stop(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from modules.stub_Orion import StubOrion
+
+os.environ.setdefault("ORION_HOST", "localhost")
+sys.path.insert(0, os.path.join("..", "src"))
+from EntityCache import EntityCache
+from NotificationListener import NotificationListener
+import EntityCache as EntityCacheModule
+import Orion
+
+WORKSTATION_ID = "urn:ngsiv2:i40Asset:Workstation1"
+OPERATION_ID = "urn:ngsiv2:i40Recipe:Operation1"
+
+
+class TestEntityCache(unittest.TestCase):
+    def test_ttl(self):
+        cache = EntityCache(ttl=0.05, max_size=10)
+        cache.put(OPERATION_ID, {"partsPerCycle": 8})
+        self.assertEqual({"partsPerCycle": 8}, cache.get(OPERATION_ID))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get(OPERATION_ID))
+        self.assertEqual({"size": 0, "hits": 1, "misses": 1, "hit_ratio": 0.5, "evictions": 0}, cache.stats())
+
+    def test_lru_eviction(self):
+        cache = EntityCache(ttl=60, max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual(1, cache.stats()["evictions"])
+
+    def test_invalidate_all_variants(self):
+        cache = EntityCache(ttl=60, max_size=10)
+        cache.put(WORKSTATION_ID, {"refJob": "Job1"}, variant="refJob")
+        cache.put(WORKSTATION_ID, {"available": True}, variant="available")
+        cache.invalidate(WORKSTATION_ID)
+        self.assertIsNone(cache.get(WORKSTATION_ID, "refJob"))
+        self.assertIsNone(cache.get(WORKSTATION_ID, "available"))
+
+
+class TestCachedOrion(unittest.TestCase):
+    """Runs against a local StubOrion instead of the Orion broker"""
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubOrion().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def setUp(self):
+        self.stub.received.clear()
+        self.stub.put({"id": WORKSTATION_ID, "type": "i40Asset",
+                       "refJob": {"type": "Relationship", "value": "urn:ngsiv2:i40Process:Job1"}})
+        self.cache = EntityCache(ttl=60, max_size=10)
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+            patch.object(EntityCacheModule, "cache", self.cache),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_get_is_cached_until_written(self):
+        for _ in range(3):
+            workstation = Orion.get(WORKSTATION_ID, attrs=["refJob"], key_values=True)
+        self.assertEqual("urn:ngsiv2:i40Process:Job1", workstation["refJob"])
+        self.assertEqual(1, self.stub.count("GET"))
+        self.assertEqual(2, self.cache.stats()["hits"])
+        Orion.update_attribute(WORKSTATION_ID, "refJob", "Relationship", "urn:ngsiv2:i40Process:Job2")
+        workstation = Orion.get(WORKSTATION_ID, attrs=["refJob"], key_values=True)
+        self.assertEqual("urn:ngsiv2:i40Process:Job2", workstation["refJob"])
+        self.assertEqual(2, self.stub.count("GET"))
+
+    def test_notification_invalidates(self):
+        changed = []
+        listener = NotificationListener(changed.append, port=0, host="127.0.0.1").start()
+        try:
+            subscription_id = listener.subscribe([WORKSTATION_ID], ["refJob"])
+            subscription = self.stub.subscriptions[subscription_id]
+            self.assertEqual([{"id": WORKSTATION_ID}], subscription["subject"]["entities"])
+            self.assertEqual("keyValues", subscription["notification"]["attrsFormat"])
+            Orion.get(WORKSTATION_ID, attrs=["refJob"], key_values=True)
+            # Orion changes the Workstation, then notifies the listener
+            self.stub.append_attrs({"id": WORKSTATION_ID, "refJob": {"type": "Relationship", "value": "urn:ngsiv2:i40Process:Job2"}})
+            notified = {"id": WORKSTATION_ID, "type": "i40Asset", "refJob": "urn:ngsiv2:i40Process:Job2"}
+            response = requests.post(subscription["notification"]["http"]["url"],
+                                     json={"subscriptionId": subscription_id, "data": [notified]})
+            self.assertEqual(204, response.status_code)
+            self.assertEqual([notified], changed)
+            workstation = Orion.get(WORKSTATION_ID, attrs=["refJob"], key_values=True)
+            self.assertEqual("urn:ngsiv2:i40Process:Job2", workstation["refJob"])
+        finally:
+            listener.stop()
+        self.assertEqual({}, self.stub.subscriptions)
+
+    def test_counters_are_not_cached(self):
+        job_id = "urn:ngsiv2:i40Process:Job1"
+        self.stub.put({"id": job_id, "type": "i40Process",
+                       "goodPartCounter": {"type": "Number", "value": 8}})
+        Orion.get(job_id, attrs=["goodPartCounter"], key_values=True)
+        # changed by someone else, without a notification
+        self.stub.append_attrs({"id": job_id, "goodPartCounter": {"type": "Number", "value": 0}})
+        self.assertEqual(0, Orion.get(job_id, attrs=["goodPartCounter"], key_values=True)["goodPartCounter"])
+        self.assertEqual(0, Orion.query([job_id], key_values=True)[job_id]["goodPartCounter"])
+        Orion.get(job_id)
+        self.assertEqual(0, self.cache.stats()["size"])
+
+    def test_stale_subscriptions_are_deleted(self):
+        listener = NotificationListener(lambda object: None, port=0, host="127.0.0.1").start()
+        # a previous run was killed before deleting its subscription
+        Orion.subscribe([WORKSTATION_ID], ["refJob"], listener.url)
+        other_id = Orion.subscribe([WORKSTATION_ID], ["refJob"], "http://192.0.2.1:8765/notify")
+        try:
+            subscription_id = listener.subscribe([WORKSTATION_ID], ["refJob"])
+            self.assertEqual({subscription_id, other_id}, set(self.stub.subscriptions))
+        finally:
+            listener.stop()
+            listener.stop()
+        self.assertEqual({other_id}, set(self.stub.subscriptions))
+        Orion.unsubscribe(other_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+from modules import make_test_config
+from modules.stub_Orion import StubOrion, refused_port
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from Dispatcher import Dispatcher
+from ErrorAggregator import ErrorAggregator
+import Dispatcher as DispatcherModule
+import Orion
+import Outbox
+
+logger = logging.getLogger("test_ErrorAggregator")
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestErrorAggregator(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.errors = ErrorAggregator(summary_interval=60, burst=5, rate=0.2, max_keys=10, clock=self.clock)
+
+    def messages(self, logs):
+        return [record.getMessage() for record in logs.records]
+
+    def test_repeated_errors_are_summarized(self):
+        with self.assertLogs(logger, level="ERROR") as logs:
+            for _ in range(100):
+                self.errors.report(logger, ConnectionError("Connection refused"), "Orion: ")
+            self.clock.now = 60
+            self.errors.flush()
+        self.assertEqual(["Orion: Connection refused",
+                          "Orion: Connection refused (99 occurrences in the last 60 s)"], self.messages(logs))
+        # the summary starts a new interval
+        self.clock.now = 61
+        self.errors.report(logger, ConnectionError("Connection refused"), "Orion: ")
+        self.assertEqual({"reported": 101, "logged": 1, "suppressed": 100, "evicted": 0, "tracked": 1},
+                         self.errors.stats())
+
+    def test_token_bucket_per_error_class(self):
+        with self.assertLogs(logger, level="ERROR") as logs:
+            for i in range(8):
+                self.errors.report(logger, ValueError(f"invalid event {i}"))
+            self.errors.report(logger, OSError("device disconnected"))
+            # one token is refilled in 5 s
+            self.clock.now = 5
+            self.errors.report(logger, ValueError("invalid event 8"))
+            self.errors.report(logger, ValueError("invalid event 9"))
+        self.assertEqual([f"invalid event {i}" for i in range(5)] + ["device disconnected", "invalid event 8"],
+                         self.messages(logs))
+
+    def test_memory_bound(self):
+        with self.assertLogs(logger, level="ERROR"):
+            for i in range(1000):
+                self.errors.report(logger, ValueError(f"invalid event {i}"), f"device {i % 50}: ")
+        self.assertEqual(10, len(self.errors.errors))
+        self.assertLessEqual(len(self.errors.buckets), 10)
+        self.assertEqual(990, self.errors.stats()["evicted"])
+
+
+class TestErrorAggregatorWithRefusingOrion(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOrion().start()
+        self.config = tempfile.TemporaryDirectory()
+        for obj in make_test_config.main(self.config.name, 1):
+            self.stub.put(obj)
+        self.errors = ErrorAggregator(summary_interval=60, burst=5, rate=0.2, max_keys=100)
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+            patch.object(CommandHandler, "RPI_COMMANDS_CONFIG", self.config.name),
+            patch.object(DispatcherModule, "errors", self.errors),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.stub.stop()
+        self.config.cleanup()
+
+    def test_orion_down(self):
+        commandHandler = CommandHandler()
+        # from now on Orion refuses the connections
+        self.patches.append(patch.object(Orion, "ORION_PORT", refused_port()))
+        self.patches[-1].start()
+        dispatcher = Dispatcher(commandHandler, workers=1)
+        with self.assertLogs("Dispatcher", level="ERROR") as logs:
+            for i in range(200):
+                dispatcher.submit(f"Workstation0_{'on' if i % 2 else 'off'}")
+            dispatcher.stop()
+            self.errors.flush()
+        self.assertEqual(200, dispatcher.stats()["failed"])
+        self.assertEqual(200, self.errors.stats()["reported"])
+        # the connection errors are logged once, then summarized
+        self.assertLessEqual(len(logs.records), 5 + 5)
+        self.assertTrue(any("occurrences in the last 60 s" in record.getMessage() for record in logs.records))
+
+    def test_outbox_retries_are_summarized(self):
+        def send_attributes(object_id, attributes):
+            raise requests.exceptions.ConnectionError("Connection refused")
+
+        with tempfile.TemporaryDirectory() as directory, patch.object(Outbox, "errors", self.errors):
+            outbox = Outbox.Outbox(os.path.join(directory, "outbox.sqlite"), send_attributes=send_attributes,
+                                   send_request=None, backoff_base=0.001, backoff_max=0.001)
+            with self.assertLogs("Outbox", level="ERROR") as logs:
+                outbox.put_attribute(make_test_config.workstation_id(0), "available", "Boolean", True)
+                deadline = time.monotonic() + 5
+                while outbox.failures < 50 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                outbox.stop()
+                self.errors.flush()
+        self.assertGreaterEqual(self.errors.stats()["reported"], 50)
+        # the same error is logged once, then summarized
+        self.assertEqual(2, len(logs.records))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from Dispatcher import Dispatcher
+from EventTrace import Event, TraceFile
+import EventTrace
+import Orion
+import Outbox
+
+# 2026-10-18 08:00:00.123 UTC
+EVENT_TIME = 1792310400.123
+TIME_INSTANT = {"TimeInstant": {"type": "DateTime", "value": "2026-10-18T08:00:00.123Z"}}
+
+
+class TestEventTrace(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_time_instant(self):
+        event = Event(received=0, event_time=EVENT_TIME)
+        self.assertEqual("2026-10-18T08:00:00.123Z", event.time_instant())
+        self.assertIsNone(EventTrace.metadata())
+        token = EventTrace.current.set(event)
+        try:
+            self.assertEqual(TIME_INSTANT, EventTrace.metadata())
+        finally:
+            EventTrace.current.reset(token)
+
+    def test_trace_file_rotation(self):
+        path = os.path.join(self.directory.name, "trace")
+        traceFile = TraceFile(path, max_bytes=100, flush_interval=0)
+        for i in range(10):
+            traceFile.write(f"{i:019d}\n")
+        traceFile.close()
+        with open(path) as f:
+            self.assertEqual(["0000000000000000005", "0000000000000000009"], [f.readline().strip(), f.read().split()[-1]])
+        self.assertLessEqual(os.path.getsize(path + ".1"), 100)
+
+
+class TestEventTraceWithStub(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOrion().start()
+        self.config = tempfile.TemporaryDirectory()
+        for obj in make_test_config.main(self.config.name, 2):
+            self.stub.put(obj)
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+            patch.object(CommandHandler, "RPI_COMMANDS_CONFIG", self.config.name),
+        ]
+        for p in self.patches:
+            p.start()
+        self.commandHandler = CommandHandler()
+        self.workstation_id = make_test_config.workstation_id(0)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.stub.stop()
+        self.config.cleanup()
+
+    def test_event_time_written_to_orion(self):
+        self.commandHandler.handle_command("Workstation0_on", None, Event(event_time=EVENT_TIME))
+        self.assertEqual(TIME_INSTANT, self.stub.entities[self.workstation_id]["available"]["metadata"])
+        # without an event, Orion stamps the arrival time
+        self.commandHandler.handle_command("Workstation0_off")
+        self.assertNotIn("metadata", self.stub.entities[self.workstation_id]["available"])
+
+    def test_metadata_off(self):
+        with patch.object(EventTrace, "EVENT_TIME_METADATA", False):
+            self.assertIsNone(EventTrace.ingest())
+            self.commandHandler.handle_command("Workstation0_on", None, Event(event_time=EVENT_TIME))
+        self.assertNotIn("metadata", self.stub.entities[self.workstation_id]["available"])
+
+    def test_late_outbox_delivery_keeps_event_time(self):
+        sent = []
+        delivered = threading.Event()
+        # Orion is down while the event is handled, the write is sent later
+        orion_up = threading.Event()
+
+        def send_attributes(object_id, attributes):
+            if not orion_up.is_set():
+                raise ConnectionError("refused")
+            sent.append((object_id, attributes))
+            delivered.set()
+
+        with tempfile.TemporaryDirectory() as directory:
+            outbox = Outbox.Outbox(os.path.join(directory, "outbox.sqlite"), send_attributes=send_attributes,
+                                   send_request=None, backoff_base=0.01, backoff_max=0.05)
+            try:
+                with patch.object(Outbox, "outbox", outbox):
+                    self.commandHandler.handle_command("Workstation0_on", None, Event(event_time=EVENT_TIME))
+                time.sleep(0.05)
+                orion_up.set()
+                self.assertTrue(delivered.wait(5))
+            finally:
+                outbox.stop()
+        self.assertEqual([(self.workstation_id, {"available": {"type": "Boolean", "value": True,
+                                                               "metadata": TIME_INSTANT}})], sent)
+
+    def test_trace_records(self):
+        path = os.path.join(self.config.name, "trace")
+        traceFile = TraceFile(path)
+        with patch.object(EventTrace, "traceFile", traceFile):
+            dispatcher = Dispatcher(self.commandHandler, workers=2)
+            event = EventTrace.ingest()
+            for command_id in ("Workstation0_on", "Workstation1_on", "Workstation0_unknown"):
+                dispatcher.submit(command_id, None, event)
+            dispatcher.stop()
+        traceFile.close()
+        with open(path) as f:
+            records = [line.split() for line in f]
+        self.assertEqual({("Workstation0_on", "1"), ("Workstation1_on", "1")},
+                         {(record[1], record[4]) for record in records})
+        for record in records:
+            self.assertAlmostEqual(event.time, float(record[0]), places=2)
+            # the queue and handle times in ms
+            self.assertGreaterEqual(float(record[2]), 0)
+            self.assertGreater(float(record[3]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,7 @@ import requests
 
 sys.path.insert(0, os.path.join("..", "src"))
 from JobHandler import JobHandler
+from Reconciler import reconciler
 import Orion
 
 WORKSTATION_ID = "urn:ngsiv2:i40Asset:InjectionMouldingMachine1"
@@ -31,31 +32,34 @@ class TestWorkstation(unittest.TestCase):
         Orion.update_attribute("urn:ngsiv2:i40Process:Job202200045", "goodPartCounter", "Number", 16)
         Orion.update_attribute("urn:ngsiv2:i40Process:Job202200045", "rejectPartCounter", "Number", 24)
         jobHandler = JobHandler("urn:ngsiv2:i40Asset:InjectionMouldingMachine1")
+        # the counters are initiated in the background
+        self.assertTrue(reconciler.drain(5))
         self.assertEqual(jobHandler.good_cycle_counter, 2)
         self.assertEqual(jobHandler.reject_cycle_counter, 3)
 
         jobHandler.are_counters_initiated_from_Orion = False
         Orion.update_attribute("urn:ngsiv2:i40Process:Job202200045", "rejectPartCounter", "Number", 23)
-        jobHandler.update_cycle_counters()
+        with self.assertRaises(ValueError):
+            jobHandler.reconcile()
         self.assertFalse(jobHandler.are_counters_initiated_from_Orion)
 
     def test_handle_good_cycle(self):
-        with patch("Orion.is_reachable") as mock_is_reachable:
-            mock_is_reachable.return_value = False
+        with patch("Orion.get", side_effect=RuntimeError("Orion is not reachable")):
             jobHandler = JobHandler("urn:ngsiv2:i40Asset:InjectionMouldingMachine1")
         Orion.update_attribute("urn:ngsiv2:i40Process:Job202200045", "goodPartCounter", "Number", 16)
-        # let's see if the counters are updated when the Orion is reachable
+        # let's see if the counters are updated in the background when the Orion is reachable
         jobHandler.handle_good_cycle()
+        self.assertTrue(reconciler.drain(5))
         job = Orion.get("urn:ngsiv2:i40Process:Job202200045")
         self.assertEqual(job["goodPartCounter"]["value"], 24)
 
     def test_handle_reject_cycle(self):
-        with patch("Orion.is_reachable") as mock_is_reachable:
-            mock_is_reachable.return_value = False
+        with patch("Orion.get", side_effect=RuntimeError("Orion is not reachable")):
             jobHandler = JobHandler("urn:ngsiv2:i40Asset:InjectionMouldingMachine1")
         Orion.update_attribute("urn:ngsiv2:i40Process:Job202200045", "rejectPartCounter", "Number", 40)
-        # let's see if the counters are updated when the Orion is reachable
+        # let's see if the counters are updated in the background when the Orion is reachable
         jobHandler.handle_reject_cycle()
+        self.assertTrue(reconciler.drain(5))
         job = Orion.get("urn:ngsiv2:i40Process:Job202200045")
         self.assertEqual(job["rejectPartCounter"]["value"], 48)
 
@@ -0,0 +1,77 @@
+import glob
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join("..", "src"))
+import Logger
+
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        # the pipeline is restarted with a rotated log file
+        Logger.stop()
+        self.patches = [
+            patch.object(Logger, "LOG_TO_FILE", True),
+            patch.object(Logger, "LOG_TO_STDOUT", False),
+            patch.object(Logger, "LOG_FILE_MAX_BYTES", 1000),
+            patch.object(Logger, "LOG_FILE_BACKUP_COUNT", 2),
+            patch.object(Logger, "LOGGING_LEVEL", "INFO"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        Logger.stop()
+        for p in self.patches:
+            p.stop()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+        Logger.start()
+
+    def read_log(self):
+        Logger.stop()
+        with open("Logger.log") as f:
+            return f.read()
+
+    def test_no_duplicate_handlers(self):
+        for _ in range(10):
+            logger = Logger.getLogger("test_no_duplicate_handlers")
+        self.assertEqual(1, len(logger.handlers))
+        logger.info("written once")
+        self.assertEqual(1, self.read_log().count("written once"))
+
+    def test_lazy_formatting(self):
+        logger = Logger.getLogger("test_lazy_formatting")
+        data = {"counter": 1}
+        logger.info("data: %s", data)
+        # the message is merged when logging, a later change is not logged
+        data["counter"] = 2
+        logger.debug("not enabled: %s", data)
+        try:
+            raise ValueError("invalid")
+        except ValueError:
+            logger.exception("failed")
+        log = self.read_log()
+        self.assertIn("test_lazy_formatting:data: {'counter': 1}", log)
+        self.assertNotIn("not enabled", log)
+        self.assertIn("ValueError: invalid", log)
+
+    def test_rotation(self):
+        logger = Logger.getLogger("test_rotation")
+        for i in range(100):
+            logger.info("line %s", i)
+        Logger.stop()
+        self.assertEqual(["Logger.log", "Logger.log.1", "Logger.log.2"], sorted(glob.glob("Logger.log*")))
+        self.assertLessEqual(os.path.getsize("Logger.log.1"), 1000)
+        with open("Logger.log") as f:
+            self.assertIn("line 99", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
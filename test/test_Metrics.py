@@ -0,0 +1,129 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+from modules import make_test_config
+from modules.stub_Orion import StubOrion, refused_port
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from Metrics import Metrics
+from SerialFramer import SerialFramer
+import Metrics as MetricsModule
+import Orion
+import main
+
+
+class FakeSerial():
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, size: int):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+class DirectDispatcher():
+    """Handles each event at once in the calling thread"""
+    def __init__(self, commandHandler):
+        self.commandHandler = commandHandler
+
+    def submit(self, command_id, arg=None, event=None):
+        self.commandHandler.handle_command(command_id, arg, event)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.001, 0.01, 0.1))
+
+    def test_histogram_buckets(self):
+        labels = (("stage", "parse"),)
+        for seconds in (0.0005, 0.001, 0.005, 0.05, 5):
+            self.metrics.observe(labels, seconds)
+        self.assertEqual([2, 1, 1, 1], self.metrics.histograms[labels][:-1])
+        text = self.metrics.render()
+        self.assertIn('rpi_commands_stage_duration_seconds_bucket{stage="parse",le="0.001"} 2', text)
+        self.assertIn('rpi_commands_stage_duration_seconds_bucket{stage="parse",le="0.1"} 4', text)
+        self.assertIn('rpi_commands_stage_duration_seconds_bucket{stage="parse",le="+Inf"} 5', text)
+        self.assertIn('rpi_commands_stage_duration_seconds_count{stage="parse"} 5', text)
+        self.assertIn("# TYPE rpi_commands_stage_duration_seconds histogram", text)
+
+    def test_counters(self):
+        labels = (("stage", "dispatch"), ("type", "turn_on"), ("object", "urn:ngsiv2:i40Asset:Workstation1"))
+        self.metrics.increment("errors_total", labels)
+        self.metrics.increment("errors_total", labels)
+        text = self.metrics.render()
+        self.assertIn("# TYPE rpi_commands_errors_total counter", text)
+        self.assertIn('rpi_commands_errors_total{stage="dispatch",type="turn_on",'
+                      'object="urn:ngsiv2:i40Asset:Workstation1"} 2', text)
+
+    def test_endpoint(self):
+        self.metrics.increment("errors_total", (("stage", "iot_agent"),))
+        port = self.metrics.start_server(0)
+        try:
+            response = requests.get(f"http://localhost:{port}/metrics", timeout=5)
+            self.assertEqual(200, response.status_code)
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+            self.assertIn('rpi_commands_errors_total{stage="iot_agent"} 1', response.text)
+            self.assertEqual(404, requests.get(f"http://localhost:{port}/", timeout=5).status_code)
+        finally:
+            self.metrics.stop_server()
+
+
+class TestMetricsWithStub(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOrion().start()
+        self.config = tempfile.TemporaryDirectory()
+        for obj in make_test_config.main(self.config.name, 1):
+            self.stub.put(obj)
+        self.metrics = Metrics()
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+            patch.object(CommandHandler, "RPI_COMMANDS_CONFIG", self.config.name),
+            patch.object(MetricsModule, "metrics", self.metrics),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.stub.stop()
+        self.config.cleanup()
+
+    def test_pipeline_stages(self):
+        commandHandler = CommandHandler()
+        workstation_id = make_test_config.workstation_id(0)
+        main.handle_incoming_data_if_exists(DirectDispatcher(commandHandler),
+                                            FakeSerial(b'{"Workstation0_on": null}\n'), SerialFramer())
+        commandHandler.handle_command("Workstation0_off")
+        stages = {dict(labels)["stage"] for labels in self.metrics.histograms}
+        self.assertTrue({"serial_read", "parse", "dispatch", "orion_update"} <= stages)
+        dispatch = (("stage", "dispatch"), ("type", "turn_on"), ("object", workstation_id))
+        self.assertEqual(1, sum(self.metrics.histograms[dispatch][:-1]))
+        self.assertIn(f'rpi_commands_stage_duration_seconds_count{{stage="dispatch",type="turn_off",'
+                      f'object="{workstation_id}"}} 1', self.metrics.render())
+
+    def test_failed_dispatch_is_counted(self):
+        commandHandler = CommandHandler()
+        workstation_id = make_test_config.workstation_id(0)
+        # from now on Orion refuses the connections
+        with patch.object(Orion, "ORION_PORT", refused_port()), self.assertRaises(Exception):
+            commandHandler.handle_command("Workstation0_on")
+        dispatch = (("stage", "dispatch"), ("type", "turn_on"), ("object", workstation_id))
+        self.assertEqual(1, self.metrics.counters[("errors_total", dispatch)])
+
+
+if __name__ == "__main__":
+    unittest.main()
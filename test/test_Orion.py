@@ -0,0 +1,97 @@
+import os
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+from modules.stub_Orion import StubOrion
+
+os.environ.setdefault("ORION_HOST", "localhost")
+sys.path.insert(0, os.path.join("..", "src"))
+import Orion
+
+STORAGE_ID = "urn:ngsiv2:i40Asset:TrayLoaderStorage1"
+MISSING_ID = "urn:ngsiv2:i40Asset:MissingStorage"
+
+
+class TestOrion(unittest.TestCase):
+    """Runs against a local StubOrion instead of the Orion broker"""
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubOrion().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def setUp(self):
+        self.stub.received.clear()
+        self.stub.put({"id": STORAGE_ID, "type": "i40Asset", "counter": {"type": "Number", "value": 2}})
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+        ]
+        for p in self.patches:
+            p.start()
+        Orion.known_entities.clear()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_update_attribute_sends_a_single_request(self):
+        Orion.update_attribute(STORAGE_ID, "counter", "Number", 1)
+        self.assertEqual(1, len(self.stub.received))
+        self.assertEqual(0, self.stub.count("GET"))
+        self.assertEqual(1, self.stub.entities[STORAGE_ID]["counter"]["value"])
+        self.assertTrue(Orion.is_known(STORAGE_ID))
+
+    def test_update_attribute_of_missing_object(self):
+        Orion.known_entities.add(MISSING_ID)
+        with self.assertRaises(RuntimeError):
+            Orion.update_attribute(MISSING_ID, "counter", "Number", 1)
+        self.assertFalse(Orion.is_known(MISSING_ID))
+        self.assertNotIn(MISSING_ID, self.stub.entities)
+
+    def test_confirm_known_entities(self):
+        missing = Orion.confirm_known_entities([STORAGE_ID, MISSING_ID])
+        self.assertEqual([MISSING_ID], missing)
+        self.assertTrue(Orion.is_known(STORAGE_ID))
+        self.assertFalse(Orion.is_known(MISSING_ID))
+        self.assertEqual(1, self.stub.count("POST", "/v2/op/query"))
+
+    def test_query(self):
+        ids = [f"urn:ngsiv2:i40Asset:Storage{i}" for i in range(5)]
+        for i, object_id in enumerate(ids):
+            self.stub.put({"id": object_id, "type": "i40Asset", "counter": {"type": "Number", "value": i},
+                           "capacity": {"type": "Number", "value": 10}})
+        with patch.object(Orion, "QUERY_CHUNK_SIZE", 2):
+            objects = Orion.query(ids + [MISSING_ID], attrs=["counter"], key_values=True)
+        self.assertEqual(set(ids), set(objects))
+        self.assertEqual({"id": ids[3], "type": "i40Asset", "counter": 3}, objects[ids[3]])
+        self.assertEqual(3, self.stub.count("POST", "/v2/op/query"))
+        self.assertTrue(all(Orion.is_known(object_id) for object_id in ids))
+
+    def test_get_projection(self):
+        self.stub.put({"id": STORAGE_ID, "type": "i40Asset", "counter": {"type": "Number", "value": 2, "metadata": {}},
+                       "capacity": {"type": "Number", "value": 10, "metadata": {}}})
+        self.assertEqual({"id": STORAGE_ID, "type": "i40Asset", "counter": 2},
+                         Orion.get(STORAGE_ID, attrs=["counter"], key_values=True))
+        self.assertEqual({"id": STORAGE_ID, "type": "i40Asset", "counter": {"type": "Number", "value": 2, "metadata": {}}},
+                         Orion.get(STORAGE_ID, attrs=["counter"]))
+        self.assertEqual(10, Orion.get(STORAGE_ID, key_values=True)["capacity"])
+
+    def test_get_request_decodes_once(self):
+        response = Mock(status_code=200)
+        response.json.return_value = {"id": STORAGE_ID}
+        with patch.object(Orion.client, "get", return_value=response):
+            self.assertEqual({"id": STORAGE_ID}, Orion.get(STORAGE_ID))
+        response.json.assert_called_once()
+
+    def test_wait_until_reachable(self):
+        self.assertTrue(Orion.wait_until_reachable(1))
+        with patch.object(Orion, "ORION_PORT", 1), patch.object(Orion, "PROBE_BACKOFF_BASE", 0.05):
+            self.assertFalse(Orion.wait_until_reachable(0.3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+from Storage import Storage
+from Workstation import Workstation
+from JobHandler import JobHandler
+from ErrorAggregator import ErrorAggregator
+import Orion
+import OrionObject
+import Outbox
+import WriteBatcher
+
+WORKSTATION_ID = make_test_config.workstation_id(0)
+STORAGE_ID = make_test_config.storage_id(0)
+HEARTBEAT_INTERVAL = 0.2  # s
+
+
+class TestWriteSuppression(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOrion().start()
+        for obj in make_test_config.make_objects(1, 1):
+            self.stub.put(obj)
+        # the global aggregator would log its summaries at exit, after the test streams are closed
+        self.errors = ErrorAggregator()
+        self.patches = [
+            patch.object(WriteBatcher, "errors", self.errors),
+            patch.object(OrionObject, "WRITE_HEARTBEAT_INTERVAL", HEARTBEAT_INTERVAL),
+            patch.object(OrionObject, "acknowledged", {}),
+            patch.object(OrionObject, "suppressed", OrionObject.Counter()),
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+        ]
+        for p in self.patches:
+            p.start()
+        self.workstation = Workstation(WORKSTATION_ID, JobHandler(WORKSTATION_ID, fetch=False))
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.errors.stop()
+        self.stub.stop()
+
+    def writes(self, object_id: str):
+        return self.stub.count("POST", f"/v2/entities/{object_id}/attrs")
+
+    def test_periodic_resends_are_suppressed(self):
+        for _ in range(5):
+            self.workstation.turn_on()
+        self.assertEqual(1, self.writes(WORKSTATION_ID))
+        # a change is always written
+        self.workstation.turn_off()
+        self.assertEqual(2, self.writes(WORKSTATION_ID))
+        self.assertFalse(self.stub.entities[WORKSTATION_ID]["available"]["value"])
+        # the heartbeat refreshes an unchanged value
+        time.sleep(HEARTBEAT_INTERVAL)
+        self.workstation.turn_off()
+        self.assertEqual(3, self.writes(WORKSTATION_ID))
+        self.assertEqual({"suppressed": 4, "suppressed_by_attribute": {"available": 4}}, OrionObject.stats())
+
+    def test_failed_write_is_not_acknowledged(self):
+        port = self.stub.port
+        with patch.object(Orion, "ORION_PORT", 1):
+            with self.assertRaises(Exception):
+                self.workstation.turn_on()
+        self.assertEqual(0, self.writes(WORKSTATION_ID))
+        with patch.object(Orion, "ORION_PORT", port):
+            self.workstation.turn_on()
+        self.assertEqual(1, self.writes(WORKSTATION_ID))
+
+    def test_storage_and_forgotten_objects(self):
+        storage = Storage(STORAGE_ID, capacity=10, step_size=1, type="filling")
+        storage.reset()
+        storage.reset()
+        self.assertEqual(1, self.writes(STORAGE_ID))
+        # for example, a special request changed the counter
+        OrionObject.forget_acknowledged(STORAGE_ID)
+        storage.reset()
+        self.assertEqual(2, self.writes(STORAGE_ID))
+
+    def test_queued_write_is_acknowledged_when_delivered(self):
+        sent = []
+        batcher = WriteBatcher.WriteBatcher(window_ms=10e3, send=sent.append,
+                                            delivered=OrionObject.confirm_delivery,
+                                            failed=OrionObject.forget_acknowledged)
+        with patch.object(WriteBatcher, "batcher", batcher), \
+                patch.object(Orion, "known_entities", {WORKSTATION_ID}):
+            self.workstation.turn_on()
+            # not delivered yet, so it is queued again
+            self.workstation.turn_on()
+            self.assertEqual(0, OrionObject.stats()["suppressed"])
+            batcher.flush()
+            self.workstation.turn_on()
+            self.assertEqual(1, OrionObject.stats()["suppressed"])
+            batcher.stop()
+        self.assertEqual(1, len(sent))
+
+    def test_failed_batch_is_not_acknowledged(self):
+        def send(batch):
+            raise RuntimeError("Orion is down")
+
+        batcher = WriteBatcher.WriteBatcher(window_ms=10e3, send=send,
+                                            delivered=OrionObject.confirm_delivery,
+                                            failed=OrionObject.forget_acknowledged)
+        with patch.object(WriteBatcher, "batcher", batcher), \
+                patch.object(Orion, "known_entities", {WORKSTATION_ID}):
+            self.workstation.turn_on()
+            batcher.flush()
+            self.assertNotIn(WORKSTATION_ID, OrionObject.acknowledged)
+            self.workstation.turn_on()
+            self.assertEqual(1, batcher.pending_count)
+            batcher.stop()
+        self.assertEqual(0, OrionObject.stats()["suppressed"])
+
+    def test_outbox_delivery_is_acknowledged(self):
+        sent = []
+        with tempfile.TemporaryDirectory() as directory:
+            outbox = Outbox.Outbox(os.path.join(directory, "outbox.sqlite"),
+                                   send_attributes=lambda object_id, attributes: sent.append(object_id),
+                                   send_request=None, delivered=OrionObject.confirm_delivery,
+                                   failed=OrionObject.forget_acknowledged)
+            try:
+                with patch.object(Outbox, "outbox", outbox):
+                    self.workstation.turn_on()
+                    deadline = time.monotonic() + 5
+                    while outbox.pending() and time.monotonic() < deadline:
+                        time.sleep(0.01)
+                    self.workstation.turn_on()
+            finally:
+                outbox.stop()
+        self.assertEqual([WORKSTATION_ID], sent)
+        self.assertEqual(1, OrionObject.stats()["suppressed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import requests
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+from Outbox import Outbox, MAX_ATTEMPTS
+from OrionClient import HTTPStatusError
+
+STORAGE_ID = "urn:ngsiv2:i40Asset:TrayLoaderStorage1"
+JOB_ID = "urn:ngsiv2:i40Process:Job202200045"
+REQUEST = {"url": "http://orion:1026/v2/entities/urn:ngsiv2:i40Asset:TrayLoaderStorage1/attrs/counter/value",
+           "method": "PUT", "headers": ["Content-Type: text/plain"], "data": 1}
+
+
+class FakeOrion():
+    """Records the writes, refuses connections while down, answers 503 while unavailable"""
+    def __init__(self):
+        self.down = False
+        # the number of requests answered with 503
+        self.unavailable = 0
+        self.unavailable_answers = 0
+        self.sent = []
+        self.done = threading.Event()
+        self.expected = 0
+
+    def check(self):
+        if self.down:
+            raise requests.exceptions.ConnectionError("refused")
+        if self.unavailable_answers < self.unavailable:
+            self.unavailable_answers += 1
+            raise HTTPStatusError("Failed to update attribute in Orion. Status_code: 503", 503)
+
+    def send_attributes(self, object_id, attributes):
+        self.check()
+        self.sent.append((object_id, attributes))
+        self.notify()
+
+    def send_request(self, req):
+        self.check()
+        self.sent.append(("request", req))
+        self.notify()
+
+    def notify(self):
+        if len(self.sent) >= self.expected:
+            self.done.set()
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "outbox.sqlite")
+        self.orion = FakeOrion()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def new_outbox(self):
+        return Outbox(self.path, send_attributes=self.orion.send_attributes,
+                      send_request=self.orion.send_request, backoff_base=0.01, backoff_max=0.05)
+
+    def test_retry_and_compact_during_outage(self):
+        self.orion.down = True
+        outbox = self.new_outbox()
+        for counter in (2, 1, 0):
+            outbox.put_attribute(STORAGE_ID, "counter", "Number", counter)
+        outbox.put_request(REQUEST)
+        outbox.put_attribute(JOB_ID, "goodPartCounter", "Number", 8)
+        time.sleep(0.1)
+        self.assertEqual([], self.orion.sent)
+        self.orion.expected = 3
+        self.orion.down = False
+        self.assertTrue(self.orion.done.wait(2))
+        outbox.stop()
+        self.assertEqual([
+            (STORAGE_ID, {"counter": {"type": "Number", "value": 0}}),
+            ("request", REQUEST),
+            (JOB_ID, {"goodPartCounter": {"type": "Number", "value": 8}}),
+        ], self.orion.sent)
+        self.assertEqual(2, outbox.compacted)
+
+    def test_survive_restart(self):
+        self.orion.down = True
+        outbox = self.new_outbox()
+        outbox.put_attribute(STORAGE_ID, "counter", "Number", 1)
+        outbox.stop()
+        self.orion.down = False
+        self.orion.expected = 1
+        outbox = self.new_outbox()
+        self.assertTrue(self.orion.done.wait(2))
+        outbox.stop()
+        self.assertEqual([(STORAGE_ID, {"counter": {"type": "Number", "value": 1}})], self.orion.sent)
+        self.assertEqual(0, outbox.pending())
+
+    def test_drop_after_max_attempts(self):
+        def missing_object(object_id, attributes):
+            raise RuntimeError(f"Object {object_id} does not exist")
+        self.orion.send_attributes = missing_object
+        self.orion.expected = 1
+        outbox = self.new_outbox()
+        outbox.put_attribute(STORAGE_ID, "counter", "Number", 1)
+        outbox.put_request(REQUEST)
+        self.assertTrue(self.orion.done.wait(2))
+        outbox.stop()
+        self.assertEqual(1, outbox.dropped)
+        self.assertEqual([("request", REQUEST)], self.orion.sent)
+
+    def test_server_errors_are_retried_indefinitely(self):
+        # for example Orion's database is down, or a proxy answers 503
+        self.orion.unavailable = 2 * MAX_ATTEMPTS
+        self.orion.expected = 1
+        outbox = self.new_outbox()
+        outbox.put_attribute(STORAGE_ID, "counter", "Number", 1)
+        self.assertTrue(self.orion.done.wait(5))
+        outbox.stop()
+        self.assertEqual(2 * MAX_ATTEMPTS, self.orion.unavailable_answers)
+        self.assertEqual(0, outbox.dropped)
+        self.assertEqual([(STORAGE_ID, {"counter": {"type": "Number", "value": 1}})], self.orion.sent)
+
+    def test_client_errors_are_dropped(self):
+        def invalid_value(object_id, attributes):
+            raise HTTPStatusError("Failed to update attribute in Orion. Status_code: 422", 422)
+        self.orion.send_attributes = invalid_value
+        self.orion.expected = 1
+        outbox = self.new_outbox()
+        outbox.put_attribute(STORAGE_ID, "counter", "Number", 1)
+        outbox.put_request(REQUEST)
+        self.assertTrue(self.orion.done.wait(2))
+        outbox.stop()
+        self.assertEqual(1, outbox.dropped)
+
+
+if __name__ == "__main__":
+    unittest.main()
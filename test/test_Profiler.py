@@ -0,0 +1,98 @@
+import os
+import pstats
+import signal
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+sys.path.insert(0, os.path.join("..", "src"))
+from CommandHandler import CommandHandler
+from Dispatcher import Dispatcher
+from Profiler import Profiler
+import Orion
+
+
+class TestProfilerWithStub(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubOrion().start()
+        self.config = tempfile.TemporaryDirectory()
+        self.directory = tempfile.TemporaryDirectory()
+        for obj in make_test_config.main(self.config.name, 2):
+            self.stub.put(obj)
+        self.patches = [
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(Orion, "ORION_PORT", self.stub.port),
+            patch.object(CommandHandler, "RPI_COMMANDS_CONFIG", self.config.name),
+        ]
+        for p in self.patches:
+            p.start()
+        self.commandHandler = CommandHandler()
+        self.profiler = Profiler(self.commandHandler, self.directory.name)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.stub.stop()
+        self.config.cleanup()
+        self.directory.cleanup()
+
+    def dispatch(self, n: int):
+        dispatcher = Dispatcher(self.commandHandler, workers=2)
+        for i in range(n):
+            dispatcher.submit(f"Workstation{i % 2}_{'on' if i % 4 < 2 else 'off'}")
+        dispatcher.stop()
+
+    def test_profile_dispatch_threads(self):
+        self.profiler.start(main_thread=False)
+        self.dispatch(20)
+        path = self.profiler.stop()
+        # the handle_command of the class is called again
+        self.assertNotIn("handle_command", vars(self.commandHandler))
+        functions = {function for _, _, function in pstats.Stats(path).stats}
+        self.assertIn("handle_command", functions)
+        self.assertIn("update_attribute", functions)
+        self.assertIsNone(self.profiler.stop())
+
+    def test_signals(self):
+        previous = signal.getsignal(signal.SIGUSR1), signal.getsignal(signal.SIGUSR2)
+        try:
+            self.profiler.install()
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertTrue(self.profiler.profiling)
+            self.dispatch(4)
+            os.kill(os.getpid(), signal.SIGUSR1)
+            deadline = time.monotonic() + 5
+            while not os.listdir(self.directory.name) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertFalse(self.profiler.profiling)
+            self.assertEqual(1, len([name for name in os.listdir(self.directory.name) if name.endswith(".pstats")]))
+        finally:
+            signal.signal(signal.SIGUSR1, previous[0])
+            signal.signal(signal.SIGUSR2, previous[1])
+
+    def test_tracemalloc_snapshots(self):
+        tracing = tracemalloc.is_tracing()
+        try:
+            self.profiler.take_snapshot()
+            leak = [bytearray(1000) for _ in range(1000)]
+            with self.assertLogs("Profiler", level="INFO") as logs:
+                path = self.profiler.take_snapshot()
+            self.assertEqual(1000, len(leak))
+            self.assertTrue(os.path.exists(path))
+            # the growth is reported at the allocating line
+            self.assertIn("test_Profiler.py", logs.records[0].getMessage())
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from modules import make_test_config
+from modules.stub_Orion import StubOrion
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+from CircuitBreaker import CircuitBreaker
+from OrionClient import client
+from Reconciler import Reconciler
+import JobHandler
+import Orion
+
+RESET_TIMEOUT = 0.3  # s
+
+
+class HangingServer():
+    """Accepts the connections, but never answers"""
+    def __init__(self):
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(16)
+        self.port = self.socket.getsockname()[1]
+        self.connections = []
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.socket.close()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_half_open_probing(self):
+        breaker = CircuitBreaker("Orion", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual("open", breaker.state)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        # a single probe is allowed
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual("open", breaker.state)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual("closed", breaker.state)
+        self.assertEqual(2, breaker.stats()["trips"])
+
+
+class TestReconciler(unittest.TestCase):
+    """The JobHandler's cycles must never wait for an unreachable Orion"""
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubOrion().start()
+        for obj in make_test_config.make_objects(1):
+            cls.stub.put(obj)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def setUp(self):
+        self.hanging = HangingServer()
+        self.reconciler = Reconciler(CircuitBreaker("Orion", failure_threshold=2, reset_timeout=RESET_TIMEOUT),
+                                     period=0.05)
+        self.patches = [
+            patch.object(JobHandler, "reconciler", self.reconciler),
+            patch.object(Orion, "ORION_HOST", self.stub.host),
+            patch.object(client, "timeout", 0.2),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        self.reconciler.stop(1)
+        for p in self.patches:
+            p.stop()
+        self.hanging.close()
+
+    def count_cycles_while_unreachable(self, port: int):
+        with patch.object(Orion, "ORION_PORT", port):
+            jobHandler = JobHandler.JobHandler(make_test_config.workstation_id(0), fetch=False)
+            start = time.perf_counter()
+            for _ in range(20):
+                jobHandler.handle_good_cycle()
+            elapsed = time.perf_counter() - start
+            # the reconciliation fails in the background until the breaker opens
+            deadline = time.monotonic() + 5
+            while self.reconciler.breaker.state != "open" and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual("open", self.reconciler.breaker.state)
+        self.assertLess(elapsed, 0.1)
+        self.assertEqual(20, jobHandler.good_cycle_counter)
+        self.assertFalse(jobHandler.are_counters_initiated_from_Orion)
+        return jobHandler
+
+    def assert_reconciled_after_probe(self, jobHandler):
+        job_id = make_test_config.job_id(0)
+        self.stub.entities[job_id]["goodPartCounter"]["value"] = 5 * make_test_config.PARTS_PER_CYCLE
+        with patch.object(Orion, "ORION_PORT", self.stub.port):
+            self.assertTrue(self.reconciler.drain(RESET_TIMEOUT + 2))
+        self.assertEqual("closed", self.reconciler.breaker.state)
+        self.assertEqual(25, jobHandler.good_cycle_counter)
+        self.assertEqual(25 * make_test_config.PARTS_PER_CYCLE, self.stub.entities[job_id]["goodPartCounter"]["value"])
+
+    def test_hanging_orion(self):
+        jobHandler = self.count_cycles_while_unreachable(self.hanging.port)
+        self.assert_reconciled_after_probe(jobHandler)
+
+    def test_refused_connections(self):
+        self.hanging.close()
+        jobHandler = self.count_cycles_while_unreachable(self.hanging.port)
+        self.assert_reconciled_after_probe(jobHandler)
+
+    def test_new_jobHandler_does_not_wait_for_orion(self):
+        with patch.object(Orion, "ORION_PORT", self.hanging.port):
+            start = time.perf_counter()
+            jobHandler = JobHandler.JobHandler(make_test_config.workstation_id(0))
+            jobHandler.handle_good_cycle()
+            self.assertLess(time.perf_counter() - start, 0.1)
+        with patch.object(Orion, "ORION_PORT", self.stub.port):
+            self.assertTrue(self.reconciler.drain(RESET_TIMEOUT + 2))
+        self.assertTrue(jobHandler.are_counters_initiated_from_Orion)
+
+    def test_failed_write_is_retried(self):
+        job_id = make_test_config.job_id(0)
+        self.stub.entities[job_id]["goodPartCounter"]["value"] = 0
+        update_attribute = Orion.update_attribute
+        failures = []
+
+        def fail_twice(*args, **kwargs):
+            if len(failures) < 2:
+                failures.append(args)
+                raise RuntimeError("Failed to update attribute in Orion. Status_code: 500")
+            return update_attribute(*args, **kwargs)
+
+        with patch.object(Orion, "ORION_PORT", self.stub.port), patch.object(Orion, "update_attribute", fail_twice):
+            jobHandler = JobHandler.JobHandler(make_test_config.workstation_id(0), fetch=False)
+            for _ in range(3):
+                jobHandler.handle_good_cycle()
+            self.assertTrue(self.reconciler.drain(RESET_TIMEOUT + 2))
+        self.assertEqual(2, len(failures))
+        self.assertFalse(jobHandler.has_unsent_cycles)
+        self.assertEqual(3 * make_test_config.PARTS_PER_CYCLE, self.stub.entities[job_id]["goodPartCounter"]["value"])
+
+    def test_cycles_are_counted_during_the_write(self):
+        job_id = make_test_config.job_id(0)
+        self.stub.entities[job_id]["goodPartCounter"]["value"] = 0
+        update_attribute = Orion.update_attribute
+        writing = threading.Event()
+        release = threading.Event()
+
+        def slow_update_attribute(*args, **kwargs):
+            writing.set()
+            release.wait(5)
+            return update_attribute(*args, **kwargs)
+
+        with patch.object(Orion, "ORION_PORT", self.stub.port), \
+                patch.object(Orion, "update_attribute", slow_update_attribute):
+            jobHandler = JobHandler.JobHandler(make_test_config.workstation_id(0), fetch=False)
+            jobHandler.handle_good_cycle()
+            self.assertTrue(writing.wait(5))
+            # the Reconciler is writing, the cycles do not wait for it
+            start = time.perf_counter()
+            for _ in range(10):
+                jobHandler.handle_good_cycle()
+            self.assertLess(time.perf_counter() - start, 0.1)
+            release.set()
+            self.assertTrue(self.reconciler.drain(RESET_TIMEOUT + 2))
+        self.assertEqual(11 * make_test_config.PARTS_PER_CYCLE, self.stub.entities[job_id]["goodPartCounter"]["value"])
+
+    def test_invalid_job_data_is_not_retried(self):
+        job_id = make_test_config.job_id(0)
+        # not divisible by partsPerCycle
+        self.stub.entities[job_id]["goodPartCounter"]["value"] = make_test_config.PARTS_PER_CYCLE + 1
+        gets = self.stub.count("GET", "/v2/entities")
+        with patch.object(Orion, "ORION_PORT", self.stub.port), \
+                self.assertLogs("Reconciler", level="ERROR") as logs:
+            jobHandler = JobHandler.JobHandler(make_test_config.workstation_id(0), fetch=False)
+            for _ in range(3):
+                jobHandler.handle_good_cycle()
+            self.assertTrue(self.reconciler.drain(2))
+            # many periods later, the cycles still do not schedule it again
+            time.sleep(10 * self.reconciler.period)
+            jobHandler.handle_good_cycle()
+            time.sleep(10 * self.reconciler.period)
+        self.assertEqual(1, len(logs.records))
+        # the Workstation, the Job and the Operation
+        self.assertEqual(gets + 3, self.stub.count("GET", "/v2/entities"))
+        self.assertFalse(jobHandler.are_counters_initiated_from_Orion)
+        # the Job is corrected, and the Workstation's Job change is notified
+        self.stub.entities[job_id]["goodPartCounter"]["value"] = make_test_config.PARTS_PER_CYCLE
+        with patch.object(Orion, "ORION_PORT", self.stub.port):
+            self.reconciler.recheck(jobHandler)
+            self.assertTrue(self.reconciler.drain(2))
+        self.assertEqual(5, jobHandler.good_cycle_counter)
+        self.assertEqual(5 * make_test_config.PARTS_PER_CYCLE, self.stub.entities[job_id]["goodPartCounter"]["value"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+from RequestBatcher import RequestBatcher
+
+SEND_TIME = 0.05  # s
+URLS = [f"http://orion:1026/v2/entities/urn:ngsiv2:i40Asset:Workstation{i}/attrs/refJob/value" for i in range(4)]
+
+
+class TestRequestBatcher(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def send(self, req):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(SEND_TIME)
+        with self.lock:
+            self.running -= 1
+            self.sent.append(req)
+        if req["data"] == "fail":
+            raise RuntimeError("Sending request to the IoT agent failed. Response:<Response [400]>")
+        return 204
+
+    def test_concurrent_and_ordered_per_url(self):
+        batcher = RequestBatcher(window_ms=20, max_size=100, workers=4, send=self.send)
+        futures = []
+        start = time.monotonic()
+        for i in range(3):
+            for url in URLS:
+                futures.append(batcher.add(url, {"url": url, "data": i}))
+        for future in futures:
+            self.assertEqual(204, future.result(5))
+        elapsed = time.monotonic() - start
+        batcher.stop()
+        # 12 requests, but only 3 after each other
+        self.assertLess(elapsed, 6 * SEND_TIME)
+        self.assertEqual(4, self.max_running)
+        for url in URLS:
+            self.assertEqual([0, 1, 2], [req["data"] for req in self.sent if req["url"] == url])
+        self.assertEqual(12, batcher.stats()["sent"])
+
+    def test_status_per_request(self):
+        batcher = RequestBatcher(window_ms=10e3, max_size=3, workers=4, send=self.send)
+        ok = batcher.add(URLS[0], {"url": URLS[0], "data": 1})
+        failing = batcher.add(URLS[0], {"url": URLS[0], "data": "fail"})
+        other = batcher.add(URLS[1], {"url": URLS[1], "data": 1})
+        self.assertEqual(204, ok.result(5))
+        with self.assertRaises(RuntimeError):
+            failing.result(5)
+        self.assertEqual(204, other.result(5))
+        batcher.stop()
+        stats = batcher.stats()
+        self.assertEqual(2, stats["sent"])
+        self.assertEqual(1, stats["failed"])
+        self.assertEqual(1, stats["batches"])
+
+    def test_stop_sends_pending_requests(self):
+        batcher = RequestBatcher(window_ms=10e3, max_size=100, send=self.send)
+        future = batcher.add(URLS[0], {"url": URLS[0], "data": 1})
+        batcher.stop()
+        self.assertTrue(future.done())
+        self.assertEqual(1, len(self.sent))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("ORION_HOST", "localhost")
+sys.path.insert(0, os.path.join("..", "src"))
+from RequestTemplate import RequestTemplate
+import RequestTemplate as RequestTemplateModule
+
+REQUEST = {
+    "url": "http://orion:1026/v2/entities/urn:ngsiv2:i40Asset:TrayLoaderStorage1/attrs/counter/value",
+    "method": "PUT",
+    "headers": ["Content-Type: text/plain"],
+    "data": "1",
+}
+
+
+def encode(req: dict):
+    return json.dumps(req, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class TestRequestTemplate(unittest.TestCase):
+    def assert_renders(self, template: RequestTemplate):
+        self.assertEqual(encode(REQUEST), template.render())
+        for arg in (3, 2.5, True, "urn:ngsiv2:i40Process:Job202200047", 'quote " and \\ and ő'):
+            self.assertEqual(encode({**REQUEST, "data": arg}), template.render(arg))
+
+    def test_render(self):
+        self.assert_renders(RequestTemplate(REQUEST))
+
+    def test_standard_library_fallback(self):
+        with patch.object(RequestTemplateModule, "orjson", None):
+            self.assert_renders(RequestTemplate(REQUEST))
+
+    def test_data_is_added(self):
+        req = {key: value for key, value in REQUEST.items() if key != "data"}
+        template = RequestTemplate(req)
+        self.assertEqual(encode(req), template.render())
+        self.assertEqual(encode({**req, "data": 7}), template.render(7))
+
+    def test_immutable(self):
+        req = dict(REQUEST)
+        template = RequestTemplate(req)
+        template.render(5)
+        self.assertEqual(REQUEST, req)
+        with self.assertRaises(AttributeError):
+            template.body = b"{}"
+
+
+if __name__ == "__main__":
+    unittest.main()
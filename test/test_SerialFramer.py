@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join("..", "src"))
+from SerialFramer import SerialFramer
+
+COMMAND_IDS = [
+    "InjectionMouldingMachine1_on",
+    "InjectionMouldingMachine1_off",
+    "InjectionMouldingMachine1_good_parts_completed",
+    "TrayLoaderStorage1_step",
+    "Test_TrayLoaderStorage1_set_to_x",
+]
+
+
+def random_set_of_commands(rng: random.Random):
+    set_of_commands = {}
+    for command_id in rng.sample(COMMAND_IDS, rng.randint(1, 3)):
+        set_of_commands[command_id] = rng.choice([
+            None,
+            rng.randint(-1000, 1000),
+            round(rng.uniform(0, 1), 3),
+            "job}{202200047",
+            "Munkadarab ütemezés",
+            {"nested": {"value": rng.randint(0, 9)}},
+        ])
+    return set_of_commands
+
+
+def random_chunks(data: bytes, rng: random.Random):
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, 64)
+        yield data[pos:pos + size]
+        pos += size
+
+
+class TestSerialFramer(unittest.TestCase):
+    def test_partial_frames_are_kept(self):
+        framer = SerialFramer()
+        self.assertEqual([], framer.feed(b'{"TrayLoaderStorage1_step": nu'))
+        self.assertEqual([{"TrayLoaderStorage1_step": None}, {"1": 2}], framer.feed(b'll}{"1": 2}\r\n{"3"'))
+        self.assertEqual([{"3": 4}], framer.feed(b': 4}\n'))
+        self.assertEqual("", framer.buffer.strip())
+
+    def test_corrupt_frames_are_skipped(self):
+        framer = SerialFramer()
+        objects = framer.feed(b'garbage{"1": tru\n{"2": {"3": \n{"4": null}\n')
+        self.assertEqual([{"4": None}], objects)
+        self.assertGreater(framer.discarded, 0)
+
+    def test_fuzz_random_chunk_splits(self):
+        rng = random.Random(20221018)
+        for _ in range(50):
+            sent = [random_set_of_commands(rng) for _ in range(rng.randint(1, 40))]
+            data = b"".join(json.dumps(obj, ensure_ascii=False).encode("utf-8") + rng.choice([b"", b"\n", b"\r\n"])
+                            for obj in sent)
+            framer = SerialFramer()
+            received = []
+            for chunk in random_chunks(data, rng):
+                received += framer.feed(chunk)
+            self.assertEqual(sent, received)
+            self.assertEqual(0, framer.discarded)
+
+    def test_throughput(self):
+        rng = random.Random(0)
+        sent = [random_set_of_commands(rng) for _ in range(20000)]
+        data = b"".join(json.dumps(obj).encode("utf-8") + b"\n" for obj in sent)
+        chunks = list(random_chunks(data, rng))
+        framer = SerialFramer()
+        start = time.perf_counter()
+        received = 0
+        for chunk in chunks:
+            received += len(framer.feed(chunk))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(sent), received)
+        print(f"\nSerialFramer: {received / elapsed:.0f} objects/s, {len(data) / elapsed / 1e6:.2f} MB/s")
+        # a 9600 baud serial line carries at most 960 bytes/s
+        self.assertGreater(len(data) / elapsed, 960 * 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("ORION_HOST", "localhost")
+sys.path.insert(0, os.path.join("..", "src"))
+import StateJournal
+from StateJournal import StateJournal as Journal
+
+
+class TestStateJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.journal")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay(self):
+        journal = Journal(self.path)
+        journal.record("Storage:1", 5)
+        journal.record("Storage:1", 4)
+        journal.record("JobHandler:1", {"job": "Job1", "parts_per_cycle": 8, "good": 2, "reject": 0})
+        self.assertEqual(3, journal.fsyncs)
+        journal.close()
+        journal = Journal(self.path)
+        self.assertEqual(4, journal.get("Storage:1"))
+        self.assertEqual(2, journal.get("JobHandler:1")["good"])
+        self.assertIsNone(journal.get("Storage:2"))
+        # opening compacts the journal into one line per key
+        self.assertEqual(2, journal.lines)
+        journal.close()
+
+    def test_torn_last_line_is_ignored(self):
+        journal = Journal(self.path)
+        journal.record("Storage:1", 3)
+        journal.close()
+        with open(self.path, "ab") as f:
+            f.write(b'{"k":"Storage:1","v":')
+        journal = Journal(self.path)
+        self.assertEqual(3, journal.get("Storage:1"))
+        journal.close()
+
+    def test_record_after_close(self):
+        journal = Journal(self.path)
+        journal.close()
+        with self.assertRaises(RuntimeError):
+            journal.record("Storage:1", 3)
+        self.assertIsNone(journal.get("Storage:1"))
+        # closing again is harmless
+        journal.close()
+
+    def test_compaction(self):
+        with patch.object(StateJournal, "COMPACT_THRESHOLD", 10):
+            journal = Journal(self.path, fsync_interval=60)
+            for i in range(100):
+                journal.record("Storage:1", i)
+            self.assertLessEqual(journal.lines, 11)
+            self.assertLess(journal.fsyncs, 100)
+            journal.close()
+        self.assertEqual(99, Journal(self.path).get("Storage:1"))
+
+    def test_idle_tail_is_fsynced(self):
+        journal = Journal(self.path, fsync_interval=0.1)
+        journal.record("Storage:1", 1)
+        fsyncs = journal.fsyncs
+        # a burst, then no record follows
+        for i in range(10):
+            journal.record("Storage:1", i)
+        self.assertTrue(journal.dirty)
+        deadline = time.monotonic() + 5
+        while journal.dirty and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(journal.dirty)
+        self.assertEqual(fsyncs + 1, journal.fsyncs)
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+os.environ.setdefault("ORION_HOST", "localhost")
+sys.path.insert(0, os.path.join("..", "src"))
+from WriteBatcher import WriteBatcher
+
+STORAGE_ID = "urn:ngsiv2:i40Asset:TrayLoaderStorage1"
+JOB_ID = "urn:ngsiv2:i40Process:Job202200045"
+
+
+class TestWriteBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.sent = threading.Event()
+
+    def send(self, batch):
+        self.batches.append(batch)
+        self.sent.set()
+
+    def test_coalesce_within_window(self):
+        batcher = WriteBatcher(window_ms=50, max_size=100, send=self.send)
+        for counter in (2, 1, 0):
+            batcher.add(STORAGE_ID, "counter", "Number", counter)
+        batcher.add(JOB_ID, "goodPartCounter", "Number", 8)
+        self.assertTrue(self.sent.wait(1))
+        batcher.stop()
+        self.assertEqual(1, len(self.batches))
+        objects = {obj["id"]: obj for obj in self.batches[0]}
+        self.assertEqual(0, objects[STORAGE_ID]["counter"]["value"])
+        self.assertEqual(8, objects[JOB_ID]["goodPartCounter"]["value"])
+        stats = batcher.stats()
+        self.assertEqual(4, stats["writes"])
+        self.assertEqual(2, stats["coalesced"])
+        self.assertEqual({2: 1}, stats["batch_sizes"])
+
+    def test_flush_at_max_size(self):
+        batcher = WriteBatcher(window_ms=10e3, max_size=2, send=self.send)
+        start = time.monotonic()
+        batcher.add(STORAGE_ID, "counter", "Number", 1)
+        batcher.add(JOB_ID, "goodPartCounter", "Number", 8)
+        self.assertTrue(self.sent.wait(1))
+        self.assertLess(time.monotonic() - start, 1)
+        batcher.stop()
+        self.assertEqual(1, len(self.batches))
+
+    def test_stop_sends_pending_writes(self):
+        batcher = WriteBatcher(window_ms=10e3, max_size=100, send=self.send)
+        batcher.add(STORAGE_ID, "counter", "Number", 1)
+        batcher.stop()
+        self.assertEqual([[{"id": STORAGE_ID, "counter": {"type": "Number", "value": 1}}]], self.batches)
+
+    def test_write_after_stop_is_sent_immediately(self):
+        batcher = WriteBatcher(window_ms=10e3, max_size=100, send=self.send)
+        batcher.stop()
+        batcher.add(STORAGE_ID, "counter", "Number", 2)
+        self.assertEqual([[{"id": STORAGE_ID, "counter": {"type": "Number", "value": 2}}]], self.batches)
+        self.assertEqual({}, batcher.pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
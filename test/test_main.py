@@ -0,0 +1,134 @@
+import os
+import pty
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import serial
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+import main
+from SerialHub import SerialHub
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+IDLE_MEASUREMENT_TIME = 1  # s
+
+
+class FakeDispatcher():
+    """Records the submit time of each event"""
+    def __init__(self):
+        self.submitted = []
+        self.event = threading.Event()
+
+    def submit(self, command_id, arg=None, event=None):
+        self.submitted.append((time.perf_counter(), command_id, arg))
+        self.event.set()
+
+    def stop(self):
+        pass
+
+
+def open_pty():
+    """Return the master file descriptor and the device path of a new pseudo-terminal"""
+    master, slave = pty.openpty()
+    path = os.ttyname(slave)
+    # keep the slave open until the service opens it, so the master can be written
+    return master, slave, path
+
+
+class TestMainLoop(unittest.TestCase):
+    """A pseudo-terminal stands in for the Arduino's serial device"""
+    def setUp(self):
+        self.master, self.slave, path = open_pty()
+        self.dispatcher = FakeDispatcher()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=main.loop, args=(self.dispatcher, [path], self.stop_event), daemon=True)
+        self.thread.start()
+        time.sleep(0.1)
+
+    def tearDown(self):
+        self.stop_event.set()
+        self.thread.join(2)
+        os.close(self.slave)
+        os.close(self.master)
+
+    def test_idle_cpu_time(self):
+        time.sleep(0.1)
+        cpu_start = time.process_time()
+        time.sleep(IDLE_MEASUREMENT_TIME)
+        cpu_time = time.process_time() - cpu_start
+        logger.info(f"main.loop idle CPU: {100 * cpu_time / IDLE_MEASUREMENT_TIME:.2f} %")
+        self.assertLess(cpu_time, 0.05 * IDLE_MEASUREMENT_TIME)
+
+    def test_event_latency(self):
+        latencies = []
+        for i in range(20):
+            self.dispatcher.event.clear()
+            sent = time.perf_counter()
+            os.write(self.master, b'{"TrayLoaderStorage1_step": null}\n')
+            self.assertTrue(self.dispatcher.event.wait(1))
+            latencies.append(self.dispatcher.submitted[-1][0] - sent)
+            time.sleep(0.05)
+        self.assertEqual(20, len(self.dispatcher.submitted))
+        latencies.sort()
+        logger.info(f"main.loop event latency: median: {1e3 * latencies[10]:.2f} ms, max: {1e3 * latencies[-1]:.2f} ms")
+        self.assertLess(latencies[10], 0.05)
+
+    def test_burst_is_not_discarded(self):
+        burst = b"".join(b'{"InjectionMouldingMachine1_good_parts_completed": null}\n' for _ in range(50))
+        os.write(self.master, burst)
+        deadline = time.monotonic() + 2
+        while len(self.dispatcher.submitted) < 50 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(50, len(self.dispatcher.submitted))
+
+
+class TestSerialHub(unittest.TestCase):
+    """Devices are plugged and unplugged by linking pseudo-terminals into a directory"""
+    def test_hot_plug(self):
+        directory = tempfile.TemporaryDirectory()
+        pattern = os.path.join(directory.name, "ttyUSB*")
+        dispatcher = FakeDispatcher()
+        hub = SerialHub([pattern],
+                        lambda dev: serial.Serial(dev, main.BAUD_RATE),
+                        lambda ser, framer: main.handle_incoming_data_if_exists(dispatcher, ser, framer),
+                        recheck_period=0.1)
+        stop_event = threading.Event()
+        thread = threading.Thread(target=hub.run, args=(stop_event,), daemon=True)
+        thread.start()
+        devices = []
+        for i in range(3):
+            master, slave, path = open_pty()
+            os.symlink(path, os.path.join(directory.name, f"ttyUSB{i}"))
+            devices.append((master, slave))
+        time.sleep(0.3)
+        self.assertEqual(3, len(hub.devices))
+        for i, (master, _) in enumerate(devices):
+            os.write(master, f'{{"Workstation{i}_on": null}}\n'.encode("utf-8"))
+        time.sleep(0.1)
+        self.assertEqual({"Workstation0_on", "Workstation1_on", "Workstation2_on"},
+                         {command_id for _, command_id, _ in dispatcher.submitted})
+        # unplug
+        master, slave = devices.pop()
+        os.unlink(os.path.join(directory.name, "ttyUSB2"))
+        os.close(slave)
+        os.close(master)
+        time.sleep(0.3)
+        self.assertEqual(2, len(hub.devices))
+        stop_event.set()
+        thread.join(2)
+        hub.close()
+        for master, slave in devices:
+            os.close(slave)
+            os.close(master)
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
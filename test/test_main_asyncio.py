@@ -0,0 +1,120 @@
+import asyncio
+import os
+import pty
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import serial
+
+os.environ.setdefault("ORION_HOST", "localhost")
+os.environ.setdefault("IOTAGENT_HTTP_PORT", "4315")
+sys.path.insert(0, os.path.join("..", "src"))
+import main
+import main_asyncio
+from ErrorAggregator import ErrorAggregator
+from Logger import getLogger
+
+logger = getLogger(__name__)
+
+HTTP_DELAY = 0.1  # s
+OBJECTS = ["Storage1", "Storage2", "Workstation1", "Workstation2"]
+EVENTS_PER_OBJECT = 3
+
+
+class SlowCommandHandler():
+    """Each command takes HTTP_DELAY, like a round trip to Orion"""
+    def __init__(self):
+        self.handled = []
+        self.lock = threading.Lock()
+
+    def ordering_key(self, command_id):
+        return command_id.split("_")[0]
+
+    def handle_command(self, command_id, arg=None, event=None):
+        time.sleep(HTTP_DELAY)
+        with self.lock:
+            self.handled.append((command_id, arg))
+
+
+class TestMainAsyncio(unittest.TestCase):
+    def setUp(self):
+        self.master, slave = pty.openpty()
+        self.ser = serial.Serial(os.ttyname(slave), main.BAUD_RATE, timeout=main.SERIAL_READ_TIMEOUT)
+        os.close(slave)
+        # the global aggregator would log its summaries at exit, after the test streams are closed
+        self.errors = ErrorAggregator()
+        self.patch = patch.object(main_asyncio, "errors", self.errors)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.errors.stop()
+        self.ser.close()
+
+    def test_ordered_per_object_parallel_across_objects(self):
+        commandHandler = SlowCommandHandler()
+        n_events = len(OBJECTS) * EVENTS_PER_OBJECT
+
+        async def run():
+            server = asyncio.create_task(main_asyncio.serve(commandHandler, self.ser))
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            for i in range(EVENTS_PER_OBJECT):
+                line = "".join(f'{{"{obj}_step": {i}}}' for obj in OBJECTS) + "\n"
+                os.write(self.master, line.encode("utf-8"))
+            while len(commandHandler.handled) < n_events and time.perf_counter() - start < 5:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            # a disconnected device stops the service
+            os.close(self.master)
+            with self.assertRaises(OSError):
+                await asyncio.wait_for(server, 2)
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        self.assertEqual(n_events, len(commandHandler.handled))
+        for obj in OBJECTS:
+            args = [arg for command_id, arg in commandHandler.handled if command_id.startswith(obj)]
+            self.assertEqual(list(range(EVENTS_PER_OBJECT)), args)
+        logger.info(f"{n_events} events with {HTTP_DELAY} s round trips: {elapsed:.2f} s "
+                    f"(sequential: {n_events * HTTP_DELAY:.2f} s)")
+        self.assertLess(elapsed, n_events * HTTP_DELAY / 2)
+
+    def test_serves_every_device(self):
+        commandHandler = SlowCommandHandler()
+        master2, slave2 = pty.openpty()
+        ser2 = serial.Serial(os.ttyname(slave2), main.BAUD_RATE, timeout=main.SERIAL_READ_TIMEOUT)
+        os.close(slave2)
+
+        async def run():
+            server = asyncio.create_task(main_asyncio.serve(commandHandler, self.ser, ser2))
+            await asyncio.sleep(0.05)
+            os.write(self.master, b'{"Storage1_step": 1}\n')
+            os.write(master2, b'{"Storage2_step": 2}\n')
+            start = time.perf_counter()
+            while len(commandHandler.handled) < 2 and time.perf_counter() - start < 5:
+                await asyncio.sleep(0.01)
+            # the other device is still served after one is disconnected
+            os.close(self.master)
+            await asyncio.sleep(0.05)
+            self.assertFalse(server.done())
+            os.write(master2, b'{"Storage2_step": 3}\n')
+            while len(commandHandler.handled) < 3 and time.perf_counter() - start < 5:
+                await asyncio.sleep(0.01)
+            os.close(master2)
+            with self.assertRaises(OSError):
+                await asyncio.wait_for(server, 2)
+
+        try:
+            asyncio.run(run())
+        finally:
+            ser2.close()
+        self.assertEqual([("Storage1_step", 1), ("Storage2_step", 2), ("Storage2_step", 3)],
+                         sorted(commandHandler.handled))
+
+
+if __name__ == "__main__":
+    unittest.main()